@@ -0,0 +1,400 @@
+import argparse
+import json
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from crawl import Crawl
+from extract import Extract, Record
+from metrics import Metrics
+from store import Store
+
+# 固定的解析基准时间，保证每次解析结果相同
+REFERENCE_TIME = datetime(2024, 5, 16, 12, 0, 0)
+
+PLATFORMS = ('微博', '知乎', '百度', '抖音', '哔哩哔哩', '今日头条', '澎湃新闻', '虎扑', '36氪', '少数派')
+LISTS = ('热搜榜', '热榜', '实时热点', '热门视频', '24小时', '要闻')
+TIMES = ('5分钟前', '1小时前', '30秒前', '2天前', '2024-05-16', '12分钟前')
+
+def tophub_page(page_num, boards=6, items=20):
+    """
+    Builds a page shaped like a tophub.today category page: a header, then one cc-cd block
+    per board with its platform, list name, update time and ranked items.
+
+    Args:
+        page_num (int): The page number, which makes every page different.
+        boards (int): Number of boards on the page.
+        items (int): Number of items per board.
+
+    Returns:
+        str: The page HTML.
+    """
+    blocks = []
+    for board in range(boards):
+        index = page_num * boards + board
+        rows = ''.join(
+            f'<a href="https://tophub.today/l/{index}-{rank}" target="_blank" rel="nofollow" itemid="{index * 100 + rank}">'
+            f'<div class="cc-cd-cb-ll"><span class="s h">{rank + 1}</span>'
+            f'<span class="t">第{index}榜第{rank + 1}条热点新闻标题</span>'
+            f'<span class="e">{(rank * 37 + index) % 900 + 1}.{rank % 10}万</span></div></a>\n'
+            for rank in range(items))
+        blocks.append(f'''
+<div class="cc-cd" id="node-{index}">
+  <div class="cc-cd-ih">
+    <div class="cc-cd-is"><a href="/n/{index}"><div class="cc-cd-lb"><img src="/img/{index}.png"> <span>{PLATFORMS[index % len(PLATFORMS)]}{index}</span></div></a></div>
+    <div class="cc-cd-sb"><div class="cc-cd-sb-ss cc-cd-sb-ss-ia"><span class="cc-cd-sb-st">{LISTS[index % len(LISTS)]}</span></div></div>
+  </div>
+  <div class="cc-cd-cb nano"><div class="cc-cd-cb-l nano-content">
+{rows}  </div></div>
+  <div class="cc-cd-if"><div class="i-h">{TIMES[index % len(TIMES)]}</div><div class="i-o" nodeid="{index}"><div class="m-n"></div></div></div>
+</div>''')
+
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>今日热榜</title></head><body>'
+            '<div class="Zd-p-Sc"><div class="bc">' + ''.join(blocks) + '</div></div></body></html>')
+
+class MockTophubHandler(BaseHTTPRequestHandler):
+    """
+    MockTophubHandler serves tophub-shaped pages, injecting the latency and the failures
+    configured on its server.
+    """
+
+    def do_GET(self):
+        page_num = int(parse_qs(urlsplit(self.path).query).get('p', ['0'])[0])
+        with self.server.lock:
+            self.server.requests += 1
+            failing = self.server.failures.get(page_num, 0) > 0
+            if failing:
+                self.server.failures[page_num] -= 1
+        time.sleep(self.server.latency)
+
+        body = b'' if failing else self.server.page(page_num).encode('utf-8')
+        self.send_response(503 if failing else 200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    # 默认的监听队列只有5，并发连接较多时会因丢弃SYN而等待重传
+    request_queue_size = 128
+
+class MockTophubServer(object):
+    """
+    MockTophubServer runs MockTophubHandler on a local port in a background thread.
+    """
+
+    def __init__(self, latency=0.0, failures=None, page=tophub_page):
+        """
+        Initializes the server.
+
+        Args:
+            latency (float): Seconds every response is delayed by.
+            failures (dict): Number of 503 answers to give before serving each page number.
+            page (callable): Builds the HTML of a page number.
+        """
+        self.httpd = _MockHTTPServer(('127.0.0.1', 0), MockTophubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.failures = dict(failures or {})
+        self.httpd.page = page
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/c/news'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class SqliteCursor(object):
+    """
+    SqliteCursor translates the MySQL statements issued by Store into SQLite ones.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.db.cursor()
+
+    def execute(self, query, args=()):
+        self.connection.statements += 1
+        if query.lstrip().startswith(('CREATE DATABASE', 'USE ')):
+            return
+        if query.lstrip().startswith('CREATE TABLE'):
+            # SQLite不支持表内的KEY定义，改为单独建索引
+            keys = re.findall(r'^\s*(UNIQUE )?KEY (\w+) (\(.*\)),?$', query, re.M)
+            query = re.sub(r',\s*(UNIQUE )?KEY .*?(?=,\s*(UNIQUE )?KEY|\s*\);)', '', query, flags=re.S)
+            table = re.search(r'EXISTS (\w+)', query).group(1)
+            # 与MySQL一样，表已存在时不做任何改动
+            if self.connection.db.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (table,)).fetchone():
+                return
+            self.cursor.execute(query)
+            for unique, name, columns in keys:
+                self.create_index(table, unique, name, columns)
+            return
+        if 'information_schema' in query:
+            # SQLite没有information_schema，改用PRAGMA读取表结构；索引名去掉表名前缀
+            if 'information_schema.COLUMNS' in query:
+                self.cursor.execute('SELECT name, type FROM pragma_table_info(?)', args)
+            else:
+                self.cursor.execute("SELECT substr(name, length(?) + 2) FROM pragma_index_list(?) WHERE origin = 'c'",
+                                    (args[0], args[0]))
+            return
+        if query.lstrip().startswith('ALTER TABLE'):
+            # SQLite的ALTER TABLE每次只能加一列，也不能加KEY
+            table, changes = re.match(r'\s*ALTER TABLE (\w+) (.*)', query, re.S).groups()
+            for change in re.split(r',\s*(?=ADD )', changes):
+                key = re.match(r'ADD (UNIQUE )?KEY (\w+) (\(.*\))', change)
+                if key:
+                    self.create_index(table, *key.groups(''))
+                else:
+                    self.cursor.execute(f'ALTER TABLE {table} {change}')
+            return
+        self.cursor.execute(self.translate(query), args)
+
+    def create_index(self, table, unique, name, columns):
+        # SQLite的索引名在整个库中唯一
+        self.cursor.execute(f'CREATE {unique}INDEX IF NOT EXISTS {table}_{name} ON {table} {columns}')
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def executemany(self, query, args):
+        self.connection.statements += 1
+        self.cursor.executemany(self.translate(query), args)
+
+    @staticmethod
+    def translate(query):
+        query = re.sub(r'ON DUPLICATE KEY UPDATE', 'ON CONFLICT(item_key) DO UPDATE SET', query)
+        query = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', query)
+        return query.replace('%s', '?')
+
+    def close(self):
+        self.cursor.close()
+
+class SqliteConnection(object):
+    """
+    SqliteConnection is a DB-API stand-in for pymysql backed by an in-memory SQLite database.
+    It counts the statements sent to it so tests can check the number of round-trips.
+    """
+
+    def __init__(self, **config):
+        self.db = sqlite3.connect(':memory:', check_same_thread=False)
+        self.statements = 0
+
+    def cursor(self):
+        return SqliteCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.close()
+
+def _best_time(function, repeat):
+    """
+    Runs a function several times and keeps the fastest run.
+
+    Args:
+        function (callable): The measured function.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: The duration of the fastest run, in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_crawl(pages=48, latency=0.02, repeat=1):
+    """
+    Measures the fetch modes of Crawl against the local stand-in server.
+
+    Args:
+        pages (int): Number of pages fetched per mode.
+        latency (float): Seconds the server waits before every response.
+        repeat (int): Number of runs per mode; the fastest one is kept.
+
+    Returns:
+        dict: Pages per second of each mode.
+    """
+    with MockTophubServer(latency=latency) as server:
+        crawler = Crawl(metrics=Metrics(enabled=False))
+        crawler.url_dict = {'bench': server.url}
+        crawler.page_dict = {'bench': pages}
+
+        modes = {
+            'sync': lambda: crawler.get_category_info('bench'),
+            'threaded': lambda: crawler.get_category_info_async('bench'),
+            'streaming': lambda: sum(1 for _ in crawler.iter_all_info()),
+            'aio': crawler.get_all_info_aio,
+        }
+        return {mode: pages / _best_time(function, repeat) for mode, function in modes.items()}
+
+def bench_extract(pages=20, repeat=3):
+    """
+    Measures Extract.extract_info on a fixed corpus of tophub-shaped pages, for every engine.
+
+    Args:
+        pages (int): Number of pages in the corpus.
+        repeat (int): Number of passes over the corpus; the fastest one is kept.
+
+    Returns:
+        dict: Items per second of each engine.
+    """
+    corpus = [tophub_page(page_num) for page_num in range(pages)]
+    results = {}
+    for engine in Extract.ENGINES:
+        extractor = Extract(engine=engine, metrics=Metrics(enabled=False))
+        items = sum(len(extractor.extract_info(text, now=REFERENCE_TIME)) for text in corpus)
+        seconds = _best_time(lambda: [extractor.extract_info(text, now=REFERENCE_TIME) for text in corpus], repeat)
+        results[engine] = items / seconds
+    return results
+
+def bench_records(rows):
+    """
+    Builds the records written by the Store benchmark.
+
+    Args:
+        rows (int): Number of records.
+
+    Returns:
+        list: Record items spread over 60 boards.
+    """
+    return [Record(f'热点新闻标题{i}', f'https://tophub.today/l/{i}', i * 37 % 100000,
+                   PLATFORMS[i % len(PLATFORMS)], LISTS[i % len(LISTS)],
+                   REFERENCE_TIME - timedelta(minutes=i % 60))
+            for i in range(rows)]
+
+def bench_store(rows=20000, excel_rows=5000):
+    """
+    Measures every Store mode. MySQL is stood in for by an in-memory SQLite database, so the
+    figures cover the Python side of the writes rather than the server.
+
+    Args:
+        rows (int): Number of rows written by the MySQL and Parquet modes.
+        excel_rows (int): Number of rows written by the (much slower) Excel mode.
+
+    Returns:
+        dict: Rows per second of each mode.
+    """
+    records = bench_records(rows)
+    metrics = Metrics(enabled=False)
+    results = {}
+
+    def connect(**config):
+        return SqliteConnection(**config)
+
+    def timed(function, count):
+        start = time.perf_counter()
+        function()
+        return count / (time.perf_counter() - start)
+
+    results['mysql_insert'] = timed(lambda: Store(records, connect=connect, metrics=metrics)
+                                    .mode_mysql('HotSearch', 'bench_insert'), rows)
+    results['mysql_upsert'] = timed(lambda: Store(records, connect=connect, metrics=metrics)
+                                    .mode_mysql('HotSearch', 'bench_upsert', upsert=True), rows)
+    # 第二次写入相同数据时只做快照比对
+    results['mysql_upsert_unchanged'] = timed(lambda: Store(records, connect=connect, metrics=metrics)
+                                              .mode_mysql('HotSearch', 'bench_upsert', upsert=True), rows)
+    Store.close_connections()
+
+    with tempfile.TemporaryDirectory() as root:
+        results['parquet'] = timed(lambda: Store(records, metrics=metrics).mode_parquet(root), rows)
+        results['excel'] = timed(lambda: Store(records[:excel_rows], metrics=metrics)
+                                 .mode_excel(os.path.join(root, 'bench.xlsx')), excel_rows)
+    return results
+
+def bench_startup(repeat=5):
+    """
+    Measures the cold start of fresh interpreters: importing the CLI and the core modules,
+    which load their heavy dependencies lazily, against importing those dependencies eagerly.
+
+    Args:
+        repeat (int): Number of runs per command; the fastest one is kept.
+
+    Returns:
+        dict: Seconds of each command, lower is better.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        'cli_help': ['cli.py', '--help'],
+        'import_store': ['-c', 'import store'],
+        'import_crawl_extract_store': ['-c', 'import crawl, extract, store'],
+        # 依赖在模块顶部导入时的开销
+        'import_eager': ['-c', 'import pandas, pymysql, bs4, crawl, extract, store'],
+    }
+    return {name: _best_time(lambda: subprocess.run([sys.executable] + arguments, cwd=root, check=True,
+                                                    stdout=subprocess.DEVNULL), repeat)
+            for name, arguments in commands.items()}
+
+def run_benchmarks(label=None, path='bench_results.json', quick=False):
+    """
+    Runs every benchmark and adds the results to a JSON file under a label, e.g. a version,
+    so the figures of successive versions can be compared.
+
+    Args:
+        label (str): Name of this run. Defaults to the current time.
+        path (str): The JSON file keeping the results of every labelled run.
+        quick (bool): Use small sizes, e.g. to check that the benchmarks work.
+
+    Returns:
+        dict: The results of this run.
+    """
+    sizes = ({'crawl': {'pages': 8, 'latency': 0.005}, 'extract': {'pages': 2, 'repeat': 1},
+              'store': {'rows': 500, 'excel_rows': 100}, 'startup': {'repeat': 1}} if quick else
+             {'crawl': {}, 'extract': {}, 'store': {}, 'startup': {}})
+    results = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'crawl_pages_per_sec': bench_crawl(**sizes['crawl']),
+        'extract_items_per_sec': bench_extract(**sizes['extract']),
+        'store_rows_per_sec': bench_store(**sizes['store']),
+        'startup_seconds': bench_startup(**sizes['startup']),
+    }
+
+    history = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            history = json.load(f)
+    previous = next(reversed(history.values()), None) if history else None
+
+    history[label or results['time']] = results
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+    # 与上一次记录的结果对比
+    for group in ('crawl_pages_per_sec', 'extract_items_per_sec', 'store_rows_per_sec', 'startup_seconds'):
+        for name, value in results[group].items():
+            line = f"{group:<22} {name:<26} {value:>12.{3 if group == 'startup_seconds' else 1}f}"
+            if previous and name in previous.get(group, {}):
+                line += f"  ({value / previous[group][name] - 1:+.1%})"
+            print(line)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the crawl, extract and store stages.')
+    parser.add_argument('--label', help='name of this run, e.g. a version or commit')
+    parser.add_argument('--output', default='bench_results.json', help='JSON file keeping the results')
+    parser.add_argument('--quick', action='store_true', help='use small sizes')
+    args = parser.parse_args()
+    run_benchmarks(args.label, args.output, args.quick)
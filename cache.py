@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache(object):
+    """
+    ResponseCache keeps the HTTP validators (ETag / Last-Modified) and a body hash of every
+    fetched page in a local JSON file, so the next crawl can send conditional requests and
+    recognise pages whose content did not change.
+
+    The cache holds at most max_entries pages; the least recently used page is evicted first.
+
+    Methods:
+        validators(category, page): Returns the conditional request headers of a page.
+        not_modified(category, page): Records a 304 answer for a page.
+        update(category, page, headers, body): Records a fetched page and tells whether it changed.
+        save(): Writes the cache to disk.
+    """
+
+    def __init__(self, path='response_cache.json', max_entries=1024):
+        """
+        Initializes the cache and loads the entries saved by a previous run.
+
+        Args:
+            path (str): The path of the cache file.
+            max_entries (int): Maximum number of pages kept in the cache.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning("读取缓存文件时出现错误：%s", e)
+
+    @staticmethod
+    def __key(category, page):
+        return f"{category}:{page}"
+
+    def validators(self, category, page):
+        """
+        Returns the conditional request headers of a page.
+
+        Args:
+            category (str): The category of the page.
+            page (int): The page number.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers, empty if the page is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(self.__key(category, page))
+        if not entry:
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def not_modified(self, category, page):
+        """
+        Records a 304 Not Modified answer for a page.
+
+        Args:
+            category (str): The category of the page.
+            page (int): The page number.
+        """
+        with self.lock:
+            key = self.__key(category, page)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+
+    def update(self, category, page, headers, body):
+        """
+        Records a fetched page.
+
+        Args:
+            category (str): The category of the page.
+            page (int): The page number.
+            headers (Mapping): The response headers.
+            body (str): The response body.
+
+        Returns:
+            bool: True if the body is identical to the cached one.
+        """
+        body_hash = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        key = self.__key(category, page)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            self.entries[key] = {
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'hash': body_hash,
+            }
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return previous is not None and previous['hash'] == body_hash
+
+    def save(self):
+        """
+        Writes the cache to disk, replacing the previous file atomically.
+        """
+        with self.lock:
+            entries = dict(self.entries)
+        try:
+            temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error("保存缓存文件时出现错误：%s", e)
@@ -1,21 +1,193 @@
+import os
 import pandas as pd
 
-# 读取Excel文件
-data = pd.read_excel('热搜数据.xlsx')
+STATS_COLUMNS = ['platform', 'slist', 'count', 'first_seen', 'last_seen']
 
-# 生成唯一的平台+榜单组合
-unique_combinations = set()
-for index, row in data.iterrows():
-    platform = row['platform']
-    list_name = row['slist'] if pd.notna(row['slist']) else ''
-    unique_combinations.add((platform, list_name))
+def iter_excel_chunks(excel_name):
+    """
+    Reads the boards of an Excel file written by Store.mode_excel.
+    Excel files cannot be read in pieces, so this yields a single chunk.
 
-# 将组合排序
-sorted_combinations = sorted(unique_combinations)
+    Args:
+        excel_name (str): The name of the Excel file.
 
-# 将组合存储到txt文件中
-with open('Directory.txt', 'w', encoding='utf-8') as f:
-    for platform, list_name in sorted_combinations:
-        f.write(f"{platform},{list_name}\n")
+    Yields:
+        DataFrame: The platform, slist and rectime columns.
+    """
+    yield pd.read_excel(excel_name, usecols=['platform', 'slist', 'rectime'])
 
-print("目录已保存到Directory.txt文件中")
+def iter_archive_chunks(root_dir, date=None):
+    """
+    Streams the boards of the Parquet archive written by Store.mode_parquet, one record
+    batch at a time, reading only the columns the catalog needs.
+
+    Args:
+        root_dir (str): The root directory of the archive.
+        date (str): Crawl date in YYYY-MM-DD format, or None for every day.
+
+    Yields:
+        DataFrame: The platform, slist and crawltime columns of one batch.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+    dataset = ds.dataset(root_dir, format='parquet', partitioning=partitioning)
+    condition = ds.field('date') == date if date is not None else None
+    for batch in dataset.to_batches(columns=['platform', 'slist', 'crawltime'], filter=condition):
+        yield batch.to_pandas()
+
+def iter_mysql_chunks(db_name, tb_name, chunksize=100000, connect=None):
+    """
+    Streams the boards of a MySQL table written by Store.mode_mysql.
+
+    Args:
+        db_name (str): The name of the database.
+        tb_name (str): The name of the table.
+        chunksize (int): Number of rows per chunk.
+        connect (callable): DB-API connect function. Defaults to pymysql.connect.
+
+    Yields:
+        DataFrame: The platform, slist and rectime columns of one chunk.
+    """
+    from store import Store
+
+    if connect is None:
+        import pymysql
+        connect = pymysql.connect
+
+    db = connect(database=db_name, **Store.mysql_config)
+    try:
+        yield from pd.read_sql(f"SELECT platform, slist, rectime FROM {tb_name}", db, chunksize=chunksize)
+    finally:
+        db.close()
+
+def iter_record_chunks(data_list):
+    """
+    Wraps the records of a single run, e.g. the list passed to Store, as one chunk.
+
+    Args:
+        data_list (list): The extracted records.
+
+    Yields:
+        DataFrame: The records.
+    """
+    if data_list:
+        yield pd.DataFrame(data_list)
+
+def board_stats(chunk):
+    """
+    Aggregates one chunk into per-board statistics with a vectorized groupby.
+
+    Args:
+        chunk (DataFrame): Rows with platform and slist, and crawltime or rectime columns.
+
+    Returns:
+        DataFrame: One row per (platform, slist) with count, first_seen and last_seen.
+    """
+    time_column = 'crawltime' if 'crawltime' in chunk else 'rectime'
+    boards = pd.DataFrame({
+        'platform': chunk['platform'].astype(str),
+        'slist': chunk['slist'].fillna('').astype(str),
+        'seen': pd.to_datetime(chunk[time_column], errors='coerce') if time_column in chunk else pd.NaT,
+    })
+    return (boards.groupby(['platform', 'slist'], sort=False)
+            .agg(count=('seen', 'size'), first_seen=('seen', 'min'), last_seen=('seen', 'max'))
+            .reset_index())
+
+def merge_stats(left, right):
+    """
+    Merges two per-board statistics tables.
+
+    Args:
+        left (DataFrame): Per-board statistics.
+        right (DataFrame): Per-board statistics.
+
+    Returns:
+        DataFrame: The combined statistics, one row per (platform, slist).
+    """
+    merged = pd.concat([left, right], ignore_index=True)
+    return (merged.groupby(['platform', 'slist'], sort=False)
+            .agg(count=('count', 'sum'), first_seen=('first_seen', 'min'), last_seen=('last_seen', 'max'))
+            .reset_index())
+
+def read_directory(directory):
+    """
+    Reads the boards listed in a Directory file.
+
+    Args:
+        directory (str): The path of the Directory file ("platform,slist" per line).
+
+    Returns:
+        DataFrame: One row per board with empty statistics.
+    """
+    boards = []
+    if os.path.exists(directory):
+        with open(directory, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line:
+                    platform, _, list_name = line.partition(',')
+                    boards.append((platform, list_name))
+
+    stats = pd.DataFrame(boards, columns=['platform', 'slist'])
+    stats['count'] = 0
+    stats['first_seen'] = pd.NaT
+    stats['last_seen'] = pd.NaT
+    return stats
+
+def read_stats(stats_file):
+    """
+    Reads the per-board statistics written by update_catalog.
+
+    Args:
+        stats_file (str): The path of the statistics CSV file.
+
+    Returns:
+        DataFrame: Per-board statistics, empty if the file does not exist.
+    """
+    if not os.path.exists(stats_file):
+        return pd.DataFrame({column: [] for column in STATS_COLUMNS})
+    stats = pd.read_csv(stats_file, encoding='utf-8', keep_default_na=False, dtype={'platform': str, 'slist': str})
+    for column in ('first_seen', 'last_seen'):
+        stats[column] = pd.to_datetime(stats[column], errors='coerce')
+    return stats
+
+def update_catalog(chunks, directory='Directory.txt', stats_file='Directory_stats.csv', rebuild=False):
+    """
+    Merges the boards found in a stream of chunks into the Directory file and the per-board
+    statistics file. Boards already listed in the Directory file are always kept.
+
+    Args:
+        chunks (iterable): DataFrames from one of the iter_*_chunks functions.
+        directory (str): The path of the Directory file.
+        stats_file (str): The path of the statistics CSV file.
+        rebuild (bool): Recount the statistics from the chunks instead of adding to the existing ones.
+
+    Returns:
+        DataFrame: The updated per-board statistics, sorted by platform and slist.
+    """
+    stats = read_directory(directory)
+    if not rebuild:
+        stats = merge_stats(stats, read_stats(stats_file))
+
+    for chunk in chunks:
+        stats = merge_stats(stats, board_stats(chunk))
+
+    # 将组合排序
+    stats = stats.sort_values(['platform', 'slist'], ignore_index=True)
+    stats['count'] = stats['count'].astype(int)
+
+    # 将组合存储到txt文件中
+    with open(directory, 'w', encoding='utf-8') as f:
+        f.writelines(f"{platform},{list_name}\n" for platform, list_name in zip(stats['platform'], stats['slist']))
+    stats[STATS_COLUMNS].to_csv(stats_file, index=False, encoding='utf-8', date_format='%Y-%m-%d %H:%M:%S')
+    return stats
+
+if __name__ == '__main__':
+    # 根据归档数据（或旧的Excel文件）重新统计目录
+    if os.path.isdir('热搜数据'):
+        update_catalog(iter_archive_chunks('热搜数据'), rebuild=True)
+    else:
+        update_catalog(iter_excel_chunks('热搜数据.xlsx'), rebuild=True)
+    print("目录已保存到Directory.txt文件中")
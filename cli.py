@@ -0,0 +1,255 @@
+import argparse
+import json
+import logging
+import sys
+from datetime import datetime
+
+logger = logging.getLogger('cli')
+
+# 各子命令只导入自己用到的模块，pandas、pymysql、bs4等较重的依赖只在选中对应的存储方式或解析引擎时加载
+
+SINKS = ('parquet', 'index', 'mysql', 'excel')
+
+def dump_records(records, f, crawltime=None):
+    """
+    Writes records as JSON lines, the format passed from the extract to the store command.
+
+    Args:
+        records (iterable): Record items.
+        f (file): The text file to write to.
+        crawltime (datetime): When the page of the records was fetched, written on every line.
+
+    Returns:
+        int: Number of written records.
+    """
+    count = 0
+    for record in records:
+        row = record.as_dict()
+        if isinstance(row['rectime'], datetime):
+            row['rectime'] = row['rectime'].isoformat()
+        row['crawltime'] = crawltime.isoformat() if crawltime else None
+        f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+def load_records(f):
+    """
+    Reads records written by dump_records(), grouped by their crawl time.
+
+    Args:
+        f (file): The text file to read from.
+
+    Returns:
+        list: (crawltime, records) pairs in the order the crawl times first appear; crawltime
+              is None for lines written without one.
+    """
+    from extract import Record
+
+    groups = {}
+    for line in f:
+        if line.strip():
+            row = json.loads(line)
+            crawltime = row.pop('crawltime', None)
+            crawltime = datetime.fromisoformat(crawltime) if crawltime else None
+            row['rectime'] = datetime.fromisoformat(row['rectime']) if row['rectime'] else None
+            groups.setdefault(crawltime, []).append(Record(**row))
+    return list(groups.items())
+
+def open_output(path):
+    """
+    Opens the output file of a subcommand; '-' is stdout.
+    """
+    return sys.stdout if path == '-' else open(path, 'w', encoding='utf-8')
+
+def open_input(path):
+    """
+    Opens the input file of a subcommand; '-' is stdin.
+    """
+    return sys.stdin if path == '-' else open(path, encoding='utf-8')
+
+def run_crawl(args):
+    """
+    Fetches the pages of some categories and keeps their raw HTML in the snapshot store.
+    """
+    from crawl import Crawl
+    from ratelimit import AimdLimiter, RetryPolicy, TokenBucket
+    from snapshot import SnapshotStore
+
+    crawl = Crawl(page_count_path=args.page_counts, rate_limiter=TokenBucket(rate=10, burst=20),
+                  limiter=AimdLimiter(initial=4, maximum=8), retry=RetryPolicy(),
+                  snapshots=SnapshotStore(args.snapshots))
+    categories = args.categories or list(crawl.url_dict)
+    unknown = [category for category in categories if category not in crawl.url_dict]
+    if unknown:
+        logger.error("未知的类别：%s", ', '.join(unknown))
+        return 2
+    if args.discover:
+        crawl.discover_pages(categories=categories)
+
+    fetched = failed = 0
+    for result in crawl.iter_all_info(categories=categories):
+        fetched += 1
+        failed += result.error is not None
+    logger.info('共爬取%d页，失败%d页，页面保存在%s', fetched, failed, args.snapshots)
+    return 1 if failed else 0
+
+def run_extract(args):
+    """
+    Extracts the records of the pages kept in the snapshot store, as JSON lines.
+    """
+    from extract import Extract
+    from snapshot import SnapshotStore
+
+    subscription = None
+    if args.subscription:
+        from subscribe import Subscription
+        subscription = Subscription.from_file(args.subscription)
+
+    extract = Extract(engine=args.engine, subscription=subscription)
+    pages = SnapshotStore(args.snapshots).iter_pages(args.start, args.end)
+    f = open_output(args.output)
+    try:
+        # 每页单独解析，记录与所在页面的抓取时间一起写出
+        count = sum(dump_records(records, f, crawltime=page.fetched_at)
+                    for page in pages for records in extract.iter_info([page]))
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    logger.info('共解析%d条数据', count)
+    return 0
+
+def run_store(args):
+    """
+    Writes records produced by the extract command to the chosen sinks.
+    """
+    from store import Store
+
+    f = open_input(args.input)
+    try:
+        groups = load_records(f)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    results = []
+    # 同一抓取时间的记录一起写入，归档分区及crawltime列沿用原抓取时间
+    for crawltime, records in groups:
+        store = Store(records, crawltime=crawltime)
+        writes = {
+            'parquet': lambda: store.mode_parquet(args.archive),
+            'index': lambda: store.mode_index(args.index),
+            'mysql': lambda: store.mode_mysql(args.db, args.table, upsert=args.upsert),
+            'excel': lambda: store.mode_excel(args.excel),
+        }
+        results.extend(writes[sink]() for sink in dict.fromkeys(args.sink))
+    Store.close_connections()
+    return 0 if all(results) else 1
+
+def run_catalog(args):
+    """
+    Merges the boards found in an Excel file, the Parquet archive or the MySQL table into
+    the Directory file.
+    """
+    import catalog
+
+    if args.excel:
+        chunks = catalog.iter_excel_chunks(args.excel)
+    elif args.archive:
+        chunks = catalog.iter_archive_chunks(args.archive, date=args.date)
+    else:
+        chunks = catalog.iter_mysql_chunks(args.db, args.table)
+    stats = catalog.update_catalog(chunks, directory=args.directory, stats_file=args.stats, rebuild=args.rebuild)
+    logger.info('目录中共有%d个榜单', len(stats))
+    return 0
+
+def run_daemon(args):
+    """
+    Runs every category on its own interval until SIGINT or SIGTERM.
+    """
+    from daemon import Daemon
+    from main import Pipeline
+
+    unknown = [category for category in args.categories if category not in Daemon.DEFAULT_INTERVALS]
+    if unknown:
+        logger.error("未知的类别：%s", ', '.join(unknown))
+        return 2
+    intervals = None
+    if args.categories:
+        intervals = {category: Daemon.DEFAULT_INTERVALS[category] for category in args.categories}
+    pipeline = Pipeline()
+    Daemon(pipeline.job, intervals=intervals, overlap=args.overlap, on_shutdown=pipeline.shutdown).run()
+    return 0
+
+def build_parser():
+    """
+    Builds the argument parser of every subcommand.
+
+    Returns:
+        ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(prog='cli.py', description='Crawls, extracts and stores the tophub hot lists.')
+    parser.add_argument('--log-level', default='INFO', help='logging level, e.g. DEBUG or WARNING')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl = commands.add_parser('crawl', help='fetch pages into the snapshot store')
+    crawl.add_argument('categories', nargs='*', help='categories to fetch, e.g. communal_info; all by default')
+    crawl.add_argument('--snapshots', default='snapshots', help='root directory of the snapshot store')
+    crawl.add_argument('--page-counts', default='page_counts.json', help='file keeping the discovered page counts')
+    crawl.add_argument('--discover', action='store_true', help='probe the page counts before fetching')
+    crawl.set_defaults(run=run_crawl)
+
+    extract = commands.add_parser('extract', help='extract records from the snapshot store as JSON lines')
+    extract.add_argument('--snapshots', default='snapshots', help='root directory of the snapshot store')
+    extract.add_argument('--start', type=datetime.fromisoformat, help='earliest run, e.g. 2024-05-16T08:00')
+    extract.add_argument('--end', type=datetime.fromisoformat, help='latest run')
+    extract.add_argument('--engine', choices=('bs4', 'lxml'), default='lxml', help='HTML parser')
+    extract.add_argument('--subscription', help='Directory-format file of the boards to keep')
+    extract.add_argument('--output', default='-', help='JSON lines file, - for stdout')
+    extract.set_defaults(run=run_extract)
+
+    store = commands.add_parser('store', help='write extracted records to one or more sinks')
+    store.add_argument('input', nargs='?', default='-', help='JSON lines file from extract, - for stdin')
+    store.add_argument('--sink', action='append', choices=SINKS, required=True, help='sink to write to; repeatable')
+    store.add_argument('--archive', default='热搜数据', help='root directory of the Parquet archive')
+    store.add_argument('--index', default='search_index', help='directory of the search index')
+    store.add_argument('--db', default='HotSearch', help='MySQL database')
+    store.add_argument('--table', default='hot_search', help='MySQL table')
+    store.add_argument('--upsert', action='store_true', help='only write new or changed items to MySQL')
+    store.add_argument('--excel', default='热搜数据.xlsx', help='Excel file')
+    store.set_defaults(run=run_store)
+
+    catalog = commands.add_parser('catalog', help='merge the stored boards into the Directory file')
+    source = catalog.add_mutually_exclusive_group()
+    source.add_argument('--excel', help='read the boards from an Excel file')
+    source.add_argument('--archive', help='read the boards from the Parquet archive')
+    catalog.add_argument('--date', help='only read this day of the archive, YYYY-MM-DD')
+    catalog.add_argument('--db', default='HotSearch', help='MySQL database, when reading from MySQL')
+    catalog.add_argument('--table', default='hot_search', help='MySQL table, when reading from MySQL')
+    catalog.add_argument('--directory', default='Directory.txt', help='the Directory file')
+    catalog.add_argument('--stats', default='Directory_stats.csv', help='the per-board statistics file')
+    catalog.add_argument('--rebuild', action='store_true', help='recount the statistics from scratch')
+    catalog.set_defaults(run=run_catalog)
+
+    daemon = commands.add_parser('daemon', help='run the categories on their schedule until stopped')
+    daemon.add_argument('categories', nargs='*', help='categories to run; all by default')
+    daemon.add_argument('--overlap', choices=('skip', 'coalesce'), default='coalesce',
+                        help='what to do with a run that is due while the previous one is going')
+    daemon.set_defaults(run=run_daemon)
+    return parser
+
+def main(argv=None):
+    """
+    Runs a subcommand.
+
+    Args:
+        argv (list): The arguments, without the program name. Defaults to sys.argv[1:].
+
+    Returns:
+        int: The exit status.
+    """
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    return args.run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 标题归一化时去掉的空白及标点
+_NOISE_PATTERN = re.compile(r'[\W_]+')
+
+def shingles(title, size=2):
+    """
+    Splits a normalized title into overlapping character shingles. Character shingles
+    work for Chinese titles, which have no word boundaries.
+
+    Args:
+        title (str): The title.
+        size (int): Number of characters per shingle.
+
+    Returns:
+        set: The shingles; a title shorter than size is its own single shingle.
+    """
+    text = _NOISE_PATTERN.sub('', title).lower()
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+class StoryIndex(object):
+    """
+    StoryIndex groups records whose titles describe the same story, across platforms and
+    boards, and gives each record a story id.
+
+    Every title gets a MinHash signature over its character shingles. The signature of the
+    first title of each story is split into bands and indexed by an LSH table, so a new
+    title is only compared with the few stories sharing one of its bands, never with every
+    story. A title seen before gets its story id from an exact-title lookup without hashing.
+    The index is kept across runs and saved as <path>.npz (signatures) plus <path>.json.
+
+    Story ids are stable: a story keeps its id across runs and prunes, and the id of a
+    pruned story is never given out again, so ids can be stored with the records.
+
+    Methods:
+        assign(records): Returns the story id of every record.
+        trending_everywhere(min_platforms, since): Lists the stories seen on several platforms.
+        prune(max_age): Forgets the stories not seen for a while.
+        save(): Writes the index to disk.
+    """
+
+    def __init__(self, path='story_index', num_perm=120, bands=40, shingle_size=2, threshold=0.4, seed=1):
+        """
+        Initializes the index and loads the stories saved by a previous run.
+
+        Args:
+            path (str): Path prefix of the index files, or None to keep it in memory only.
+            num_perm (int): Number of MinHash permutations, i.e. the signature length.
+            bands (int): Number of LSH bands; num_perm must be a multiple of it.
+            shingle_size (int): Number of characters per shingle.
+            threshold (float): Estimated Jaccard similarity from which a title joins a story.
+            seed (int): Seed of the permutations; must not change once stories are saved.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+
+        # 乘法-移位哈希的参数，每个排列一组64位的奇数乘数及偏移
+        random = np.random.RandomState(seed)
+        words = random.randint(0, 2 ** 32, size=(2, num_perm, 2), dtype=np.uint64)
+        self.a = (words[0, :, 0] << np.uint64(32)) | words[0, :, 1] | np.uint64(1)
+        self.b = (words[1, :, 0] << np.uint64(32)) | words[1, :, 1]
+
+        # 按行存放每个故事的编号、代表签名、最近出现时间、代表标题及各平台最近出现时间；
+        # story_rows为故事编号到行号的映射，LSH分桶中存放行号。编号只增不减，清理故事时不重新编号
+        self.ids = np.empty(0, dtype=np.int64)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.last_seen = np.empty(0, dtype=np.float64)
+        self.titles = []
+        self.platforms = []
+        self.story_rows = {}
+        self.title_ids = {}
+        self.buckets = [{} for _ in range(bands)]
+        self.size = 0
+        self.next_id = 0
+
+        if path and os.path.exists(f"{path}.npz") and os.path.exists(f"{path}.json"):
+            self.__load()
+
+    def signature(self, titles):
+        """
+        Computes the MinHash signatures of titles in one vectorized pass.
+
+        Args:
+            titles (list): The titles.
+
+        Returns:
+            ndarray: One uint32 signature of num_perm values per title.
+        """
+        hashed = [np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(title, self.shingle_size)),
+                              dtype=np.uint64) for title in titles]
+        if not hashed:
+            return np.empty((0, self.num_perm), dtype=np.uint32)
+        starts = np.cumsum([0] + [len(values) for values in hashed[:-1]])
+        values = np.concatenate(hashed)
+        # (a*x + b) mod 2^64 的高32位，溢出即取模
+        permuted = ((values[:, None] * self.a + self.b) >> np.uint64(32)).astype(np.uint32)
+        return np.minimum.reduceat(permuted, starts, axis=0)
+
+    def assign(self, records, now=None):
+        """
+        Returns the story id of every record, creating stories for new titles.
+
+        Args:
+            records (list): Record items (or dicts) with title and platform.
+            now (float): Timestamp of the records. Defaults to the current time.
+
+        Returns:
+            list: The story id of every record, in the order of the records.
+        """
+        now = time.time() if now is None else now
+        records = list(records)
+        titles = [record['title'] for record in records]
+
+        with self.lock:
+            ids = [self.title_ids.get(title) for title in titles]
+            new_titles = list(dict.fromkeys(title for title, story in zip(titles, ids) if story is None))
+            # 新标题分批计算签名，限制中间矩阵的大小
+            for start in range(0, len(new_titles), 2000):
+                batch = new_titles[start:start + 2000]
+                for title, signature in zip(batch, self.signature(batch)):
+                    self.title_ids[title] = self.__match(title, signature, now)
+
+            result = []
+            for record, title in zip(records, titles):
+                story = self.title_ids[title]
+                row = self.story_rows[story]
+                self.last_seen[row] = now
+                self.platforms[row][record['platform']] = now
+                result.append(story)
+        return result
+
+    def __band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def __match(self, title, signature, now):
+        """
+        Finds the story of a new title among the LSH candidates, or starts a new story.
+
+        Args:
+            title (str): The title.
+            signature (ndarray): Its MinHash signature.
+            now (float): The current timestamp.
+
+        Returns:
+            int: The story id.
+        """
+        keys = self.__band_keys(signature)
+        candidates = {row for band, key in enumerate(keys) for row in self.buckets[band].get(key, ())}
+        if candidates:
+            candidates = np.fromiter(candidates, dtype=np.int64)
+            similarity = (self.signatures[candidates] == signature).mean(axis=1)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= self.threshold:
+                return int(self.ids[candidates[best]])
+
+        row, story = self.size, self.next_id
+        self.__grow(row + 1)
+        self.ids[row] = story
+        self.signatures[row] = signature
+        self.last_seen[row] = now
+        self.titles.append(title)
+        self.platforms.append({})
+        self.story_rows[story] = row
+        self.size += 1
+        self.next_id += 1
+        for band, key in enumerate(keys):
+            self.buckets[band].setdefault(key, []).append(row)
+        return story
+
+    def __grow(self, size):
+        """
+        Makes room for size stories, doubling the arrays so appends stay amortized O(1).
+
+        Args:
+            size (int): Number of stories to hold.
+        """
+        if size <= len(self.signatures):
+            return
+        capacity = max(size, 2 * len(self.signatures), 1024)
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        signatures = np.zeros((capacity, self.num_perm), dtype=np.uint32)
+        signatures[:self.size] = self.signatures[:self.size]
+        last_seen = np.zeros(capacity, dtype=np.float64)
+        last_seen[:self.size] = self.last_seen[:self.size]
+        self.ids, self.signatures, self.last_seen = ids, signatures, last_seen
+
+    def trending_everywhere(self, min_platforms=3, since=None):
+        """
+        Lists the stories seen on several platforms.
+
+        Args:
+            min_platforms (int): Minimum number of platforms.
+            since (float): Only count the platforms where the story was seen after this timestamp.
+
+        Returns:
+            list: (story id, representative title, platforms) tuples, most platforms first.
+        """
+        since = since or 0
+        with self.lock:
+            stories = [(story, title, sorted(platform for platform, seen in platforms.items() if seen >= since))
+                       for story, title, platforms in zip(self.ids[:self.size].tolist(), self.titles, self.platforms)]
+        stories = [story for story in stories if len(story[2]) >= min_platforms]
+        return sorted(stories, key=lambda story: (-len(story[2]), story[0]))
+
+    def prune(self, max_age=7 * 86400, now=None):
+        """
+        Forgets the stories not seen for max_age seconds. The remaining stories keep their
+        ids, and the ids of the dropped ones are not reused.
+
+        Args:
+            max_age (float): Age in seconds after which a story is dropped.
+            now (float): The current timestamp. Defaults to the current time.
+
+        Returns:
+            int: Number of dropped stories.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            keep = np.flatnonzero(self.last_seen[:self.size] >= now - max_age)
+            dropped = self.size - len(keep)
+            if dropped:
+                kept = set(self.ids[keep].tolist())
+                self.__rebuild(self.ids[keep], self.signatures[keep], self.last_seen[keep],
+                               [self.titles[row] for row in keep], [self.platforms[row] for row in keep],
+                               {title: story for title, story in self.title_ids.items() if story in kept},
+                               self.next_id)
+        if dropped:
+            logger.info("Pruned %d stories, %d left", dropped, self.size)
+        return dropped
+
+    def __rebuild(self, ids, signatures, last_seen, titles, platforms, title_ids, next_id):
+        """
+        Replaces the stories and rebuilds the row lookup and the LSH buckets.
+        """
+        self.size = len(titles)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.signatures = np.array(signatures, dtype=np.uint32).reshape(-1, self.num_perm)
+        self.last_seen = np.array(last_seen, dtype=np.float64)
+        self.titles = list(titles)
+        self.platforms = list(platforms)
+        self.story_rows = {story: row for row, story in enumerate(self.ids.tolist())}
+        self.title_ids = dict(title_ids)
+        self.next_id = next_id
+        self.buckets = [{} for _ in range(self.bands)]
+        for row in range(self.size):
+            for band, key in enumerate(self.__band_keys(self.signatures[row])):
+                self.buckets[band].setdefault(key, []).append(row)
+
+    def save(self):
+        """
+        Writes the index to disk, replacing the previous files. Saves are serialized, so the
+        two files always come from the same save; both record the next story id, so a
+        mismatched pair is detected on load.
+        """
+        if not self.path:
+            return
+        with self.save_lock:
+            with self.lock:
+                ids = self.ids[:self.size].copy()
+                signatures = self.signatures[:self.size].copy()
+                last_seen = self.last_seen[:self.size].copy()
+                next_id = self.next_id
+                state = {'num_perm': self.num_perm, 'titles': self.titles, 'platforms': self.platforms,
+                         'title_ids': self.title_ids, 'next_id': next_id}
+                state = json.dumps(state, ensure_ascii=False)
+            try:
+                temp_path = f"{self.path}.tmp"
+                with open(temp_path, 'wb') as f:
+                    np.savez_compressed(f, ids=ids, signatures=signatures, last_seen=last_seen, next_id=next_id)
+                os.replace(temp_path, f"{self.path}.npz")
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(state)
+                os.replace(temp_path, f"{self.path}.json")
+            except OSError as e:
+                logger.error("保存故事索引时出现错误：%s", e)
+
+    def __load(self):
+        """
+        Loads the stories saved by a previous run. Files that cannot be read or do not belong
+        together are discarded with an error, but the story id counter still continues after
+        the highest id either file records, so ids already stored are never given out again.
+        """
+        arrays, state = {}, {}
+        try:
+            with np.load(f"{self.path}.npz") as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            logger.error("读取故事索引时出现错误：%s", e)
+        try:
+            with open(f"{self.path}.json", encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("读取故事索引时出现错误：%s", e)
+
+        # 旧版本保存的索引没有编号，行号即编号
+        signatures = arrays.get('signatures', np.empty((0, self.num_perm), dtype=np.uint32))
+        ids = arrays.get('ids', np.arange(len(signatures)))
+        saved_ids = [int(arrays['next_id'])] if 'next_id' in arrays else []
+        saved_ids += [state['next_id']] if 'next_id' in state else []
+        next_id = max(saved_ids + [int(ids.max()) + 1 if len(ids) else 0, len(state.get('titles', ()))])
+
+        if not arrays or not state or state.get('num_perm') != self.num_perm or \
+                len(signatures) != len(state.get('titles', ())) or len(set(saved_ids)) > 1:
+            logger.error("故事索引文件不完整或不一致，已丢弃其中的故事，编号从%d继续", next_id)
+            self.next_id = next_id
+            return
+        self.__rebuild(ids, signatures, arrays['last_seen'], state['titles'], state['platforms'], state['title_ids'],
+                       next_id)
@@ -1,6 +1,71 @@
+import asyncio
+import html
+import json
+import logging
+import os
+import re
 import requests
 import concurrent.futures
+import functools
+import itertools
 import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 页面中的榜单块，以及块内的平台、榜单名称
+_BLOCK_PATTERN = re.compile(r'<div[^>]*class="(?:[^"]* )?cc-cd(?: [^"]*)?"')
+_PLATFORM_PATTERN = re.compile(r'class="(?:[^"]* )?cc-cd-lb(?: [^"]*)?"[^>]*>(.*?)</div>', re.S)
+_SLIST_PATTERN = re.compile(r'class="(?:[^"]* )?cc-cd-sb-st(?: [^"]*)?"[^>]*>(.*?)</span>', re.S)
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+def _block_keys(text):
+    """
+    Lists the boards of a page without a full parse.
+
+    Args:
+        text (str): The HTML of the page.
+
+    Returns:
+        set: (platform, slist) of every cc-cd block on the page.
+    """
+    keys = set()
+    for block in _BLOCK_PATTERN.split(text)[1:]:
+        platform = _PLATFORM_PATTERN.search(block)
+        slist = _SLIST_PATTERN.search(block)
+        keys.add(tuple(html.unescape(_TAG_PATTERN.sub('', match.group(1))).strip() if match else ''
+                       for match in (platform, slist)))
+    return keys
+
+class FetchResult(namedtuple('FetchResult', ['category', 'page', 'status', 'bytes', 'latency', 'body', 'error',
+                                             'attempts', 'fetched_at'], defaults=(1, None))):
+    """
+    FetchResult describes the fetch of a single page.
+
+    Attributes:
+        category (str): The category of the page.
+        page (int): The page number.
+        status (int): The HTTP status code, or None if no response was received.
+        bytes (int): Size of the response body in bytes.
+        latency (float): Seconds spent on the request, body download included.
+        body (str): The page HTML, or None if the fetch failed or the page did not change.
+        error (str): Description of the failure, or None on success.
+        attempts (int): Number of requests made for the page, retries included.
+        fetched_at (datetime): When the page was fetched; the reference time of its relative times.
+    """
+    __slots__ = ()
+
+    @property
+    def unchanged(self):
+        """
+        bool: True if the page was fetched successfully but did not change since the last run.
+        """
+        return self.error is None and self.body is None
 
 class Crawl(object):
     """
@@ -9,10 +74,23 @@ class Crawl(object):
     """
 
 
-    def __init__(self):
+    def __init__(self, max_connections=16, max_per_host=8, cache=None, page_count_path=None,
+                 rate_limiter=None, limiter=None, retry=None, snapshots=None, metrics=None):
         """
         Initializes the Crawl class with cookies, headers, and parameters required for the HTTP requests.
         It also sets up dictionaries for page limits and URLs for different categories.
+
+        Args:
+            max_connections (int): Global limit of concurrent requests in asyncio mode.
+            max_per_host (int): Limit of concurrent requests (and pooled keep-alive connections) per host.
+            cache (ResponseCache): Optional response cache; iter_all_info then sends conditional
+                                   requests and marks unchanged pages.
+            page_count_path (str): Optional JSON file keeping the page counts found by discover_pages.
+            rate_limiter (TokenBucket): Optional limit of the request rate of fetch().
+            limiter (AimdLimiter): Optional adaptive limit of the concurrent requests of fetch().
+            retry (RetryPolicy): Optional policy retrying fetch() on throttling, server and connection errors.
+            snapshots (SnapshotStore): Optional store keeping the raw HTML of every page iter_all_info fetches.
+            metrics (Metrics): Registry receiving the fetch timings and counters. Defaults to metrics.REGISTRY.
         """
         self.cookies = {
             'Hm_lvt_3b1e939f6e789219d8629de8a519eab9': '1715853553,1715855472,1715858860',
@@ -58,6 +136,34 @@ class Crawl(object):
 
         self.lock = threading.Lock()
 
+        # 共享的连接池，所有类目复用keep-alive连接；连接用完时等待空闲连接，
+        # 而不是新建一个用后即丢弃的连接，同一主机的并发请求因此不超过max_per_host
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.url_dict), pool_maxsize=max_per_host, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.cache = cache
+
+        # 限速、自适应并发及重试策略
+        self.rate_limiter = rate_limiter
+        self.limiter = limiter
+        self.retry = retry
+
+        # 原始页面快照
+        self.snapshots = snapshots
+
+        self.metrics = metrics or REGISTRY
+
+        # discover_pages探测到的页数，{category: {'pages': n, 'discovered_at': timestamp}}
+        self.page_count_path = page_count_path
+        self.page_counts = {}
+        if page_count_path and os.path.exists(page_count_path):
+            with open(page_count_path, encoding='utf-8') as f:
+                self.page_counts = json.load(f)
+
     def get_all_info(self):
         """
         Synchronously fetches all information from all categories.
@@ -65,12 +171,12 @@ class Crawl(object):
         Returns:
             str: Concatenated string of all fetched information.
         """
-        print("Starting synchronous fetching of all information...")
+        logger.info("Starting synchronous fetching of all information...")
         all_info = ''
         for category in self.page_dict:
-            print(f"Fetching information for category: {category}")
+            logger.info("Fetching information for category: %s", category)
             all_info += self.get_category_info(category)
-        print("Completed synchronous fetching of all information.")
+        logger.info("Completed synchronous fetching of all information.")
         return all_info
 
     def get_category_info(self, category):
@@ -86,11 +192,11 @@ class Crawl(object):
         if category not in self.page_dict or category not in self.url_dict:
             return "Invalid category"
 
-        print(f"Starting synchronous fetching for category: {category}")
+        logger.info("Starting synchronous fetching for category: %s", category)
         all_page_str = ''
         for page_num in range(self.page_dict[category]):
             all_page_str += self.get_single_info(category, page_num)
-        print(f"Completed synchronous fetching for category: {category}")
+        logger.info("Completed synchronous fetching for category: %s", category)
         return all_page_str
 
     def get_single_info(self, category, page):
@@ -104,9 +210,9 @@ class Crawl(object):
         Returns:
             str: The fetched information as a string.
         """
-        self.params['p'] = str(page)
-        response = requests.get(self.url_dict[category], params=self.params, cookies=self.cookies, headers=self.headers)
-        print(f"Fetched page {page} for category {category}")
+        params = dict(self.params, p=str(page))
+        response = self.session.get(self.url_dict[category], params=params, cookies=self.cookies, headers=self.headers)
+        logger.debug("Fetched page %s for category %s", page, category)
         return response.text
 
     def get_all_info_async(self):
@@ -116,21 +222,18 @@ class Crawl(object):
         Returns:
             str: Concatenated string of all fetched information.
         """
-        print("Starting asynchronous fetching of all information...")
-        all_info = ''
+        logger.info("Starting asynchronous fetching of all information...")
+        all_info = []
         with concurrent.futures.ThreadPoolExecutor() as executor:
             futures = {executor.submit(self.get_category_info_async, category): category for category in self.page_dict}
             for future in concurrent.futures.as_completed(futures):
                 category = futures[future]
                 try:
-                    result = future.result()
-                    with self.lock:
-                        all_info += result
+                    all_info.append(future.result())
                 except Exception as exc:
-                    with self.lock:
-                        all_info += f"\n{category} generated an exception: {exc}"
-        print("Completed asynchronous fetching of all information.")
-        return all_info
+                    all_info.append(f"\n{category} generated an exception: {exc}")
+        logger.info("Completed asynchronous fetching of all information.")
+        return ''.join(all_info)
 
     def get_category_info_async(self, category):
         """
@@ -145,22 +248,312 @@ class Crawl(object):
         if category not in self.page_dict or category not in self.url_dict:
             return "Invalid category"
 
-        print(f"Starting asynchronous fetching for category: {category}")
-        all_page_str = ''
+        logger.info("Starting asynchronous fetching for category: %s", category)
+        all_page_str = []
         with concurrent.futures.ThreadPoolExecutor() as executor:
             futures = {executor.submit(self.get_single_info, category, page_num): page_num for page_num in
                        range(self.page_dict[category])}
             for future in concurrent.futures.as_completed(futures):
                 page_num = futures[future]
                 try:
-                    result = future.result()
-                    with self.lock:
-                        all_page_str += result
+                    all_page_str.append(future.result())
                 except Exception as exc:
+                    all_page_str.append(f"\nPage {page_num} generated an exception: {exc}")
+        logger.info("Completed asynchronous fetching for category: %s", category)
+        return ''.join(all_page_str)
+
+    def fetch(self, category, page, use_cache=True):
+        """
+        Fetches a page and describes the outcome. The query parameters are built for this
+        request only, so any number of fetches can run concurrently. Errors are reported in
+        the result instead of being raised.
+
+        With a response cache, a conditional request is sent and the body of a page that did
+        not change since the last run is None. Every attempt first waits for the rate limiter
+        and the concurrency limiter, if any; failed attempts are retried per the retry policy.
+
+        Args:
+            category (str): The category of information to fetch.
+            page (int): The page number to fetch.
+            use_cache (bool): Send a conditional request through the response cache. When False
+                              the body is always returned and the cache is left untouched.
+
+        Returns:
+            FetchResult: The result of the fetch.
+        """
+        attempt = 1
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            if self.limiter is not None:
+                self.limiter.acquire()
+            result = None
+            try:
+                result = self.__fetch_once(category, page, use_cache)
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release(result.status if result else None, result.latency if result else 0.0)
+
+            if result.error is None or self.retry is None or not self.retry.should_retry(result.status, attempt):
+                return result._replace(attempts=attempt)
+            # 失败后按指数退避并加随机抖动重试
+            self.metrics.incr('fetch_retries', category=category)
+            time.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+    def __fetch_once(self, category, page, use_cache=True):
+        """
+        Makes a single request for a page.
+
+        Args:
+            category (str): The category of information to fetch.
+            page (int): The page number to fetch.
+            use_cache (bool): Send a conditional request through the response cache.
+
+        Returns:
+            FetchResult: The result of the request.
+        """
+        params = dict(self.params, p=str(page))
+        headers = self.headers
+        cache = self.cache if use_cache else None
+        if cache is not None:
+            headers = dict(self.headers, **self.cache.validators(category, page))
+
+        fetched_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            # 先只接收响应头，分开统计首字节时间（含DNS及建立连接）与正文下载时间
+            response = self.session.get(self.url_dict[category], params=params, cookies=self.cookies,
+                                        headers=headers, stream=True)
+            headers_at = time.perf_counter()
+            body = response.text
+        except Exception as exc:
+            logger.warning("%s page %s generated an exception: %s", category, page, exc)
+            self.metrics.incr('fetch_errors', category=category)
+            return FetchResult(category, page, None, 0, time.perf_counter() - start, None, str(exc),
+                               fetched_at=fetched_at)
+        latency = time.perf_counter() - start
+        self.metrics.observe('fetch_ttfb_seconds', headers_at - start, category=category)
+        self.metrics.observe('fetch_body_seconds', latency - (headers_at - start), category=category)
+        self.metrics.incr('fetch_bytes', len(response.content), category=category)
+        self.metrics.incr('fetch_responses', category=category, status=str(response.status_code))
+
+        error = None
+        if response.status_code == 304 and cache is not None:
+            cache.not_modified(category, page)
+            body = None
+        elif response.status_code >= 400:
+            error = f"HTTP {response.status_code}"
+            body = None
+        elif cache is not None and cache.update(category, page, response.headers, body):
+            body = None
+        if body is None and error is None:
+            self.metrics.incr('fetch_unchanged', category=category)
+
+        logger.debug("Fetched page %s for category %s: %s", page, category, response.status_code)
+        return FetchResult(category, page, response.status_code, len(response.content), latency, body, error,
+                           fetched_at=fetched_at)
+
+    def iter_all_info(self, max_in_flight=None, categories=None, pages=None):
+        """
+        Streams every page of every category, or of the given categories, as soon as it is fetched.
+
+        At most max_in_flight pages are being fetched or waiting to be consumed at any time,
+        so memory stays bounded by the in-flight pages and the caller can parse each page
+        while the remaining ones are still downloading.
+
+        Args:
+            max_in_flight (int): Number of pages fetched concurrently. Defaults to max_per_host,
+                                 since every category is served by the same host.
+            categories (iterable): Categories to fetch. Defaults to every category.
+            pages (dict): Page numbers to fetch per category, e.g. from BoardMap.plan(); categories
+                          not listed fetch every page.
+
+        With a snapshot store, the raw HTML of every page is kept under a new run.
+
+        Yields:
+            FetchResult: The result of every page, failed ones included, in completion order.
+        """
+        max_in_flight = max_in_flight or min(self.max_connections, self.max_per_host)
+        fetch = self.fetch
+        if self.snapshots is not None:
+            fetch = functools.partial(self.__fetch_and_keep, self.snapshots.begin_run())
+        categories = self.page_dict if categories is None else categories
+        pages = pages or {}
+        tasks = ((category, page_num)
+                 for category in categories if category in self.url_dict
+                 for page_num in pages.get(category, range(self.page_dict.get(category, 0))))
+
+        logger.info("Starting streaming fetching of all information...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            pending = {executor.submit(fetch, *task) for task in itertools.islice(tasks, max_in_flight)}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    # 每完成一页才提交下一页，限制内存中的页面数量
+                    for task in itertools.islice(tasks, 1):
+                        pending.add(executor.submit(fetch, *task))
+                    yield future.result()
+        if self.cache is not None:
+            self.cache.save()
+        logger.info("Completed streaming fetching of all information.")
+
+    def __fetch_and_keep(self, run_id, category, page):
+        """
+        Fetches a page and keeps its raw HTML in the snapshot store.
+
+        Args:
+            run_id (str): The snapshot run of the crawl.
+            category (str): The category of information to fetch.
+            page (int): The page number to fetch.
+
+        Returns:
+            FetchResult: The result of the fetch.
+        """
+        result = self.fetch(category, page)
+        try:
+            self.snapshots.put(run_id, result)
+        except OSError as e:
+            logger.error("保存页面快照时出现错误：%s", e)
+        return result
+
+    def discover_pages(self, probe_width=4, max_pages=100, ttl=86400, categories=None):
+        """
+        Finds the real number of pages of every category, or of the given categories, and
+        updates page_dict with it.
+
+        Pages are probed probe_width at a time and checked in order; the count ends at the
+        first page that has no cc-cd block not already seen on an earlier page, which covers
+        both empty pages and pages repeating the previous one. Counts younger than ttl
+        seconds are reused without probing.
+
+        Probes go through fetch(), so they respect the rate limiter, the concurrency limiter
+        and the retry policy. A probe that still fails leaves the count unknown: the category
+        keeps its previous count, which is not cached, so the next call probes it again. A
+        first page without any board (e.g. a captcha page served with HTTP 200) counts as a
+        failed probe, never as a category of 0 pages.
+
+        Args:
+            probe_width (int): Number of pages probed concurrently.
+            max_pages (int): Upper bound of the page count of a category.
+            ttl (int): Number of seconds a discovered count stays valid.
+            categories (iterable): Categories to check. Defaults to every category.
+
+        Returns:
+            dict: {'pages': page count per category, 'probes': requests spent probing,
+                   'saved': requests saved per crawl compared with the previous page_dict,
+                   'failed': categories whose probing failed and kept their previous count}.
+        """
+        report = {'pages': {}, 'probes': 0, 'saved': 0, 'failed': []}
+        now = time.time()
+        for category in (self.url_dict if categories is None else categories):
+            with self.lock:
+                cached = self.page_counts.get(category)
+            if cached and now - cached['discovered_at'] < ttl:
+                pages = cached['pages']
+            else:
+                pages, probes = self.__probe_pages(category, probe_width, max_pages)
+                report['probes'] += probes
+                if pages is None:
+                    # 探测失败时页数未知，沿用原来的页数且不缓存
+                    report['failed'].append(category)
+                    pages = self.page_dict.get(category, 0)
+                else:
                     with self.lock:
-                        all_page_str += f"\nPage {page_num} generated an exception: {exc}"
-        print(f"Completed asynchronous fetching for category: {category}")
-        return all_page_str
+                        self.page_counts[category] = {'pages': pages, 'discovered_at': now}
+
+            report['saved'] += self.page_dict.get(category, 0) - pages
+            report['pages'][category] = pages
+            self.page_dict[category] = pages
+
+        if self.page_count_path:
+            # 不同类别可能在不同线程中同时探测
+            with self.lock:
+                with open(self.page_count_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.page_counts, f)
+        logger.info("Discovered %d pages with %d probes, %d requests saved per crawl",
+                    sum(report['pages'].values()), report['probes'], report['saved'])
+        return report
+
+    def __probe_pages(self, category, probe_width, max_pages):
+        """
+        Probes the pages of a category until one brings no new board.
+
+        Args:
+            category (str): The category to probe.
+            probe_width (int): Number of pages probed concurrently.
+            max_pages (int): Upper bound of the page count.
+
+        Returns:
+            tuple: (page count, or None if a probe failed before the end was found or the
+                    first page has no board, number of requests made).
+        """
+        seen = set()
+        probes = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=probe_width) as executor:
+            for start in range(0, max_pages, probe_width):
+                window = range(start, min(start + probe_width, max_pages))
+                results = list(executor.map(lambda page_num: self.fetch(category, page_num, use_cache=False), window))
+                probes += sum(result.attempts for result in results)
+                for page_num, result in zip(window, results):
+                    if result.error is not None:
+                        logger.warning("Probing page %s of %s failed: %s", page_num, category, result.error)
+                        return None, probes
+                    keys = _block_keys(result.body)
+                    if not keys - seen:
+                        # 第一页就没有榜单多半是验证码或反爬页面，而不是类别为空
+                        if page_num == 0:
+                            logger.warning("Page 0 of %s has no boards, treating the probe as failed", category)
+                            return None, probes
+                        return page_num, probes
+                    seen |= keys
+        return max_pages, probes
+
+    def get_all_info_aio(self):
+        """
+        Fetches all information from all categories with an asyncio event loop.
+
+        Every page of every category is scheduled at once and goes through fetch(), so it
+        shares the pooled session, the rate limiter, the concurrency limiter and the retry
+        policy with the other fetching methods; the event loop bounds the requests in flight
+        globally by max_connections and per host by max_per_host.
+
+        Returns:
+            str: Concatenated string of all fetched information, in (category, page) order.
+        """
+        logger.info("Starting asyncio fetching of all information...")
+        all_info = ''.join(asyncio.run(self.__gather_all_aio()))
+        logger.info("Completed asyncio fetching of all information.")
+        return all_info
+
+    async def __gather_all_aio(self):
+        """
+        Schedules every (category, page) fetch on the running event loop.
+
+        Returns:
+            list: Page texts, or error notes for failed pages, in (category, page) order.
+        """
+        loop = asyncio.get_running_loop()
+        global_limit = asyncio.Semaphore(self.max_connections)
+        host_limits = {}
+
+        async def fetch(executor, category, page_num):
+            host = urlsplit(self.url_dict[category]).netloc
+            host_limit = host_limits.setdefault(host, asyncio.Semaphore(self.max_per_host))
+            async with global_limit, host_limit:
+                # 与get_single_info一样总是返回正文，不发送条件请求
+                result = await loop.run_in_executor(executor, functools.partial(self.fetch, category, page_num,
+                                                                                use_cache=False))
+            if result.error is not None:
+                return f"\n{category} page {page_num} generated an exception: {result.error}"
+            return result.body
+
+        # 阻塞的HTTP调用放在固定大小的线程池中执行，避免每个类目重复创建线程池
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            tasks = [fetch(executor, category, page_num)
+                     for category in self.page_dict if category in self.url_dict
+                     for page_num in range(self.page_dict[category])]
+            return await asyncio.gather(*tasks)
 
 if __name__ == '__main__':
     # a = Crawl()
@@ -0,0 +1,151 @@
+import concurrent.futures
+import heapq
+import logging
+import signal
+import threading
+import time
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class Daemon(object):
+    """
+    Daemon runs a job for every category on its own interval in a long-running process.
+
+    Fast-changing categories are refreshed every few minutes and slow ones hourly or less,
+    so the default intervals keep the total request volume at about the level of crawling
+    every page once an hour. The objects used by the job (Crawl, Extract, MySQL connections)
+    live as long as the process.
+
+    A run never overlaps the previous run of the same category: when a category is due
+    while its previous run is still going, the new run is either skipped or coalesced into
+    a single run started right after the current one finishes.
+
+    Methods:
+        run(install_signals): Runs the jobs until stop() is called or a signal is received.
+        stop(): Asks the daemon to shut down after the running jobs finish.
+    """
+
+    # 各类别的运行间隔（秒）
+    DEFAULT_INTERVALS = {
+        'communal_info': 20 * 60,
+        'comprehensive_info': 60 * 60,
+        'technological_info': 2 * 60 * 60,
+        'recreational_info': 2 * 60 * 60,
+        'financial_info': 2 * 60 * 60,
+        'shop_info': 4 * 60 * 60,
+        'newspaper_info': 4 * 60 * 60,
+    }
+
+    OVERLAP_MODES = ('skip', 'coalesce')
+
+    def __init__(self, job, intervals=None, overlap='coalesce', on_shutdown=None, metrics=None):
+        """
+        Initializes the daemon.
+
+        Args:
+            job (callable): Called with a category name for every run.
+            intervals (dict): Seconds between two runs of each category. Defaults to DEFAULT_INTERVALS.
+            overlap (str): 'skip' drops a run that is due while the previous one is going,
+                           'coalesce' runs once more right after it.
+            on_shutdown (callable): Called once after the last run, e.g. to close connections.
+            metrics (Metrics): Registry receiving the run durations and skipped runs. Defaults to metrics.REGISTRY.
+        """
+        if overlap not in self.OVERLAP_MODES:
+            raise ValueError(f"Unknown overlap mode: {overlap}, expected one of {self.OVERLAP_MODES}")
+
+        self.job = job
+        self.intervals = dict(intervals or self.DEFAULT_INTERVALS)
+        self.overlap = overlap
+        self.on_shutdown = on_shutdown
+        self.metrics = metrics or REGISTRY
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.running = set()
+        self.pending = set()
+        self.skipped = dict.fromkeys(self.intervals, 0)
+
+    def stop(self, *args):
+        """
+        Asks the daemon to shut down. Also usable as a signal handler.
+        """
+        logger.info("Stopping daemon after the running jobs...")
+        self.stop_event.set()
+
+    def run(self, install_signals=True):
+        """
+        Runs every category once right away and then on its interval, until stop() is called.
+        Waits for the running jobs before returning.
+
+        Args:
+            install_signals (bool): Stop on SIGINT / SIGTERM. Only possible in the main thread.
+        """
+        if install_signals and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        start = time.monotonic()
+        schedule = [(start, category) for category in self.intervals]
+        heapq.heapify(schedule)
+
+        logger.info("Daemon started with %d categories", len(self.intervals))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.intervals)) as executor:
+            while schedule and not self.stop_event.is_set():
+                due, category = schedule[0]
+                now = time.monotonic()
+                if due > now:
+                    # 等到下一个类别到期，收到停止信号时立即醒来
+                    self.stop_event.wait(due - now)
+                    continue
+
+                # 按固定节奏排下一次；落后太多时不补跑错过的轮次
+                heapq.heapreplace(schedule, (max(due + self.intervals[category], now), category))
+                self.__dispatch(executor, category)
+
+        if self.on_shutdown is not None:
+            self.on_shutdown()
+        logger.info("Daemon stopped.")
+
+    def __dispatch(self, executor, category):
+        """
+        Starts a run of a category unless its previous run is still going.
+
+        Args:
+            executor (Executor): The executor running the jobs.
+            category (str): The due category.
+        """
+        with self.lock:
+            if category in self.running:
+                self.skipped[category] += 1
+                self.metrics.incr('runs_skipped', category=category)
+                if self.overlap == 'coalesce':
+                    self.pending.add(category)
+                logger.warning("%s is still running, %s this run", category,
+                               'coalescing' if self.overlap == 'coalesce' else 'skipping')
+                return
+            self.running.add(category)
+        executor.submit(self.__run_job, category)
+
+    def __run_job(self, category):
+        """
+        Runs the job of a category, and again while runs were coalesced into it.
+
+        Args:
+            category (str): The category to run.
+        """
+        while True:
+            started = time.monotonic()
+            try:
+                self.job(category)
+            except Exception as e:
+                logger.exception("运行%s任务时出现错误：%s", category, e)
+            self.metrics.observe('run_seconds', time.monotonic() - started, category=category)
+            logger.info("%s finished in %.1fs", category, time.monotonic() - started)
+
+            with self.lock:
+                if category in self.pending and not self.stop_event.is_set():
+                    self.pending.discard(category)
+                    continue
+                self.pending.discard(category)
+                self.running.discard(category)
+                return
@@ -1,66 +1,369 @@
-from bs4 import BeautifulSoup
+import concurrent.futures
+import itertools
+import re
+import sys
+import time
 from datetime import datetime, timedelta
+from collections import namedtuple
+from functools import lru_cache
+from metrics import REGISTRY
+
+@lru_cache(maxsize=None)
+def _lxml_xpaths():
+    """
+    Compiles the XPath expressions of the lxml engine once per process.
+    lxml is imported here so that it is only required when the engine is used.
+
+    Returns:
+        dict: The HTML parser function and the compiled XPath expressions.
+    """
+    from lxml import etree
+
+    def has_class(tag, class_name):
+        return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+    def first_text(tag, class_name):
+        # 与BeautifulSoup的find()一致，取第一个匹配的后代节点的全部文本
+        return etree.XPath(f"string((.//{has_class(tag, class_name)})[1])")
+
+    return {
+        'parse': etree.HTML,
+        'blocks': etree.XPath(f"//{has_class('div', 'cc-cd')}"),
+        'platform': first_text('div', 'cc-cd-lb'),
+        'slist': first_text('span', 'cc-cd-sb-st'),
+        'time': first_text('div', 'i-h'),
+        'items': etree.XPath(".//a[@target='_blank']"),
+        'title': first_text('span', 't'),
+        'title_fallback': first_text('div', 'tt'),
+        'hotcount': first_text('span', 'e'),
+        'hotcount_fallback': first_text('div', 'ss'),
+    }
+
+# 热度中的数字及单位，例如 "123万"、"4.5k热度"、"1,024"
+_HOTCOUNT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([万亿千kKwWmM]?)')
+_HOTCOUNT_UNITS = {'': 1, '千': 10 ** 3, 'k': 10 ** 3, 'K': 10 ** 3, '万': 10 ** 4, 'w': 10 ** 4,
+                   'W': 10 ** 4, 'm': 10 ** 6, 'M': 10 ** 6, '亿': 10 ** 8}
+
+def parse_hotcount(text):
+    """
+    Parses a raw hot count such as "123万" or "4.5k热度" into an integer.
+
+    Args:
+        text (str): The raw hot count text.
+
+    Returns:
+        int: The hot count, or None if the text holds no number.
+    """
+    match = _HOTCOUNT_PATTERN.search(text.replace(',', ''))
+    if match is None:
+        return None
+    number, unit = match.groups()
+    return int(round(float(number) * _HOTCOUNT_UNITS[unit]))
+
+@lru_cache(maxsize=4096)
+def _parse_time_text(past_time):
+    """
+    Parses a time string into either a relative offset or an absolute date. The result
+    does not depend on the current time, so it is cached across blocks and pages.
+
+    Args:
+        past_time (str): The stripped time string, e.g. "5分钟前" or "2024-05-16".
+
+    Returns:
+        timedelta or datetime: The offset of a relative time, or the date at midnight.
+    """
+    if past_time.endswith("前"):
+        time_units = {
+            '小时': 'hours',
+            '分钟': 'minutes',
+            '天': 'days',
+            '秒': 'seconds'
+        }
+        for unit, kwarg in time_units.items():
+            if unit in past_time:
+                time_diff = int(past_time.split(unit)[0].strip())
+                return timedelta(**{kwarg: time_diff})
+        raise ValueError("无法识别的时间单位")
+
+    try:
+        return datetime.strptime(past_time, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError("无效的时间格式")
+
+class Record(namedtuple('Record', ['title', 'link', 'hotcount', 'platform', 'slist', 'rectime', 'story_id'],
+                        defaults=(None,))):
+    """
+    Record is a compact, immutable extracted item. It has no per-item dict, and the platform
+    and slist strings are interned so that every item of a board shares them. story_id is
+    set by the pipeline once the item is clustered (see cluster.StoryIndex), None before.
+
+    For compatibility with code written against the former dict items, fields can also be
+    read by name with record['title'] or record.get('story_id'), and as_dict() returns a
+    dict copy.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            # 只按字段名读取，count、index等元组属性不是字段
+            if key in self._fields:
+                return getattr(self, key)
+            raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        """
+        Returns a field by name, or default if there is no such field.
+
+        Args:
+            key (str): The field name.
+            default: The value returned for an unknown name.
+
+        Returns:
+            The field value or default.
+        """
+        return getattr(self, key) if key in self._fields else default
+
+    def as_dict(self):
+        """
+        Returns the record as a dict.
+
+        Returns:
+            dict: The fields of the record by name.
+        """
+        return dict(zip(self._fields, self))
+
+def _extract_chunk(engine, subscription, pages):
+    """
+    Extracts a chunk of pages inside a worker process.
+
+    Args:
+        engine (str): The parser engine to use.
+        subscription (Subscription): The boards to keep, or None for every board.
+        pages (list): (HTML text, reference time) of each page.
+
+    Returns:
+        list: The records of each page, in the order of the chunk.
+    """
+    extractor = Extract(engine=engine, subscription=subscription)
+    return [extractor.extract_info(text, now=now) for text, now in pages]
 
 class Extract(object):
     """
         Extract is a web scraping class designed to extract and process information
         from HTML text. The class provides methods to extract relevant details such as
         titles, links, hot counts, platforms, lists, and recorded times from specific
-        HTML elements. The recorded times are converted to a standard datetime format.
+        HTML elements. Hot counts are converted to integers and recorded times to datetime objects.
+        The HTML can be parsed with BeautifulSoup (reference engine) or lxml (fast engine).
+        With a subscription, only the subscribed boards are extracted.
 
         Methods:
             extract_info(text): Extracts information from the given HTML text and returns
-                                a list of dictionaries containing the extracted details.
+                                a list of Record items containing the extracted details.
+            iter_info(pages): Parses a stream of fetched pages one at a time and yields the
+                                records of each page.
+            extract_parallel(pages, processes, chunksize): Parses pages over a process pool and
+                                returns their records ordered by (category, page).
             safe_find_text(parent, tag, class_name): Safely finds and returns the text of a tag
                                 within a parent element. Returns an empty string if the tag is not found.
             extract_link(element): Extracts the href link from an element.
-            __cal_time(past_time): Calculates the datetime object from a relative time string.
+            __cal_time(past_time, now): Calculates the datetime object from a relative time string.
     """
 
-    def extract_info(self, text):
+    ENGINES = ('bs4', 'lxml')
+
+    def __init__(self, engine='bs4', metrics=None, subscription=None):
+        """
+        Initializes the Extract class with a parser engine.
+
+        Args:
+            engine (str): 'bs4' for the reference BeautifulSoup parser, or 'lxml' for the
+                          C-backed parser using precompiled XPath expressions. Both engines
+                          produce identical records on the same input.
+            metrics (Metrics): Registry receiving the parse timings and row counts. Defaults to metrics.REGISTRY.
+            subscription (Subscription): Optional set of boards to keep; the items of other
+                                         boards are not walked at all.
+        """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown parser engine: {engine}")
+        self.engine = engine
+        self.metrics = metrics or REGISTRY
+        self.subscription = subscription
+
+    def extract_info(self, text, now=None):
         """
         Extracts information from the given HTML text.
 
+        hotcount is normalized to an integer (None when the item shows no number) and rectime
+        to a datetime (None when the block shows no time).
+
         Args:
             text (str): HTML text to parse.
+            now (datetime): Reference time of the page for relative times. Defaults to the
+                            current time, taken once for the whole page.
 
         Returns:
-            list: A list of dictionaries containing extracted information.
+            list: A list of Record items containing extracted information.
         """
-        soup = BeautifulSoup(text, 'html.parser')
+        start = time.perf_counter()
         item_list = []
+        now = now or datetime.now()
+
+        blocks = self.__blocks_lxml(text) if self.engine == 'lxml' else self.__blocks_bs4(text)
+        for platform, slist, time_text, sec_items in blocks:
+            rectime = self.__cal_time(time_text, now) if time_text else None
+            # 同一榜单的条目共享平台及榜单名称字符串
+            platform = sys.intern(platform) if platform else ''
+            slist = sys.intern(slist) if slist else ''
 
-        first_items = soup.find_all('div', class_='cc-cd')
+            for title, link, hotcount in sec_items:
+                item_list.append(Record(title if title else '', link, parse_hotcount(hotcount),
+                                        platform, slist, rectime))
 
-        for fir_item in first_items:
+        self.metrics.observe('parse_seconds', time.perf_counter() - start, engine=self.engine)
+        return item_list
+
+    def __blocks_bs4(self, text):
+        """
+        Walks the cc-cd blocks of a page with BeautifulSoup (reference engine).
+        bs4 is imported here so that it is only loaded when the engine is used.
+
+        Args:
+            text (str): HTML text to parse.
+
+        Yields:
+            tuple: (platform, slist, time_text, items), where items yields (title, link, hotcount).
+        """
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(text, 'html.parser')
+
+        for fir_item in soup.find_all('div', class_='cc-cd'):
             platform = self.__find_text(fir_item, 'div', 'cc-cd-lb')
             slist = self.__find_text(fir_item, 'span', 'cc-cd-sb-st')
+            # 未订阅的榜单只读取表头，不再遍历其中的条目
+            if self.subscription is not None and (platform, slist) not in self.subscription:
+                continue
             time_text = self.__find_text(fir_item, 'div', 'i-h')
-            rectime = self.__cal_time(time_text) if time_text else None
-
-            sec_items = fir_item.find_all('a', target="_blank")
-            for sec_item in sec_items:
-                # print(sec_item)
-
-                title = self.__find_text(sec_item, 'span', 't')
-                if title == '':
-                    title = self.__find_text(sec_item, 'div', 'tt')
-
-                hotcount = self.__find_text(sec_item, 'span', 'e')
-                if hotcount is None:
-                    hotcount = self.__find_text(sec_item, 'div', 'ss')
-
-                item_dict = {
-                    'title': title if title else '',
-                    'link': self.__extract_link(sec_item),
-                    'hotcount': hotcount if hotcount else '',
-                    'platform': platform if platform else '',
-                    'slist': slist if slist else '',
-                    'rectime': rectime.strftime('%Y-%m-%d %H:%M:%S') if rectime else ''
-                }
-                item_list.append(item_dict)
+            yield platform, slist, time_text, self.__items_bs4(fir_item)
 
-        return item_list
+    def __items_bs4(self, fir_item):
+        """
+        Walks the items of a cc-cd block with BeautifulSoup.
+
+        Args:
+            fir_item (Tag): The cc-cd block.
+
+        Yields:
+            tuple: (title, link, hotcount) of each item.
+        """
+        for sec_item in fir_item.find_all('a', target="_blank"):
+            title = self.__find_text(sec_item, 'span', 't')
+            if title == '':
+                title = self.__find_text(sec_item, 'div', 'tt')
+
+            hotcount = self.__find_text(sec_item, 'span', 'e')
+            if hotcount == '':
+                hotcount = self.__find_text(sec_item, 'div', 'ss')
+
+            yield title, self.__extract_link(sec_item), hotcount
+
+    def __blocks_lxml(self, text):
+        """
+        Walks the cc-cd blocks of a page with lxml, reading every field with one
+        precompiled XPath evaluation.
+
+        Args:
+            text (str): HTML text to parse.
+
+        Yields:
+            tuple: (platform, slist, time_text, items), where items yields (title, link, hotcount).
+        """
+        xpaths = _lxml_xpaths()
+        root = xpaths['parse'](text) if text.strip() else None
+        if root is None:
+            return
+
+        for fir_item in xpaths['blocks'](root):
+            platform = xpaths['platform'](fir_item).strip()
+            slist = xpaths['slist'](fir_item).strip()
+            if self.subscription is not None and (platform, slist) not in self.subscription:
+                continue
+            time_text = xpaths['time'](fir_item).strip()
+            yield platform, slist, time_text, self.__items_lxml(fir_item, xpaths)
+
+    def __items_lxml(self, fir_item, xpaths):
+        """
+        Walks the items of a cc-cd block with lxml.
+
+        Args:
+            fir_item (Element): The cc-cd block.
+            xpaths (dict): The precompiled XPath expressions.
+
+        Yields:
+            tuple: (title, link, hotcount) of each item.
+        """
+        for sec_item in xpaths['items'](fir_item):
+            title = xpaths['title'](sec_item).strip() or xpaths['title_fallback'](sec_item).strip()
+            hotcount = xpaths['hotcount'](sec_item).strip() or xpaths['hotcount_fallback'](sec_item).strip()
+            yield title, self.__extract_link(sec_item), hotcount
+
+    def iter_info(self, pages):
+        """
+        Parses a stream of fetched pages one page at a time.
+
+        Each page gets its own small parse tree, so parsing can start while the crawl is
+        still running and no page is kept once its records have been yielded. Relative times
+        are counted back from the time each page was fetched.
+
+        Args:
+            pages (iterable): FetchResult objects, e.g. from Crawl.iter_all_info().
+                              Pages without a body (failed or unchanged) are skipped.
+
+        Yields:
+            list: The records extracted from one page.
+        """
+        for page in pages:
+            if page.body is None:
+                continue
+            records = self.extract_info(page.body, now=page.fetched_at)
+            self.metrics.incr('rows_extracted', len(records), category=page.category)
+            yield records
+
+    def extract_parallel(self, pages, processes=None, chunksize=16):
+        """
+        Parses pages over a pool of worker processes, one chunk of pages per task.
+
+        The pages are ordered by (category, page) before they are split into chunks, and the
+        records come back in that order whatever the completion order of the workers is.
+
+        Args:
+            pages (iterable): FetchResult objects, e.g. from Crawl.iter_all_info().
+                              Pages without a body (failed or unchanged) are skipped.
+            processes (int): Number of worker processes. Defaults to the number of CPUs.
+            chunksize (int): Number of pages sent to a worker in one task.
+
+        Returns:
+            list: A list of Record items containing extracted information.
+        """
+        pages = sorted((page for page in pages if page.body is not None), key=lambda page: (page.category, page.page))
+        # 只把页面正文及抓取时间发送给子进程
+        chunks = [[(page.body, page.fetched_at) for page in pages[i:i + chunksize]]
+                  for i in range(0, len(pages), chunksize)]
+        if not chunks:
+            return []
+
+        start = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            results = executor.map(_extract_chunk, itertools.repeat(self.engine),
+                                   itertools.repeat(self.subscription), chunks)
+            page_records = [records for chunk in results for records in chunk]
+
+        # 子进程中的指标不会回传，在主进程中按类别补记
+        self.metrics.observe('parse_parallel_seconds', time.perf_counter() - start, engine=self.engine)
+        for page, records in zip(pages, page_records):
+            self.metrics.incr('rows_extracted', len(records), category=page.category)
+        return [item for records in page_records for item in records]
 
     def __find_text(self, parent, tag, class_name):
         """
@@ -94,41 +397,21 @@ class Extract(object):
         link = element.get('href')
         return f'https://tophub.today{link}' if link else ''
 
-    def __cal_time(self, past_time):
+    def __cal_time(self, past_time, now):
         """
         Calculates the datetime object from a relative time string.
 
         Args:
             past_time (str): The relative time string.
+            now (datetime): The reference time relative times are counted back from.
 
         Returns:
             datetime: The calculated datetime object.
         """
-        now = datetime.now()
-        past_time = past_time.strip()
-
-        if past_time.endswith("前"):
-            time_units = {
-                '小时': 'hours',
-                '分钟': 'minutes',
-                '天': 'days',
-                '秒': 'seconds'
-            }
-            for unit, kwarg in time_units.items():
-                if unit in past_time:
-                    time_diff = int(past_time.split(unit)[0].strip())
-                    past_time_obj = now - timedelta(**{kwarg: time_diff})
-                    break
-            else:
-                raise ValueError("无法识别的时间单位")
-        else:
-            try:
-                past_time_obj = datetime.strptime(past_time, '%Y-%m-%d')
-                past_time_obj = past_time_obj.replace(hour=0, minute=0, second=0, microsecond=0)
-            except ValueError:
-                raise ValueError("无效的时间格式")
-
-        return past_time_obj.replace(microsecond=0)
+        parsed = _parse_time_text(past_time.strip())
+        if isinstance(parsed, timedelta):
+            return (now - parsed).replace(microsecond=0)
+        return parsed
 
 # 使用示例
 if __name__ == "__main__":
@@ -1,28 +1,134 @@
-import schedule
+import logging
+import os
+import threading
 import time
+from datetime import datetime
+from cluster import StoryIndex
 from crawl import Crawl
+from daemon import Daemon
+from metrics import REGISTRY
+from ratelimit import AimdLimiter, RetryPolicy, TokenBucket
 from extract import Extract
 from store import Store
+from subscribe import BoardMap, Subscription
+from trend import TrendEngine
+from writebehind import WriteBehind
 
-def job():
-    crawl = Crawl()
-    all_text = crawl.get_all_info_async()
+logger = logging.getLogger('main')
 
-    extract = Extract()
-    info = extract.extract_info(all_text)
-    print(info)
-    print('获得的数据总量是:{}'.format(len(info)))
+class Pipeline(object):
+    """
+    Pipeline holds the objects reused by the scheduled jobs of the whole process, so
+    connection pools, caches, rate limits and indexes stay warm between runs. Nothing is
+    created or started before it is instantiated, so importing this module has no side effects.
 
-    store = Store(info)
-    store.mode_excel('热搜数据.xlsx')
-    store.mode_mysql('HotSearch','hot_search')
+    Methods:
+        job(category): Crawls, extracts and stores one category.
+        shutdown(): Writes what is pending and closes the sinks.
+    """
 
-# 每隔一个小时运行一次
-schedule.every(1).hours.do(job)
+    def __init__(self):
+        """
+        Creates the crawler, the extractor, the indexes and the write-behind sinks.
+        """
+        # 爬取和解析对象在整个进程中复用，保留连接池、缓存和限速状态
+        self.crawl = Crawl(page_count_path='page_counts.json', rate_limiter=TokenBucket(rate=10, burst=20),
+                           limiter=AimdLimiter(initial=4, maximum=8), retry=RetryPolicy())
+        # 存在订阅文件时只解析订阅的榜单，并只爬取这些榜单所在的页面
+        self.subscription = Subscription.from_file('Subscription.txt') if os.path.exists('Subscription.txt') else None
+        self.board_map = BoardMap('board_map.json')
+        self.extract = Extract(engine='lxml', subscription=self.subscription)
+        self.catalog_lock = threading.Lock()
+        # 跨平台、跨榜单的同一新闻聚合为同一个故事，索引跨运行保留；每小时清理一次一周未出现的故事
+        self.stories = StoryIndex('story_index')
+        self.prune_interval = 3600
+        self.last_prune = time.monotonic()
+        self.prune_lock = threading.Lock()
+        # 各条目在最近若干次快照中的排名及热度变化
+        self.trends = TrendEngine()
+        # 各存储端由各自的后台线程分批写入，爬取不再等待存储；写入失败的数据暂存在spill目录中，恢复后重放
+        self.sinks = [
+            WriteBehind('parquet', lambda records, scope, crawltime:
+                        Store(records, crawltime=crawltime).mode_parquet('热搜数据')),
+            WriteBehind('index', lambda records, scope, crawltime:
+                        Store(records, crawltime=crawltime).mode_index('search_index')),
+            WriteBehind('mysql', lambda records, scope, crawltime:
+                        Store(records).mode_mysql('HotSearch', 'hot_search', upsert=True, scope=scope)),
+        ]
 
-# 初次运行
-job()
+    def job(self, category):
+        """
+        Crawls, extracts and stores one category.
 
-while True:
-    schedule.run_pending()
-    time.sleep(1)
+        Args:
+            category (str): The category to crawl.
+        """
+        # catalog依赖pandas，只在运行任务时导入
+        from catalog import iter_record_chunks, update_catalog
+
+        before = REGISTRY.summary(category=category)
+
+        # 按实际页数爬取，页数每天重新探测一次
+        self.crawl.discover_pages(categories=[category])
+
+        pages = None
+        if self.subscription is not None:
+            plan = self.board_map.plan(self.subscription)
+            if plan is not None:
+                pages = {category: plan.get(category, [])}
+
+        # 边爬取边解析，每页解析完即释放原始HTML
+        info = []
+        fetched = self.board_map.observe(self.crawl.iter_all_info(categories=[category], pages=pages))
+        for records in self.extract.iter_info(fetched):
+            info.extend(records)
+        self.board_map.save()
+
+        # 故事编号随数据写入各存储端
+        stories = self.stories.assign(info)
+        info = [record._replace(story_id=story) for record, story in zip(info, stories)]
+        with self.prune_lock:
+            prune = time.monotonic() - self.last_prune >= self.prune_interval
+            if prune:
+                self.last_prune = time.monotonic()
+        if prune:
+            self.stories.prune()
+        self.stories.save()
+        logger.info('%s: 共有%d个故事出现在3个及以上平台', category,
+                    len(self.stories.trending_everywhere(min_platforms=3)))
+
+        self.trends.update(info)
+        self.trends.expire()
+        for trend in self.trends.top_risers(3):
+            logger.info('上升最快：%s %s %s，每小时+%.0f', trend['platform'], trend['slist'], trend['title'],
+                        trend['velocity'])
+        logger.info('%s获得的数据总量是:%d', category, len(info))
+
+        # 各存储端使用同一个爬取时间，排队或重放后写入也不改变
+        crawltime = datetime.now()
+        for sink in self.sinks:
+            sink.put(info, scope=category, crawltime=crawltime)
+
+        # 将本次出现的榜单合并到目录中
+        with self.catalog_lock:
+            update_catalog(iter_record_chunks(info))
+
+        # 本次运行的指标，以及进程启动以来的累计指标
+        REGISTRY.write(f'metrics_{category}.json', REGISTRY.since(before, category=category))
+        REGISTRY.export('metrics.prom')
+
+    def shutdown(self):
+        """
+        Writes what is pending, closes the sinks and saves the story index.
+        """
+        for sink in self.sinks:
+            sink.close()
+        Store.close_connections()
+        self.stories.prune()
+        self.stories.save()
+
+# 各类别按各自的间隔运行，直到收到停止信号
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    pipeline = Pipeline()
+    Daemon(pipeline.job, on_shutdown=pipeline.shutdown).run()
@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class Metrics(object):
+    """
+    Metrics collects counters and timings of the crawl, parse and store stages in memory
+    and exports them as a JSON file or in the Prometheus text format.
+
+    Every series has a name and optional labels, e.g. fetch_ttfb_seconds{category=...}.
+    Timings keep their count, total, minimum and maximum. A disabled registry returns
+    right away from every call.
+
+    Methods:
+        incr(name, value, **labels): Adds to a counter.
+        observe(name, seconds, **labels): Records a timing.
+        timer(name, **labels): Context manager timing its block.
+        summary(**labels): Returns the series, optionally only those with the given labels.
+        since(previous, **labels): Returns what was recorded after an earlier summary.
+        reset(): Clears every series.
+        export(path, **labels): Writes the series to a .json or .prom file.
+        write(path, summary): Writes a given summary to a .json or .prom file.
+    """
+
+    PREFIX = 'hotsearch_'
+
+    def __init__(self, enabled=True):
+        """
+        Initializes an empty registry.
+
+        Args:
+            enabled (bool): Whether anything is recorded.
+        """
+        self.enabled = enabled
+        self.counters = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def incr(self, name, value=1, **labels):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The counter name.
+            value (int): The amount to add.
+            **labels (str): The labels of the series.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Records a timing.
+
+        Args:
+            name (str): The timer name, ending in _seconds.
+            seconds (float): The measured duration.
+            **labels (str): The labels of the series.
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            stats = self.timers.get(key)
+            if stats is None:
+                self.timers[key] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = min(stats[2], seconds)
+                stats[3] = max(stats[3], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Times the enclosed block, including when it raises.
+
+        Args:
+            name (str): The timer name, ending in _seconds.
+            **labels (str): The labels of the series.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def summary(self, **labels):
+        """
+        Returns the recorded series.
+
+        Args:
+            **labels (str): Only return the series carrying these label values, e.g. one category.
+
+        Returns:
+            dict: {'counters': [{'name', 'labels', 'value'}],
+                   'timers': [{'name', 'labels', 'count', 'total', 'mean', 'min', 'max'}]}.
+        """
+        wanted = set(labels.items())
+        with self.lock:
+            counters = sorted(self.counters.items())
+            timers = sorted((key, list(stats)) for key, stats in self.timers.items())
+
+        return {
+            'counters': [{'name': name, 'labels': dict(series_labels), 'value': value}
+                         for (name, series_labels), value in counters if wanted <= set(series_labels)],
+            'timers': [{'name': name, 'labels': dict(series_labels), 'count': count, 'total': total,
+                        'mean': total / count, 'min': low, 'max': high}
+                       for (name, series_labels), (count, total, low, high) in timers
+                       if wanted <= set(series_labels)],
+        }
+
+    def since(self, previous, **labels):
+        """
+        Returns what was recorded after an earlier summary, e.g. the figures of one run.
+        Timings only keep their count, total and mean, as the extremes of a range cannot be
+        told apart from the earlier ones.
+
+        Args:
+            previous (dict): An earlier result of summary() with the same labels.
+            **labels (str): Only return the series carrying these label values.
+
+        Returns:
+            dict: A summary with the counters and timings added since previous.
+        """
+        def key(series):
+            return series['name'], tuple(sorted(series['labels'].items()))
+
+        counters = {key(series): series['value'] for series in previous['counters']}
+        timers = {key(series): (series['count'], series['total']) for series in previous['timers']}
+        current = self.summary(**labels)
+
+        delta = {'counters': [], 'timers': []}
+        for series in current['counters']:
+            value = series['value'] - counters.get(key(series), 0)
+            if value:
+                delta['counters'].append(dict(series, value=value))
+        for series in current['timers']:
+            count, total = timers.get(key(series), (0, 0.0))
+            if series['count'] > count:
+                total = series['total'] - total
+                count = series['count'] - count
+                delta['timers'].append({'name': series['name'], 'labels': series['labels'], 'count': count,
+                                        'total': total, 'mean': total / count})
+        return delta
+
+    def reset(self):
+        """
+        Clears every series.
+        """
+        with self.lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def export(self, path, **labels):
+        """
+        Writes the series to a file, replacing it atomically. Files ending in .prom get the
+        Prometheus text format (e.g. for the node_exporter textfile collector), others JSON.
+
+        Args:
+            path (str): The path of the file.
+            **labels (str): Only export the series carrying these label values.
+        """
+        self.write(path, self.summary(**labels))
+
+    def write(self, path, summary):
+        """
+        Writes a summary to a file, in the same formats as export().
+
+        Args:
+            path (str): The path of the file.
+            summary (dict): A result of summary() or since().
+        """
+        if path.endswith('.prom'):
+            content = self.__to_prometheus(summary)
+        else:
+            content = json.dumps(summary, ensure_ascii=False, indent=2)
+
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def __to_prometheus(self, summary):
+        """
+        Formats a summary in the Prometheus text exposition format.
+
+        Args:
+            summary (dict): The result of summary().
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        typed = set()
+
+        def add(name, kind, labels, value):
+            name = self.PREFIX + name
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{self.__format_labels(labels)} {value}")
+
+        for series in summary['counters']:
+            add(series['name'], 'counter', series['labels'], series['value'])
+        for series in summary['timers']:
+            add(series['name'] + '_count', 'counter', series['labels'], series['count'])
+            add(series['name'] + '_sum', 'counter', series['labels'], repr(series['total']))
+            if 'max' in series:
+                add(series['name'] + '_max', 'gauge', series['labels'], repr(series['max']))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def __format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for value in labels.values())
+        return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+# 进程内共享的默认指标
+REGISTRY = Metrics()
@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+
+class TokenBucket(object):
+    """
+    TokenBucket limits the request rate: tokens are added at a fixed rate up to the bucket
+    size, and every request takes one token, waiting for it when the bucket is empty.
+
+    Methods:
+        acquire(): Takes a token, blocking until one is available.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Initializes a full bucket.
+
+        Args:
+            rate (float): Tokens added per second, i.e. the sustained requests per second.
+            burst (int): Size of the bucket, i.e. the number of requests allowed at once.
+                         Defaults to one second worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token, blocking until one is available.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AimdLimiter(object):
+    """
+    AimdLimiter adapts the number of concurrent requests with additive increase /
+    multiplicative decrease: the limit grows by about one request per round of fast
+    successful responses, and is cut by a factor on a throttling or server error (429/5xx),
+    on a connection failure, or when a response is slower than the latency target.
+
+    Methods:
+        acquire(): Waits for a free request slot.
+        release(status, latency): Frees the slot and adapts the limit to the outcome.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=32, latency_target=2.0, decrease=0.5):
+        """
+        Initializes the limiter.
+
+        Args:
+            initial (int): Initial concurrency limit.
+            minimum (int): Lowest concurrency limit.
+            maximum (int): Highest concurrency limit.
+            latency_target (float): Seconds above which a response counts as slow.
+            decrease (float): Factor applied to the limit on a bad response.
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Waits until fewer requests than the current limit are running, then takes a slot.
+        """
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, status, latency):
+        """
+        Frees a slot and adapts the limit to the outcome of the request.
+
+        Args:
+            status (int): The HTTP status code, or None if no response was received.
+            latency (float): Seconds spent on the request.
+        """
+        with self.condition:
+            self.active -= 1
+            if status is None or status == 429 or status >= 500 or latency > self.latency_target:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+class RetryPolicy(object):
+    """
+    RetryPolicy decides which failed fetches are retried and how long to wait before each
+    retry, using exponential backoff with full jitter.
+
+    Methods:
+        should_retry(status, attempt): Tells whether a failed attempt should be retried.
+        delay(attempt): Returns the jittered wait before the next attempt.
+    """
+
+    def __init__(self, retries=3, base_delay=0.5, max_delay=10.0, statuses=(429, 500, 502, 503, 504)):
+        """
+        Initializes the policy.
+
+        Args:
+            retries (int): Maximum number of retries after the first attempt.
+            base_delay (float): Backoff before the first retry, in seconds.
+            max_delay (float): Upper bound of a single backoff, in seconds.
+            statuses (tuple): HTTP status codes that are retried; connection errors always are.
+        """
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = frozenset(statuses)
+
+    def should_retry(self, status, attempt):
+        """
+        Tells whether a failed attempt should be retried.
+
+        Args:
+            status (int): The HTTP status code, or None if no response was received.
+            attempt (int): Number of attempts made so far.
+
+        Returns:
+            bool: True if another attempt should be made.
+        """
+        return attempt <= self.retries and (status is None or status in self.statuses)
+
+    def delay(self, attempt):
+        """
+        Returns the wait before the next attempt.
+
+        Args:
+            attempt (int): Number of attempts made so far.
+
+        Returns:
+            float: Seconds to wait, drawn uniformly up to the exponential backoff.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
@@ -0,0 +1,636 @@
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 建索引及查询前去掉的空白及标点
+_NOISE_PATTERN = re.compile(r'[\W_]+')
+
+# 同一目录的写入及合并在进程内串行
+_WRITE_LOCKS = {}
+_WRITE_LOCKS_GUARD = threading.Lock()
+
+def normalize(text):
+    """
+    Lowercases a text and drops whitespace and punctuation.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        str: The normalized text.
+    """
+    return _NOISE_PATTERN.sub('', text or '').lower()
+
+def tokenize(text):
+    """
+    Splits a normalized text into the terms it is indexed under: every character and every
+    pair of adjacent characters, which suits Chinese titles without word boundaries.
+
+    Args:
+        text (str): The normalized text.
+
+    Returns:
+        set: The terms.
+    """
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+def query_terms(text):
+    """
+    Picks the terms to look up for a normalized query: its character pairs, or the single
+    character of a one-character query.
+
+    Args:
+        text (str): The normalized query.
+
+    Returns:
+        set: The terms.
+    """
+    return {text} if len(text) == 1 else {text[i:i + 2] for i in range(len(text) - 1)}
+
+def encode_varints(values):
+    """
+    Encodes unsigned integers as LEB128 varints, 7 bits per byte, in one vectorized pass.
+
+    Args:
+        values (ndarray): The integers.
+
+    Returns:
+        tuple: (encoded bytes as a uint8 array, number of bytes of each value).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+
+    offsets = np.cumsum(sizes) - sizes
+    encoded = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > k
+        byte = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        byte |= np.where(sizes[mask] > k + 1, np.uint64(0x80), np.uint64(0))
+        encoded[offsets[mask] + k] = byte
+    return encoded, sizes
+
+def decode_varints(data):
+    """
+    Decodes LEB128 varints in one vectorized pass.
+
+    Args:
+        data (buffer): The encoded bytes.
+
+    Returns:
+        ndarray: The integers as uint64.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not len(data):
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    positions = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    shifted = (data & 0x7f).astype(np.uint64) << (np.uint64(7) * positions.astype(np.uint64))
+    return np.add.reduceat(shifted, starts)
+
+class Segment(object):
+    """
+    Segment is one immutable part of the index, written by one add() or merge(). Its files
+    are memory-mapped, so opening it reads only the term dictionary.
+
+    Files:
+        postings.bin: The delta-encoded varint doc id list of every term, back to back.
+        terms.json: {term: [byte offset, byte length, number of docs]} and segment metadata.
+        docs.npy: Per-doc time (epoch seconds), platform id and slist id.
+        offsets.npy: Offsets of the text of every doc in text.bin.
+        text.bin: The UTF-8 "title\\x1flink" of every doc, back to back.
+    """
+
+    def __init__(self, path):
+        """
+        Opens a segment.
+
+        Args:
+            path (str): The segment directory.
+        """
+        self.path = path
+        with open(os.path.join(path, 'terms.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.terms = meta['terms']
+        self.platforms = meta['platforms']
+        self.slists = meta['slists']
+        self.min_time = meta['min_time']
+        self.max_time = meta['max_time']
+        self.size = meta['size']
+
+        docs = np.load(os.path.join(path, 'docs.npy'), mmap_mode='r')
+        self.times = docs['time']
+        self.platform_ids = docs['platform']
+        self.slist_ids = docs['slist']
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.postings = self.__map(os.path.join(path, 'postings.bin'))
+        self.text = self.__map(os.path.join(path, 'text.bin'))
+
+    @staticmethod
+    def __map(path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def docs(self, term):
+        """
+        Returns the doc ids of a term.
+
+        Args:
+            term (str): The term.
+
+        Returns:
+            ndarray: The sorted doc ids, empty if the term does not occur.
+        """
+        entry = self.terms.get(term)
+        if entry is None:
+            return np.empty(0, dtype=np.int64)
+        offset, length, _ = entry
+        return np.cumsum(decode_varints(self.postings[offset:offset + length])).astype(np.int64)
+
+    def document(self, doc):
+        """
+        Returns a stored doc.
+
+        Args:
+            doc (int): The doc id.
+
+        Returns:
+            dict: title, link, platform, slist and time (datetime) of the doc.
+        """
+        title, _, link = bytes(self.text[self.offsets[doc]:self.offsets[doc + 1]]).decode('utf-8').partition('\x1f')
+        return {
+            'title': title,
+            'link': link,
+            'platform': self.platforms[self.platform_ids[doc]],
+            'slist': self.slists[self.slist_ids[doc]],
+            'time': datetime.fromtimestamp(int(self.times[doc])),
+        }
+
+    def close(self):
+        """
+        Unmaps the files of the segment, so that they can be deleted (Windows refuses to
+        delete a mapped file).
+        """
+        for data in (self.postings, self.text):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        # 释放对docs.npy及offsets.npy内存映射的引用，映射随之关闭
+        self.times = self.platform_ids = self.slist_ids = self.offsets = None
+
+    @staticmethod
+    def write(path, docs):
+        """
+        Writes a segment.
+
+        Args:
+            path (str): The segment directory to create.
+            docs (list): (time in epoch seconds, platform, slist, title, link) of every doc.
+        """
+        platforms, slists = {}, {}
+        table = np.zeros(len(docs), dtype=[('time', np.int64), ('platform', np.int32), ('slist', np.int32)])
+        table['time'] = [doc[0] for doc in docs]
+        table['platform'] = [platforms.setdefault(doc[1], len(platforms)) for doc in docs]
+        table['slist'] = [slists.setdefault(doc[2], len(slists)) for doc in docs]
+
+        # 正文
+        texts = [f"{doc[3]}\x1f{doc[4] or ''}".encode('utf-8') for doc in docs]
+        offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+
+        # 每个(词, 文档)对
+        term_index, term_list, term_ids, doc_ids = {}, [], [], []
+        for doc_id, doc in enumerate(docs):
+            for term in tokenize(normalize(doc[3])):
+                index = term_index.get(term)
+                if index is None:
+                    index = term_index[term] = len(term_list)
+                    term_list.append(term)
+                term_ids.append(index)
+                doc_ids.append(doc_id)
+
+        Segment.__write_files(path, table, list(platforms), list(slists), b''.join(texts), offsets,
+                              term_list, np.array(term_ids, dtype=np.int64), np.array(doc_ids, dtype=np.int64))
+
+    @staticmethod
+    def merge(path, segments):
+        """
+        Writes the docs of several segments as one segment, in time order. The doc tables,
+        texts and postings are copied in bulk; no doc is decoded or re-tokenized.
+
+        Args:
+            path (str): The segment directory to create.
+            segments (list): The segments to merge.
+        """
+        platforms, slists, term_index, term_list = {}, {}, {}, []
+        tables, texts, lengths, term_ids, doc_ids = [], [], [], [], []
+        base = 0
+        for segment in segments:
+            # 各分段的平台、榜单及词编号映射到合并后的编号
+            platform_map = np.array([platforms.setdefault(name, len(platforms)) for name in segment.platforms],
+                                    dtype=np.int32)
+            slist_map = np.array([slists.setdefault(name, len(slists)) for name in segment.slists], dtype=np.int32)
+            table = np.zeros(segment.size, dtype=[('time', np.int64), ('platform', np.int32), ('slist', np.int32)])
+            table['time'] = segment.times
+            table['platform'] = platform_map[segment.platform_ids] if segment.size else []
+            table['slist'] = slist_map[segment.slist_ids] if segment.size else []
+            tables.append(table)
+            texts.append(bytes(segment.text))
+            lengths.append(np.diff(segment.offsets))
+
+            # 各词的倒排表在文件中首尾相连，整体解码后按词分组还原差分
+            entries = sorted(segment.terms.items(), key=lambda entry: entry[1][0])
+            counts = np.array([entry[1][2] for entry in entries], dtype=np.int64)
+            deltas = decode_varints(segment.postings).astype(np.int64)
+            totals = np.cumsum(deltas)
+            starts = np.cumsum(counts) - counts
+            doc_ids.append(totals - np.repeat(totals[starts] - deltas[starts], counts) + base)
+            ids = []
+            for term, _ in entries:
+                index = term_index.get(term)
+                if index is None:
+                    index = term_index[term] = len(term_list)
+                    term_list.append(term)
+                ids.append(index)
+            term_ids.append(np.repeat(np.array(ids, dtype=np.int64), counts))
+            base += segment.size
+
+        table = np.concatenate(tables)
+        text = np.frombuffer(b''.join(texts), dtype=np.uint8)
+        lengths = np.concatenate(lengths)
+        doc_ids = np.concatenate(doc_ids)
+
+        # 分段的时间范围可能重叠，按时间重排文档及正文，倒排表中的编号随之更新
+        order = np.argsort(table['time'], kind='stable')
+        if (order != np.arange(len(order))).any():
+            old_starts = np.cumsum(lengths) - lengths
+            table, lengths = table[order], lengths[order]
+            new_starts = np.cumsum(lengths) - lengths
+            text = text[np.repeat(old_starts[order] - new_starts, lengths) + np.arange(int(lengths.sum()))]
+            new_ids = np.empty(len(order), dtype=np.int64)
+            new_ids[order] = np.arange(len(order))
+            doc_ids = new_ids[doc_ids]
+
+        offsets = np.zeros(len(table) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        Segment.__write_files(path, table, list(platforms), list(slists), text.tobytes(), offsets,
+                              term_list, np.concatenate(term_ids), doc_ids)
+
+    @staticmethod
+    def __write_files(path, table, platforms, slists, text, offsets, term_list, term_ids, doc_ids):
+        """
+        Writes the files of a segment to a temporary directory and renames it into place.
+
+        Args:
+            path (str): The segment directory to create.
+            table (ndarray): time, platform id and slist id of every doc.
+            platforms (list): The platform names, by id.
+            slists (list): The slist names, by id.
+            text (bytes): The texts of every doc, back to back.
+            offsets (ndarray): Offsets of every text in text, plus the total length.
+            term_list (list): The terms, by id.
+            term_ids (ndarray): Term id of every (term, doc) pair.
+            doc_ids (ndarray): Doc id of every (term, doc) pair.
+        """
+        temp_path = f"{path}.tmp"
+        os.makedirs(temp_path)
+        with open(os.path.join(temp_path, 'text.bin'), 'wb') as f:
+            f.write(text)
+
+        # 倒排表：按(词, 文档)排序后对文档编号做差分，再整体编码为varint
+        terms = {}
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids = term_ids[order], doc_ids[order]
+        first = np.ones(len(term_ids), dtype=bool)
+        first[1:] = term_ids[1:] != term_ids[:-1]
+        deltas = doc_ids.copy()
+        deltas[1:] -= np.where(first[1:], 0, doc_ids[:-1])
+        encoded, sizes = encode_varints(deltas)
+        with open(os.path.join(temp_path, 'postings.bin'), 'wb') as f:
+            f.write(encoded.tobytes())
+
+        byte_offsets = np.concatenate(([0], np.cumsum(sizes)))
+        starts = np.flatnonzero(first)
+        stops = np.concatenate((starts[1:], [len(term_ids)]))
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            offset = int(byte_offsets[start])
+            terms[term_list[term_ids[start]]] = [offset, int(byte_offsets[stop]) - offset, stop - start]
+
+        times = table['time']
+        np.save(os.path.join(temp_path, 'docs.npy'), table)
+        np.save(os.path.join(temp_path, 'offsets.npy'), offsets)
+        meta = {
+            'size': len(table),
+            'min_time': int(times.min()) if len(table) else 0,
+            'max_time': int(times.max()) if len(table) else 0,
+            'platforms': platforms,
+            'slists': slists,
+            'terms': terms,
+        }
+        with open(os.path.join(temp_path, 'terms.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+class SearchIndex(object):
+    """
+    SearchIndex is an embedded inverted index over the stored titles, for keyword lookups
+    such as "every board where X appeared in the last week" without scanning every row.
+
+    Titles are indexed by characters and character pairs, which handles Chinese. Every
+    add() writes a new immutable segment under root_dir. Segments are merged by size tier:
+    a segment of n docs is in tier floor(log(n) / log(merge_factor)), and once a tier holds
+    merge_factor segments they are merged into one of the next tier. Each doc is therefore
+    rewritten about once per tier, a logarithmic number of times, however many runs are
+    added. Postings are delta-encoded varints read through mmap, and segments outside the
+    queried time range are skipped whole.
+
+    Methods:
+        add(records, crawltime): Indexes the records of a run as a new segment.
+        search(query, platform, slist, start, end, limit): Finds the docs whose title contains a keyword.
+        boards(query, start, end): Counts the matches of a keyword per board.
+        merge(count): Merges the smallest segments into one, e.g. to compact the index by hand.
+        close(): Releases the memory-mapped segments.
+    """
+
+    def __init__(self, root_dir='search_index', merge_factor=8):
+        """
+        Initializes the index.
+
+        Args:
+            root_dir (str): The directory of the segments.
+            merge_factor (int): Number of segments of one size tier that add() merges into one.
+        """
+        self.root_dir = root_dir
+        self.merge_factor = merge_factor
+        self.segments = {}
+        self.lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+        with _WRITE_LOCKS_GUARD:
+            self.write_lock = _WRITE_LOCKS.setdefault(os.path.abspath(root_dir), threading.RLock())
+
+    def __segment_names(self):
+        return sorted(name for name in os.listdir(self.root_dir)
+                      if name.startswith('seg-') and not name.endswith('.tmp'))
+
+    def __open_segments(self):
+        """
+        Opens the segments added since the last call and forgets the merged ones.
+
+        Returns:
+            list: The open segments, oldest first.
+        """
+        with self.lock:
+            names = self.__segment_names()
+            for name in set(self.segments) - set(names):
+                self.segments.pop(name).close()
+            for name in names:
+                if name not in self.segments:
+                    self.segments[name] = Segment(os.path.join(self.root_dir, name))
+            return [self.segments[name] for name in names]
+
+    def add(self, records, crawltime=None):
+        """
+        Indexes the records of a run as a new segment.
+
+        Args:
+            records (iterable): Record items (or dicts) with title, link, platform and slist.
+            crawltime (datetime): The time the records were seen. Defaults to now.
+
+        Returns:
+            int: Number of indexed records.
+        """
+        timestamp = int((crawltime or datetime.now()).timestamp())
+        docs = [(timestamp, record['platform'] or '', record['slist'] or '', record['title'] or '', record['link'])
+                for record in records]
+        if not docs:
+            return 0
+
+        with self.write_lock:
+            name = f"seg-{timestamp:012d}-{uuid.uuid4().hex[:8]}"
+            Segment.write(os.path.join(self.root_dir, name), docs)
+            self.__merge_tiers()
+        return len(docs)
+
+    def __tier(self, size):
+        """
+        Returns the size tier of a segment, floor(log(size) / log(merge_factor)).
+        """
+        tier = 0
+        while size >= self.merge_factor:
+            size //= self.merge_factor
+            tier += 1
+        return tier
+
+    def __merge_tiers(self):
+        """
+        Merges the oldest merge_factor segments of a full size tier, as long as there is one.
+        A merged segment may fill the next tier in turn.
+        """
+        while True:
+            tiers = {}
+            for segment in self.__open_segments():
+                tiers.setdefault(self.__tier(segment.size), []).append(segment)
+            full = [segments for _, segments in sorted(tiers.items()) if len(segments) >= self.merge_factor]
+            if not full:
+                return
+            # 合并失败时分段保持不变，本次不再重试，避免反复合并同一层
+            if not self.__merge(full[0][:self.merge_factor]):
+                return
+
+    def merge(self, count=None):
+        """
+        Merges the smallest segments into one, keeping the docs in time order.
+
+        Args:
+            count (int): Number of segments to merge. Defaults to all of them.
+        """
+        with self.write_lock:
+            segments = sorted(self.__open_segments(), key=lambda segment: segment.size)[:count]
+            if len(segments) >= 2:
+                self.__merge(segments)
+
+    def __merge(self, segments):
+        """
+        Replaces segments by one segment holding their docs. Called with the write lock held.
+
+        The merged segment is written under a hidden name and only published once the old
+        segments are renamed out of the way, so a search never sees a doc twice. If an old
+        segment cannot be moved (e.g. it is still mapped by another process on Windows), the
+        merge is undone and the old segments stay.
+
+        Args:
+            segments (list): The segments to merge.
+
+        Returns:
+            bool: True if the segments were replaced.
+        """
+        self.__remove_leftovers()
+        segments = sorted(segments, key=lambda segment: (segment.min_time, segment.path))
+        timestamp = max(segment.max_time for segment in segments)
+        name = f"seg-{timestamp:012d}-{uuid.uuid4().hex[:8]}"
+        merged_path = os.path.join(self.root_dir, f"mrg-{name}")
+        Segment.merge(merged_path, segments)
+        size = sum(segment.size for segment in segments)
+
+        # 先解除映射，Windows上不能移动或删除仍被映射的文件
+        with self.lock:
+            for segment in segments:
+                self.segments.pop(os.path.basename(segment.path), None)
+                segment.close()
+
+        moved = []
+        try:
+            for segment in segments:
+                deleted_path = os.path.join(self.root_dir, f"del-{os.path.basename(segment.path)}")
+                os.rename(segment.path, deleted_path)
+                moved.append((segment.path, deleted_path))
+        except OSError as e:
+            logger.error("Cannot remove merged segment %s, merge undone: %s", segment.path, e)
+            for path, deleted_path in moved:
+                os.rename(deleted_path, path)
+            shutil.rmtree(merged_path)
+            self.__open_segments()
+            return False
+
+        os.replace(merged_path, os.path.join(self.root_dir, name))
+        self.__open_segments()
+        self.__remove_leftovers()
+        logger.info("Merged %d segments, %d docs", len(segments), size)
+        return True
+
+    def __remove_leftovers(self):
+        """
+        Deletes the segments replaced by a merge, and merges interrupted before they were
+        published. Called with the write lock held.
+        """
+        for name in os.listdir(self.root_dir):
+            if name.startswith(('del-', 'mrg-')):
+                try:
+                    shutil.rmtree(os.path.join(self.root_dir, name))
+                except OSError as e:
+                    logger.error("Cannot delete %s: %s", name, e)
+
+    def __matches(self, query, platform, slist, start, end):
+        """
+        Yields the matching docs of every segment, newest segment first.
+
+        Yields:
+            tuple: (segment, doc ids) of each segment with matches, newest docs first.
+        """
+        text = normalize(query)
+        if not text:
+            return
+        terms = query_terms(text)
+        low = int(start.timestamp()) if start else None
+        high = int(end.timestamp()) if end else None
+
+        for segment in sorted(self.__open_segments(), key=lambda segment: -segment.max_time):
+            # 整段跳过时间范围之外、或不含该平台/榜单/词的分段
+            if (low is not None and segment.max_time < low) or (high is not None and segment.min_time > high):
+                continue
+            if (platform is not None and platform not in segment.platforms) or \
+                    (slist is not None and slist not in segment.slists):
+                continue
+            if any(term not in segment.terms for term in terms):
+                continue
+
+            # 从最短的倒排表开始求交集
+            docs = None
+            for term in sorted(terms, key=lambda term: segment.terms[term][2]):
+                postings = segment.docs(term)
+                docs = postings if docs is None else np.intersect1d(docs, postings, assume_unique=True)
+                if not len(docs):
+                    break
+            if not len(docs):
+                continue
+
+            mask = np.ones(len(docs), dtype=bool)
+            if low is not None:
+                mask &= segment.times[docs] >= low
+            if high is not None:
+                mask &= segment.times[docs] <= high
+            if platform is not None:
+                mask &= segment.platform_ids[docs] == segment.platforms.index(platform)
+            if slist is not None:
+                mask &= segment.slist_ids[docs] == segment.slists.index(slist)
+            docs = docs[mask]
+
+            # 字对都出现不代表关键词连续出现，逐条核对标题
+            if len(terms) > 1:
+                docs = np.array([doc for doc in docs.tolist() if text in normalize(segment.document(doc)['title'])],
+                                dtype=np.int64)
+            if len(docs):
+                yield segment, docs[::-1]
+
+    def search(self, query, platform=None, slist=None, start=None, end=None, limit=100):
+        """
+        Finds the docs whose title contains a keyword, ignoring case, spaces and punctuation.
+
+        Args:
+            query (str): The keyword.
+            platform (str): Only return docs of this platform.
+            slist (str): Only return docs of this board name.
+            start (datetime): Earliest crawl time, inclusive, or None.
+            end (datetime): Latest crawl time, inclusive, or None.
+            limit (int): Maximum number of docs, or None for all.
+
+        Returns:
+            list: dicts with title, link, platform, slist and time, newest first.
+        """
+        results = []
+        for segment, docs in self.__matches(query, platform, slist, start, end):
+            for doc in docs.tolist():
+                if limit is not None and len(results) >= limit:
+                    break
+                results.append(segment.document(doc))
+        return sorted(results, key=lambda result: result['time'], reverse=True)
+
+    def boards(self, query, start=None, end=None):
+        """
+        Counts the matches of a keyword per board, e.g. every board where it appeared last week.
+
+        Args:
+            query (str): The keyword.
+            start (datetime): Earliest crawl time, inclusive, or None.
+            end (datetime): Latest crawl time, inclusive, or None.
+
+        Returns:
+            dict: {(platform, slist): {'count': matches, 'last_seen': datetime}}.
+        """
+        boards = {}
+        for segment, docs in self.__matches(query, None, None, start, end):
+            keys = segment.platform_ids[docs].astype(np.int64) << 32 | segment.slist_ids[docs].astype(np.int64)
+            unique, first, counts = np.unique(keys, return_index=True, return_counts=True)
+            last_times = np.maximum.reduceat(segment.times[docs][np.argsort(keys, kind='stable')],
+                                             np.concatenate(([0], np.cumsum(counts)[:-1])))
+            for key, count, last in zip(unique.tolist(), counts.tolist(), last_times.tolist()):
+                board = (segment.platforms[key >> 32], segment.slists[key & 0xffffffff])
+                entry = boards.setdefault(board, {'count': 0, 'last_seen': None})
+                entry['count'] += count
+                last = datetime.fromtimestamp(last)
+                if entry['last_seen'] is None or last > entry['last_seen']:
+                    entry['last_seen'] = last
+        return boards
+
+    def close(self):
+        """
+        Releases the memory-mapped segments.
+        """
+        with self.lock:
+            for segment in self.segments.values():
+                segment.close()
+            self.segments.clear()
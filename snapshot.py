@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from crawl import FetchResult
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class SnapshotStore(object):
+    """
+    SnapshotStore keeps the raw HTML of fetched pages in a local content-addressed store, so
+    past runs can be re-processed without crawling again.
+
+    Every distinct page body is written once, compressed (zstd if the zstandard package is
+    installed, gzip otherwise), under objects/<hash[:2]>/<hash>. Each run has an index file
+    index/<run_id>.jsonl listing the category, page, hash and fetch time of its pages;
+    run ids are the run start time formatted as YYYYmmddTHHMMSS.
+
+    Methods:
+        begin_run(run_time): Starts a run and returns its id.
+        put(run_id, result): Stores the body of a fetched page under a run.
+        get(digest): Returns a stored body.
+        runs(start, end): Lists the runs started within a time range.
+        iter_pages(start, end): Yields the stored pages of the runs within a time range.
+    """
+
+    RUN_FORMAT = '%Y%m%dT%H%M%S'
+
+    def __init__(self, root='snapshots', compression=None):
+        """
+        Initializes the store.
+
+        Args:
+            root (str): The root directory of the store.
+            compression (str): 'zstd' or 'gzip'. Defaults to zstd when available.
+        """
+        self.root = root
+        self.compression = compression or ('zstd' if zstandard is not None else 'gzip')
+        if self.compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'index'), exist_ok=True)
+
+    def begin_run(self, run_time=None):
+        """
+        Starts a run.
+
+        Args:
+            run_time (datetime): The start time of the run. Defaults to now.
+
+        Returns:
+            str: The run id.
+        """
+        return (run_time or datetime.now()).strftime(self.RUN_FORMAT)
+
+    def put(self, run_id, result):
+        """
+        Stores the body of a fetched page under a run. Identical bodies are stored once.
+
+        Args:
+            run_id (str): The id returned by begin_run().
+            result (FetchResult): The fetched page; pages without a body are ignored.
+
+        Returns:
+            str: The SHA-256 hex digest of the body, or None if there was no body.
+        """
+        if result.body is None:
+            return None
+
+        data = result.body.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if self.__find_object(digest) is None:
+            path = self.__object_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(self.__compress(data))
+            os.replace(temp_path, path)
+
+        fetched_at = result.fetched_at or datetime.now()
+        entry = {
+            'category': result.category,
+            'page': result.page,
+            'hash': digest,
+            'bytes': len(data),
+            'fetched_at': fetched_at.isoformat(timespec='seconds'),
+        }
+        with self.lock:
+            with open(os.path.join(self.root, 'index', f"{run_id}.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return digest
+
+    def get(self, digest):
+        """
+        Returns a stored body.
+
+        Args:
+            digest (str): The SHA-256 hex digest of the body.
+
+        Returns:
+            str: The page HTML.
+        """
+        path = self.__find_object(digest)
+        if path is None:
+            raise KeyError(digest)
+        with open(path, 'rb') as f:
+            data = f.read()
+        return (self.__zstd_decompress(data) if path.endswith('.zst') else gzip.decompress(data)).decode('utf-8')
+
+    def runs(self, start=None, end=None):
+        """
+        Lists the runs started within a time range.
+
+        Args:
+            start (datetime): Earliest run start, inclusive, or None.
+            end (datetime): Latest run start, inclusive, or None.
+
+        Returns:
+            list: The run ids in chronological order.
+        """
+        run_ids = sorted(name[:-len('.jsonl')] for name in os.listdir(os.path.join(self.root, 'index'))
+                         if name.endswith('.jsonl'))
+        low = start.strftime(self.RUN_FORMAT) if start else ''
+        high = end.strftime(self.RUN_FORMAT) if end else '~'
+        return [run_id for run_id in run_ids if low <= run_id <= high]
+
+    def iter_pages(self, start=None, end=None):
+        """
+        Yields the stored pages of the runs started within a time range, ready for
+        Extract.iter_info() or Extract.extract_parallel().
+
+        Args:
+            start (datetime): Earliest run start, inclusive, or None.
+            end (datetime): Latest run start, inclusive, or None.
+
+        Yields:
+            FetchResult: Each stored page, with its original fetch time.
+        """
+        for run_id in self.runs(start, end):
+            with open(os.path.join(self.root, 'index', f"{run_id}.jsonl"), encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    yield FetchResult(entry['category'], entry['page'], 200, entry['bytes'], 0.0,
+                                      self.get(entry['hash']), None,
+                                      fetched_at=datetime.fromisoformat(entry['fetched_at']))
+
+    def __object_path(self, digest):
+        extension = 'zst' if self.compression == 'zstd' else 'gz'
+        return os.path.join(self.root, 'objects', digest[:2], f"{digest}.{extension}")
+
+    def __find_object(self, digest):
+        # 同一内容可能由另一种压缩方式写入过
+        for extension in ('zst', 'gz'):
+            path = os.path.join(self.root, 'objects', digest[:2], f"{digest}.{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def __compress(self, data):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=9).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    @staticmethod
+    def __zstd_decompress(data):
+        if zstandard is None:
+            raise ValueError("zstd objects require the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
@@ -1,58 +1,311 @@
-import pandas as pd
-import pymysql
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from operator import attrgetter, itemgetter
+from extract import Record, parse_hotcount
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 写入MySQL的列顺序
+MYSQL_COLUMNS = ('title', 'hotcount', 'link', 'platform', 'slist', 'rectime', 'story_id')
+
+# 数据表的索引，旧版本建的表缺少的索引由__migrate_table补上
+MYSQL_INDEXES = {
+    'uk_item_key': 'UNIQUE KEY uk_item_key (item_key)',
+    'idx_board': 'KEY idx_board (platform, slist)',
+    'idx_rectime': 'KEY idx_rectime (rectime)',
+    'idx_hotcount': 'KEY idx_hotcount (hotcount)',
+    'idx_story': 'KEY idx_story (story_id)',
+}
+
+def _row_getter(*names):
+    """
+    Builds a function reading the named fields of an item as a tuple, from a Record
+    (by attribute, without copying) or from a dict item. A dict item may leave out the
+    fields a Record has defaults for, such as story_id.
+
+    Args:
+        *names (str): The field names.
+
+    Returns:
+        callable: Function mapping an item to the tuple of its fields.
+    """
+    by_attribute = attrgetter(*names)
+    by_key = itemgetter(*names)
+    defaults = {name: value for name, value in Record._field_defaults.items() if name in names}
+    if defaults:
+        return lambda post: by_attribute(post) if isinstance(post, tuple) else by_key({**defaults, **post})
+    return lambda post: by_attribute(post) if isinstance(post, tuple) else by_key(post)
+
+class SnapshotIndex(object):
+    """
+    SnapshotIndex remembers the items of the last stored snapshot of a table, so that the
+    next snapshot only writes new items and items whose hotcount changed.
+
+    Items are keyed on (platform, slist, title, link); the fingerprint covers the content
+    that may change between runs while the key stays the same.
+
+    Methods:
+        item_key(post): Returns the key of an item.
+        fingerprint(post): Returns the content fingerprint of an item.
+        diff(data_list): Returns the changed items and the snapshot to remember once they are stored.
+        replace(snapshot): Makes the given snapshot the last stored one.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty index; the first snapshot is written in full.
+        """
+        self.fingerprints = {}
+
+    @staticmethod
+    def item_key(post):
+        """
+        Returns the key of an item.
+
+        Args:
+            post (dict): The item.
+
+        Returns:
+            str: Hex SHA-1 of platform, slist, title and link.
+        """
+        raw = '\x1f'.join((post['platform'], post['slist'], post['title'], post['link']))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def fingerprint(post):
+        """
+        Returns the content fingerprint of an item. The recorded time is left out since it
+        is derived from a relative time and drifts on every run.
+
+        Args:
+            post (dict): The item.
+
+        Returns:
+            bytes: 8-byte BLAKE2b digest of the hotcount.
+        """
+        return hashlib.blake2b(str(post['hotcount']).encode('utf-8'), digest_size=8).digest()
+
+    def diff(self, data_list):
+        """
+        Compares a snapshot with the last stored one. An item listed more than once counts
+        with its last occurrence.
+
+        Args:
+            data_list (list): The items of the new snapshot.
+
+        Returns:
+            tuple: (changed, snapshot), where changed lists (key, post) for new or updated items
+                   and snapshot is the key->fingerprint map to pass to replace() once stored.
+        """
+        # 同一条目出现多次时以最后一次为准，即最新的热度
+        latest = {}
+        for post in data_list:
+            latest[self.item_key(post)] = post
+
+        changed = []
+        snapshot = {}
+        for key, post in latest.items():
+            fingerprint = self.fingerprint(post)
+            if self.fingerprints.get(key) != fingerprint:
+                changed.append((key, post))
+            snapshot[key] = fingerprint
+        return changed, snapshot
+
+    def replace(self, snapshot):
+        """
+        Makes the given snapshot the last stored one.
+
+        Args:
+            snapshot (dict): The key->fingerprint map returned by diff().
+        """
+        self.fingerprints = snapshot
 
 class Store(object):
     """
-    Store is a class designed to store extracted data into MySQL and Excel.
+    Store is a class designed to store extracted data into MySQL, Excel, a Parquet archive
+    and a title search index.
+
+    MySQL connections are kept open at class level and reused by later Store instances,
+    so scheduled jobs neither reconnect nor re-run the DDL every time. Jobs running in
+    different threads take turns on the shared connections.
+
+    In upsert mode only new items and items whose hotcount changed since the last snapshot
+    are written; existing rows just get their hotcount and rectime updated. Tables created
+    by earlier versions get the item_key column and the indexes added on first use.
 
     Methods:
-        mode_mysql(db_name, tb_name): Stores data into a MySQL database.
+        mode_mysql(db_name, tb_name, upsert, scope): Stores data into a MySQL database.
         mode_excel(excel_name): Stores data into an Excel file.
+        mode_parquet(root_dir): Appends data to a date-partitioned Parquet archive.
+        mode_index(root_dir): Adds data to the title search index.
+        load_archive(root_dir, date, platform): Loads part of the Parquet archive.
+        archive_to_excel(root_dir, excel_name, date, platform): Exports part of the archive to Excel.
+        close_connections(): Closes the MySQL connections kept open across jobs.
     """
 
-    def __init__(self, data_list):
+    # 数据库连接配置
+    mysql_config = {
+        'host': 'localhost',
+        'user': 'root',
+        'passwd': 'wz131',
+        'port': 3306,
+    }
+
+    # 跨任务复用的连接、已经建好的数据表，以及每张表上一次的快照
+    _connections = {}
+    _ready_tables = set()
+    _snapshots = {}
+    # 连接不是线程安全的，守护进程中各类别的任务依次使用
+    _lock = threading.RLock()
+
+    def __init__(self, data_list, batch_size=1000, connect=None, metrics=None, crawltime=None):
         """
         Initializes the Store class with a list of data.
 
         Args:
-            data_list (list): The list of data to store.
+            data_list (list): The list of data to store, Record items or dicts with the same fields.
+            batch_size (int): Number of rows sent to MySQL in one executemany call.
+            connect (callable): DB-API connect function taking the mysql_config keywords.
+                                Defaults to pymysql.connect.
+            metrics (Metrics): Registry receiving the write timings and row counts. Defaults to metrics.REGISTRY.
+            crawltime (datetime): When the data was crawled, used for the archive partition and the
+                                  search index. Defaults to the time of the write.
         """
         self.data_list = data_list
+        self.batch_size = batch_size
+        self.connect = connect
+        self.metrics = metrics or REGISTRY
+        self.crawltime = crawltime
 
-    def mode_mysql(self, db_name, tb_name):
+    def mode_mysql(self, db_name, tb_name, upsert=False, scope=None):
         """
         Stores data into a MySQL database.
 
         Args:
             db_name (str): The name of the database.
             tb_name (str): The name of the table.
+            upsert (bool): Only write items that are new or changed since the last snapshot,
+                           updating the hotcount and rectime of rows that already exist.
+            scope (str): Name of the snapshot to compare with in upsert mode, e.g. the crawled
+                         category when categories are stored separately. Defaults to one
+                         snapshot per table.
+
+        Returns:
+            bool: True if the data was written, False if it was not (see the log).
         """
+        with Store._lock:
+            return self.__mode_mysql(db_name, tb_name, upsert, scope)
+
+    def __mode_mysql(self, db_name, tb_name, upsert, scope):
+        # pymysql只在写入MySQL时导入，其他存储方式不需要
+        import pymysql
+
         try:
-            # 连接数据库
-            self.db = pymysql.connect(host='localhost', user='root', passwd='wz131', port=3306)
+            # 获取（或新建）连接
+            self.db = self.__connection(db_name)
             self.cursor = self.db.cursor()
-            print('-连接成功-')
 
-            # 检查并创建数据库（如果不存在）
-            self.cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
-            print('-数据库已检查-')
+            # 创建数据表并补齐旧表缺少的列和索引，每个进程只执行一次；升级失败时下次任务再试
+            if (self.connect, db_name, tb_name) not in Store._ready_tables:
+                self.__create_table(tb_name)
+                if self.__migrate_table(tb_name):
+                    Store._ready_tables.add((self.connect, db_name, tb_name))
 
-            # 选择数据库
-            self.cursor.execute(f"USE {db_name}")
+            # 插入数据
+            if upsert:
+                snapshots = Store._snapshots.setdefault((self.connect, db_name, tb_name, scope), SnapshotIndex())
+                return self.__upsert(tb_name, snapshots)
+            return self.__insert(tb_name)
 
-            # 创建数据表
-            self.__create_table(tb_name)
+        except pymysql.MySQLError as e:
+            logger.error("连接数据库时出现错误：%s", e)
+            self.__drop_connection(db_name)
+            return False
 
-            # 插入数据
-            self.__insert(tb_name)
-            # print('-正在插入数据-')
+    def __connection(self, db_name):
+        """
+        Returns the open connection for the database, connecting and creating the
+        database only when there is no usable connection yet.
+
+        Args:
+            db_name (str): The name of the database.
 
-            # 关闭mysql
-            self.db.close()
-            print('-连接关闭-')
+        Returns:
+            Connection: A DB-API connection with the database selected.
+        """
+        key = (self.connect, db_name)
+        db = Store._connections.get(key)
+        if db is not None:
+            try:
+                if hasattr(db, 'ping'):
+                    db.ping(reconnect=False)
+                return db
+            except Exception:
+                self.__drop_connection(db_name)
 
-        except pymysql.MySQLError as e:
-            print(f"连接数据库时出现错误：{e}")
+        # 连接数据库
+        connect = self.connect
+        if connect is None:
+            import pymysql
+            connect = pymysql.connect
+        db = connect(**self.mysql_config)
+        cursor = db.cursor()
+        logger.info('-连接成功-')
+
+        # 检查并创建数据库（如果不存在）
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
+        logger.info('-数据库已检查-')
+
+        # 选择数据库
+        cursor.execute(f"USE {db_name}")
+        cursor.close()
+
+        Store._connections[key] = db
+        return db
+
+    def __drop_connection(self, db_name):
+        """
+        Forgets (and closes) the cached connection of a database after an error.
+
+        Args:
+            db_name (str): The name of the database.
+        """
+        db = Store._connections.pop((self.connect, db_name), None)
+        Store._ready_tables = {table for table in Store._ready_tables if table[:2] != (self.connect, db_name)}
+        Store._snapshots = {table: index for table, index in Store._snapshots.items()
+                            if table[:2] != (self.connect, db_name)}
+        if db is not None:
+            try:
+                db.close()
+            except Exception:
+                pass
+
+    @classmethod
+    def close_connections(cls):
+        """
+        Closes every MySQL connection kept open across jobs.
+        """
+        with cls._lock:
+            cls.__close_connections()
+
+    @classmethod
+    def __close_connections(cls):
+        for db in cls._connections.values():
+            try:
+                db.close()
+            except Exception:
+                pass
+        cls._connections.clear()
+        cls._ready_tables.clear()
+        cls._snapshots.clear()
+        logger.info('-连接关闭-')
 
     def __create_table(self, tb_name):
         """
@@ -61,49 +314,180 @@ class Store(object):
         Args:
             tb_name (str): The name of the table.
         """
+        import pymysql
+
         try:
             create_table_query = f"""
             CREATE TABLE IF NOT EXISTS {tb_name} (
                 ID INT AUTO_INCREMENT PRIMARY KEY,
                 title Text,
-                hotcount Text,
+                hotcount BIGINT,
                 link Text,
                 platform VARCHAR(50),
                 slist VARCHAR(50),
-                rectime DATETIME
+                rectime DATETIME,
+                item_key CHAR(40),
+                story_id BIGINT,
+                UNIQUE KEY uk_item_key (item_key),
+                KEY idx_board (platform, slist),
+                KEY idx_rectime (rectime),
+                KEY idx_hotcount (hotcount),
+                KEY idx_story (story_id)
             );
             """
             self.cursor.execute(create_table_query)
-            print('-表已检查-')
+            logger.info('-表已检查-')
 
         except pymysql.MySQLError as e:
-            print(f"创建数据表时出现错误：{e}")
+            logger.error("创建数据表时出现错误：%s", e)
+
+    def __migrate_table(self, tb_name):
+        """
+        Brings a table created by an earlier version up to the current schema, adding the
+        item_key column used by upsert mode, the story_id column and the missing indexes.
+        Rows stored before keep a NULL item_key, so the first upsert stores their items once more.
+
+        A hotcount column still holding text (tables from before hotcount was normalized)
+        cannot be indexed as is; it is left to be converted by hand.
+
+        Args:
+            tb_name (str): The name of the table.
+
+        Returns:
+            bool: True if the table has the current schema.
+        """
+        import pymysql
+
+        try:
+            self.cursor.execute(
+                "SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (tb_name,))
+            columns = {name.lower(): data_type.lower() for name, data_type in self.cursor.fetchall()}
+            self.cursor.execute(
+                "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (tb_name,))
+            indexes = {name for name, in self.cursor.fetchall()}
+
+            changes = []
+            for column, definition in (('item_key', 'CHAR(40)'), ('story_id', 'BIGINT')):
+                if column not in columns:
+                    changes.append(f'ADD COLUMN {column} {definition}')
+            for name, definition in MYSQL_INDEXES.items():
+                if name in indexes:
+                    continue
+                if name == 'idx_hotcount' and 'text' in columns.get('hotcount', ''):
+                    logger.warning('%s表的hotcount列为文本类型，未建立%s索引', tb_name, name)
+                    continue
+                changes.append(f'ADD {definition}')
+
+            if changes:
+                self.cursor.execute(f"ALTER TABLE {tb_name} {', '.join(changes)}")
+                logger.info('-表结构已升级：%s-', '，'.join(changes))
+            return True
+
+        except pymysql.MySQLError as e:
+            logger.error("升级数据表时出现错误：%s", e)
+            return False
 
     def __insert(self, tb_name):
         """
-        Inserts data into the MySQL table.
+        Inserts data into the MySQL table in batches of batch_size rows,
+        committing once after the last batch.
 
         Args:
             tb_name (str): The name of the table.
+
+        Returns:
+            bool: True if the rows were committed.
         """
+        import pymysql
+
         try:
             insert_query = f"""
-            INSERT INTO {tb_name} (title, hotcount, link, platform, slist, rectime)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO {tb_name} (title, hotcount, link, platform, slist, rectime, story_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             """
-            # 执行多条插入，每个元素是一个字典
-            for post in self.data_list:
-                self.cursor.execute(insert_query, (
-                    post['title'], post['hotcount'], post['link'],
-                    post['platform'], post['slist'], post['rectime']
-                ))
+            # executemany会把一批数据合并成一条多行INSERT语句
+            rows = map(_row_getter(*MYSQL_COLUMNS), self.data_list)
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self.__execute_batch(insert_query, batch, tb_name)
 
-            self.db.commit()
-            print('-数据插入成功-')
+            self.__commit(tb_name)
+            logger.info('-数据插入成功-')
+            return True
+
+        except pymysql.MySQLError as e:
+            logger.error("执行插入操作时出现错误：%s", e)
+            self.db.rollback()
+            return False
+
+    def __upsert(self, tb_name, snapshots):
+        """
+        Writes the items that are new or changed since the last snapshot. Rows whose key
+        already exists only get their hotcount and rectime updated.
+
+        Args:
+            tb_name (str): The name of the table.
+            snapshots (SnapshotIndex): The last stored snapshot of the table.
+
+        Returns:
+            bool: True if the rows were committed.
+        """
+        import pymysql
+
+        try:
+            changed, snapshot = snapshots.diff(self.data_list)
+            upsert_query = f"""
+            INSERT INTO {tb_name} (title, hotcount, link, platform, slist, rectime, story_id, item_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE hotcount = VALUES(hotcount), rectime = VALUES(rectime),
+                                    story_id = VALUES(story_id)
+            """
+            get_row = _row_getter(*MYSQL_COLUMNS)
+            rows = (get_row(post) + (key,) for key, post in changed)
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self.__execute_batch(upsert_query, batch, tb_name)
+
+            self.__commit(tb_name)
+            snapshots.replace(snapshot)
+            self.metrics.incr('rows_skipped', len(snapshot) - len(changed), sink='mysql')
+            logger.info('-数据写入成功，新增或变化%d条，跳过%d条-', len(changed), len(snapshot) - len(changed))
+            return True
 
         except pymysql.MySQLError as e:
-            print(f"执行插入操作时出现错误：{e}")
+            logger.error("执行写入操作时出现错误：%s", e)
             self.db.rollback()
+            return False
+
+    def __execute_batch(self, query, batch, tb_name):
+        """
+        Sends one batch of rows with executemany and records its latency.
+
+        Args:
+            query (str): The parameterized statement.
+            batch (list): The row tuples.
+            tb_name (str): The name of the table.
+        """
+        start = time.perf_counter()
+        self.cursor.executemany(query, batch)
+        self.metrics.observe('db_batch_seconds', time.perf_counter() - start, table=tb_name)
+        self.metrics.incr('rows_written', len(batch), sink='mysql')
+
+    def __commit(self, tb_name):
+        """
+        Commits the transaction and records its latency.
+
+        Args:
+            tb_name (str): The name of the table.
+        """
+        with self.metrics.timer('db_commit_seconds', table=tb_name):
+            self.db.commit()
 
     def mode_excel(self, excel_name):
         """
@@ -111,11 +495,180 @@ class Store(object):
 
         Args:
             excel_name (str): The name of the Excel file.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        try:
+            import pandas as pd
+
+            with self.metrics.timer('store_write_seconds', sink='excel'):
+                df = pd.DataFrame(self.data_list)
+                df.to_excel(excel_name, index=False)
+            self.metrics.incr('rows_written', len(df), sink='excel')
+            logger.info('数据已保存到Excel文件！')
+            return True
+
+        except Exception as e:
+            logger.error("保存到Excel文件时出现错误：%s", e)
+            return False
+
+
+    def mode_parquet(self, root_dir, row_group_size=2000):
+        """
+        Appends data to a Parquet archive partitioned by crawl date. Every run adds one file
+        under root_dir/date=YYYY-MM-DD, so earlier runs are never rewritten.
+
+        Rows are sorted by platform and slist, which are dictionary-encoded, so the row-group
+        statistics let a platform filter skip the other row groups. hotcount is stored as an
+        integer and rectime/crawltime as timestamps.
+
+        Args:
+            root_dir (str): The root directory of the archive.
+            row_group_size (int): Maximum number of rows per row group.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        try:
+            import pyarrow.parquet as pq
+
+            start = time.perf_counter()
+            crawltime = self.__crawltime()
+            table = self.__to_arrow(crawltime)
+
+            part_dir = os.path.join(root_dir, f"date={crawltime:%Y-%m-%d}")
+            os.makedirs(part_dir, exist_ok=True)
+            path = os.path.join(part_dir, f"part-{crawltime:%H%M%S}-{uuid.uuid4().hex[:8]}.parquet")
+            pq.write_table(table, path, row_group_size=row_group_size, compression='zstd')
+            self.metrics.observe('store_write_seconds', time.perf_counter() - start, sink='parquet')
+            self.metrics.incr('rows_written', table.num_rows, sink='parquet')
+            logger.info('数据已追加到归档文件：%s', path)
+            return True
+
+        except Exception as e:
+            logger.error("保存到归档文件时出现错误：%s", e)
+            return False
+
+    def mode_index(self, root_dir):
+        """
+        Adds data to the title search index (see search.SearchIndex), so keyword lookups
+        need not scan the stored rows. Every run adds one segment under root_dir.
+
+        Args:
+            root_dir (str): The directory of the index.
+
+        Returns:
+            bool: True if the segment was written.
+        """
+        try:
+            from search import SearchIndex
+
+            index = SearchIndex(root_dir)
+            try:
+                with self.metrics.timer('store_write_seconds', sink='index'):
+                    count = index.add(self.data_list, self.__crawltime())
+            finally:
+                # 释放分段的内存映射，否则Windows上之后的合并无法删除这些分段
+                index.close()
+            self.metrics.incr('rows_written', count, sink='index')
+            logger.info('数据已加入搜索索引：%s', root_dir)
+            return True
+
+        except Exception as e:
+            logger.error("保存到搜索索引时出现错误：%s", e)
+            return False
+
+    def __crawltime(self):
+        """
+        Returns the crawl time of the data, to the second.
+        """
+        return (self.crawltime or datetime.now()).replace(microsecond=0)
+
+    def __to_arrow(self, crawltime):
+        """
+        Converts the data to a typed Arrow table.
+
+        Args:
+            crawltime (datetime): The time of the run, stored with every row.
+
+        Returns:
+            pyarrow.Table: The table in the archive schema.
+        """
+        import pyarrow as pa
+
+        def to_int(value):
+            return parse_hotcount(value) if isinstance(value, str) else value
+
+        def to_datetime(value):
+            if isinstance(value, str):
+                return datetime.strptime(value, '%Y-%m-%d %H:%M:%S') if value else None
+            return value
+
+        names = ('title', 'link', 'hotcount', 'platform', 'slist', 'rectime', 'story_id')
+        columns = dict(zip(names, zip(*map(_row_getter(*names), self.data_list)))) or dict.fromkeys(names, ())
+        table = pa.table({
+            'title': pa.array(columns['title'], pa.string()),
+            'link': pa.array(columns['link'], pa.string()),
+            'hotcount': pa.array([to_int(value) for value in columns['hotcount']], pa.int64()),
+            'platform': pa.array(columns['platform'], pa.string()),
+            'slist': pa.array(columns['slist'], pa.string()),
+            'rectime': pa.array([to_datetime(value) for value in columns['rectime']], pa.timestamp('s')),
+            'crawltime': pa.array([crawltime] * len(self.data_list), pa.timestamp('s')),
+            'story_id': pa.array(columns['story_id'], pa.int64()),
+        })
+
+        # 先按平台和榜单排序，再做字典编码
+        table = table.sort_by([('platform', 'ascending'), ('slist', 'ascending')])
+        for name in ('platform', 'slist'):
+            index = table.schema.get_field_index(name)
+            table = table.set_column(index, name, table.column(name).dictionary_encode())
+        return table
+
+    @staticmethod
+    def load_archive(root_dir, date=None, platform=None, columns=None):
+        """
+        Loads rows from the Parquet archive. A date filter only opens that day's partition
+        and a platform filter only reads the row groups that can hold the platform.
+
+        Args:
+            root_dir (str): The root directory of the archive.
+            date (str): Crawl date in YYYY-MM-DD format, or None for every day.
+            platform (str): Platform name, or None for every platform.
+            columns (list): Columns to load, or None for every column.
+
+        Returns:
+            DataFrame: The matching rows.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        partitioning = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+        dataset = ds.dataset(root_dir, format='parquet', partitioning=partitioning)
+
+        condition = None
+        for field, value in (('date', date), ('platform', platform)):
+            if value is not None:
+                expression = ds.field(field) == value
+                condition = expression if condition is None else condition & expression
+
+        return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+    @staticmethod
+    def archive_to_excel(root_dir, excel_name, date=None, platform=None):
+        """
+        Exports part of the Parquet archive to an Excel file on demand.
+
+        Args:
+            root_dir (str): The root directory of the archive.
+            excel_name (str): The name of the Excel file.
+            date (str): Crawl date in YYYY-MM-DD format, or None for every day.
+            platform (str): Platform name, or None for every platform.
         """
         try:
-            df = pd.DataFrame(self.data_list)
+            df = Store.load_archive(root_dir, date=date, platform=platform)
             df.to_excel(excel_name, index=False)
-            print('数据已保存到Excel文件！')
+            logger.info('数据已从归档导出到Excel文件！')
 
         except Exception as e:
-            print(f"保存到Excel文件时出现错误：{e}")
+            logger.error("导出Excel文件时出现错误：%s", e)
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import threading
+import time
+from crawl import _block_keys
+
+logger = logging.getLogger(__name__)
+
+def iter_directory(directory):
+    """
+    Reads the boards listed in a Directory-format file.
+
+    Args:
+        directory (str): The path of the file ("platform,slist" per line).
+
+    Yields:
+        tuple: (platform, slist) of every listed board.
+    """
+    with open(directory, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line:
+                platform, _, list_name = line.partition(',')
+                yield platform, list_name
+
+class Subscription(object):
+    """
+    Subscription is the set of boards to keep. Lookups are hashed, so checking a block
+    header costs the same whether a few or all boards are subscribed.
+
+    Methods:
+        from_file(directory): Loads a subscription from a Directory-format file.
+    """
+
+    def __init__(self, boards):
+        """
+        Initializes the subscription.
+
+        Args:
+            boards (iterable): (platform, slist) of every subscribed board.
+        """
+        self.boards = frozenset(boards)
+
+    @classmethod
+    def from_file(cls, directory):
+        """
+        Loads a subscription from a Directory-format file, e.g. a copy of Directory.txt
+        trimmed down to the wanted boards.
+
+        Args:
+            directory (str): The path of the file.
+
+        Returns:
+            Subscription: The listed boards.
+        """
+        return cls(iter_directory(directory))
+
+    def __contains__(self, board):
+        return board in self.boards
+
+    def __iter__(self):
+        return iter(self.boards)
+
+    def __len__(self):
+        return len(self.boards)
+
+class BoardMap(object):
+    """
+    BoardMap remembers on which (category, page) every board was last seen, learned from the
+    pages of past crawls, so a crawl can fetch only the pages holding subscribed boards.
+
+    Boards move between pages as tophub reorders them: a board missing from the page it was
+    mapped to is forgotten, and as long as a subscribed board is unmapped (or its location
+    is older than the ttl) the crawl falls back to every page.
+
+    Methods:
+        learn(page): Records the boards found on a fetched page.
+        observe(pages): Learns from a stream of fetched pages while passing them through.
+        plan(subscription, ttl): Returns the pages to fetch for a subscription.
+        save(): Writes the map to disk.
+    """
+
+    def __init__(self, path='board_map.json'):
+        """
+        Initializes the map and loads the locations saved by a previous run.
+
+        Args:
+            path (str): The path of the map file, or None to keep it in memory only.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # {(platform, slist): (category, page, last seen timestamp)}
+        self.locations = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    for platform, list_name, category, page, seen in json.load(f):
+                        self.locations[(platform, list_name)] = (category, page, seen)
+            except (OSError, ValueError) as e:
+                logger.warning("读取榜单位置文件时出现错误：%s", e)
+
+    def learn(self, page):
+        """
+        Records the boards found on a fetched page. Pages without a body (failed or
+        unchanged) teach nothing.
+
+        Args:
+            page (FetchResult): The fetched page.
+        """
+        if page.body is None:
+            return
+
+        now = time.time()
+        location = (page.category, page.page)
+        boards = _block_keys(page.body)
+        with self.lock:
+            # 原本在这一页、这次却没有出现的榜单已经移到别处
+            for board in [board for board, (category, page_num, _) in self.locations.items()
+                          if (category, page_num) == location and board not in boards]:
+                del self.locations[board]
+            for board in boards:
+                self.locations[board] = location + (now,)
+
+    def observe(self, pages):
+        """
+        Learns from a stream of fetched pages while passing them through unchanged.
+
+        Args:
+            pages (iterable): FetchResult objects, e.g. from Crawl.iter_all_info().
+
+        Yields:
+            FetchResult: Every page.
+        """
+        for page in pages:
+            self.learn(page)
+            yield page
+
+    def plan(self, subscription, ttl=7 * 86400):
+        """
+        Returns the pages to fetch so every subscribed board is covered.
+
+        Args:
+            subscription (Subscription): The subscribed boards.
+            ttl (int): Seconds after which a location is no longer trusted.
+
+        Returns:
+            dict: {category: sorted page numbers}, for Crawl.iter_all_info(pages=...), or None
+                  when a subscribed board has no recent location and every page must be fetched.
+        """
+        now = time.time()
+        pages = {}
+        with self.lock:
+            locations = [self.locations.get(board) for board in subscription]
+        for location in locations:
+            if location is None or now - location[2] > ttl:
+                return None
+            pages.setdefault(location[0], set()).add(location[1])
+        return {category: sorted(page_nums) for category, page_nums in pages.items()}
+
+    def save(self):
+        """
+        Writes the map to disk, replacing the previous file atomically.
+        """
+        if not self.path:
+            return
+        with self.lock:
+            rows = [[platform, list_name, category, page, seen]
+                    for (platform, list_name), (category, page, seen) in self.locations.items()]
+        try:
+            temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error("保存榜单位置文件时出现错误：%s", e)
@@ -1,8 +1,78 @@
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from urllib.parse import urlsplit
+from datetime import datetime, timedelta
+import pymysql
+import requests
 import requests_mock
-from crawl import Crawl
+import subprocess
+import sys
+import bench
+import catalog
+import cli
+from bench import MockTophubServer, SqliteConnection
+from cache import ResponseCache
+from cluster import StoryIndex, shingles
+from crawl import Crawl, FetchResult
+from daemon import Daemon
+from extract import Extract, Record, parse_hotcount
+from metrics import Metrics
+from ratelimit import AimdLimiter, RetryPolicy, TokenBucket
+from search import SearchIndex, Segment, decode_varints, encode_varints
+from snapshot import SnapshotStore
+from store import SnapshotIndex, Store
+from subscribe import BoardMap, Subscription
+from trend import TrendEngine
+from writebehind import WriteBehind
+
+# 模拟的今日热榜页面片段
+SAMPLE_HTML = '''
+<div class="cc-cd">
+    <div class="cc-cd-lb">Platform</div>
+    <span class="cc-cd-sb-st">List</span>
+    <div class="i-h">5分钟前</div>
+    <a target="_blank" href="/link1">
+        <span class="t">Title 1</span>
+        <span class="e">100</span>
+    </a>
+    <a target="_blank" href="/link2">
+        <span class="t">Title 2</span>
+        <span class="e">200</span>
+    </a>
+</div>
+'''
+
+# 覆盖备用字段、缺失字段和日期格式的页面片段
+FALLBACK_HTML = '''
+<html><body>
+<div class="cc-cd">
+    <div class="cc-cd-lb"> <span>微博</span> </div>
+    <span class="cc-cd-sb-st">热搜榜</span>
+    <div class="i-h">2024-05-16</div>
+    <a target="_blank" href="/l/1"><div class="tt">Fallback title</div><div class="ss">3.5万</div></a>
+    <a target="_blank"><span class="t"> No link </span></a>
+    <a href="/ignored"><span class="t">Not blank</span></a>
+</div>
+<div class="cc-cd extra">
+    <div class="cc-cd-lb">知乎</div>
+    <a target="_blank" href="/l/2"><span class="t">Second &amp; block</span><span class="e">12</span></a>
+</div>
+</body></html>
+'''
 
 # 测试代码
+def make_page(category, page, body):
+    """
+    Builds the FetchResult of a successfully fetched page.
+    """
+    return FetchResult(category, page, 200, len(body.encode('utf-8')), 0.0, body, None)
+
 class TestCrawl(unittest.TestCase):
     """
     TestCrawl is a unit test class designed to test the functionality of the Crawl class.
@@ -15,6 +85,15 @@ class TestCrawl(unittest.TestCase):
         test_get_all_info(mock_request): Tests the get_all_info method.
         test_get_all_info_async(mock_request): Tests the get_all_info_async method.
         test_get_category_info_async(mock_request): Tests the get_category_info_async method.
+        test_get_all_info_aio(): Tests the get_all_info_aio method.
+        test_iter_all_info(mock_request): Tests the iter_all_info method.
+        test_iter_all_info_cached(mock_request): Tests conditional fetching through a ResponseCache.
+        test_fetch(mock_request): Tests the error reporting of the fetch method.
+        test_response_cache_eviction(): Tests the LRU eviction of ResponseCache.
+        test_discover_pages(mock_request): Tests the discover_pages method.
+        test_discover_pages_failure(mock_request): Tests that failed probes keep the previous count.
+        test_discover_pages_blocked(mock_request): Tests that a first page without boards is a failed probe.
+        test_connection_pool(): Tests that concurrent fetches reuse the pooled connections.
     """
 
     def setUp(self):
@@ -108,5 +187,1614 @@ class TestCrawl(unittest.TestCase):
         self.assertEqual(result, 'mocked response' * page_limit)
         self.assertEqual(mock_request.call_count, page_limit)
 
+    def test_get_all_info_aio(self):
+        """
+        Tests the get_all_info_aio method to ensure it fetches every page of every category
+        through fetch(), retrying failed pages, keeps the (category, page) order and never has
+        more requests in flight than max_connections overall and max_per_host per host.
+        """
+        lock = threading.Lock()
+        in_flight = {'total': 0}
+        peaks = {}
+        with MockTophubServer(latency=0.02, failures={0: 1}, page=str) as first, \
+                MockTophubServer(latency=0.02, failures={0: 1}, page=str) as second:
+            crawler = Crawl(max_connections=3, max_per_host=2, retry=RetryPolicy(base_delay=0.01, max_delay=0.01),
+                            metrics=Metrics())
+            crawler.url_dict = {'first': first.url, 'second': second.url}
+            crawler.page_dict = {'first': 6, 'second': 6}
+            get = crawler.session.get
+
+            def tracked_get(url, **kwargs):
+                host = urlsplit(url).netloc
+                with lock:
+                    in_flight['total'] += 1
+                    in_flight[host] = in_flight.get(host, 0) + 1
+                    peaks['total'] = max(peaks.get('total', 0), in_flight['total'])
+                    peaks[host] = max(peaks.get(host, 0), in_flight[host])
+                try:
+                    return get(url, **kwargs)
+                finally:
+                    with lock:
+                        in_flight['total'] -= 1
+                        in_flight[host] -= 1
+
+            with mock.patch.object(crawler.session, 'get', tracked_get):
+                result = crawler.get_all_info_aio()
+            requests_made = first.httpd.requests + second.httpd.requests
+
+        # 两个主机各自的第0页先返回503，重试后成功
+        self.assertEqual(result, '012345' * 2)
+        self.assertEqual(requests_made, 14)
+        self.assertEqual(peaks, {'total': 3, urlsplit(first.url).netloc: 2, urlsplit(second.url).netloc: 2})
+
+    @requests_mock.Mocker()
+    def test_iter_all_info(self, mock_request):
+        """
+        Tests the iter_all_info method to ensure it yields every page exactly once, tagged
+        with its category and page number.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        for category in self.crawler.url_dict:
+            mock_url = self.crawler.url_dict[category]
+            mock_request.get(mock_url, text='mocked response')
+
+        pages = list(self.crawler.iter_all_info(max_in_flight=4))
+        expected_pages = sorted((category, page_num) for category in self.crawler.page_dict
+                                for page_num in range(self.crawler.page_dict[category]))
+        self.assertEqual(sorted((page.category, page.page) for page in pages), expected_pages)
+        self.assertTrue(all(page.body == 'mocked response' for page in pages))
+        self.assertTrue(all(page.status == 200 and page.bytes == 15 and page.error is None for page in pages))
+
+    @requests_mock.Mocker()
+    def test_iter_all_info_categories(self, mock_request):
+        """
+        Tests that iter_all_info only fetches the pages of the requested categories.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        for category in self.crawler.url_dict:
+            mock_request.get(self.crawler.url_dict[category], text='mocked response')
+
+        pages = list(self.crawler.iter_all_info(categories=['communal_info', 'unknown_info']))
+        self.assertEqual(sorted(page.page for page in pages), list(range(self.crawler.page_dict['communal_info'])))
+        self.assertTrue(all(page.category == 'communal_info' for page in pages))
+
+    @requests_mock.Mocker()
+    def test_fetch(self, mock_request):
+        """
+        Tests that the fetch method reports HTTP and connection errors in its result and
+        leaves the shared parameters untouched.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        mock_request.get(self.crawler.url_dict['shop_info'], status_code=503, text='busy')
+        mock_request.get(self.crawler.url_dict['financial_info'], exc=requests.ConnectionError('refused'))
+
+        result = self.crawler.fetch('shop_info', 3)
+        self.assertEqual((result.category, result.page, result.status, result.body), ('shop_info', 3, 503, None))
+        self.assertEqual(result.error, 'HTTP 503')
+        self.assertFalse(result.unchanged)
+        self.assertEqual(mock_request.last_request.qs['p'], ['3'])
+        self.assertEqual(self.crawler.params['p'], '')
+
+        result = self.crawler.fetch('financial_info', 0)
+        self.assertIsNone(result.status)
+        self.assertIn('refused', result.error)
+
+    @requests_mock.Mocker()
+    def test_iter_all_info_cached(self, mock_request):
+        """
+        Tests that a second crawl through a ResponseCache sends the stored validators and
+        marks pages answered with 304 or with an identical body as unchanged.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        def respond(request, context):
+            page = request.qs['p'][0]
+            if page == '0':
+                if request.headers.get('If-None-Match') == '"v1"':
+                    context.status_code = 304
+                    return ''
+                context.headers['ETag'] = '"v1"'
+            if page == '2':
+                return f'changing page {mock_request.call_count}'
+            return 'static page'
+
+        self.crawler.page_dict = {'newspaper_info': 3}
+        mock_request.get(self.crawler.url_dict['newspaper_info'], text=respond)
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            cache_path = os.path.join(work_dir, 'cache.json')
+            self.crawler.cache = ResponseCache(cache_path)
+            first = {page.page: page.body for page in self.crawler.iter_all_info()}
+            self.assertTrue(all(text is not None for text in first.values()))
+
+            # 从磁盘重新加载缓存，模拟下一次运行
+            self.crawler.cache = ResponseCache(cache_path)
+            second = {page.page: page.body for page in self.crawler.iter_all_info()}
+            self.assertIsNone(second[0])
+            self.assertIsNone(second[1])
+            self.assertTrue(second[2].startswith('changing page'))
+
+    @requests_mock.Mocker()
+    def test_discover_pages(self, mock_request):
+        """
+        Tests that discover_pages stops at the first page repeating earlier boards or holding
+        none, reports the saved requests and reuses fresh counts without probing.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        def board_page(platform):
+            return SAMPLE_HTML.replace('Platform', platform)
+
+        def respond(request, context):
+            page_num = int(request.qs['p'][0])
+            if 'epaper' in request.url:
+                # 第5页起重复第4页的内容
+                return board_page(f'Paper {min(page_num, 4)}')
+            return board_page(f'Board {page_num}') if page_num < 2 else '<div>empty</div>'
+
+        for category in self.crawler.url_dict:
+            mock_request.get(self.crawler.url_dict[category], text=respond)
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            self.crawler.page_count_path = os.path.join(work_dir, 'page_counts.json')
+            report = self.crawler.discover_pages(probe_width=3)
+            self.assertEqual(report['pages']['newspaper_info'], 5)
+            self.assertEqual(report['pages']['shop_info'], 2)
+            self.assertEqual(self.crawler.page_dict['newspaper_info'], 5)
+            self.assertEqual(report['saved'], 10 - 5 + sum(pages - 2 for category, pages in Crawl().page_dict.items()
+                                                            if category != 'newspaper_info'))
+            self.assertEqual(report['probes'], mock_request.call_count)
+
+            crawler = Crawl(page_count_path=self.crawler.page_count_path)
+            report = crawler.discover_pages()
+            self.assertEqual(report['probes'], 0)
+            self.assertEqual(crawler.page_dict['shop_info'], 2)
+
+    @requests_mock.Mocker()
+    def test_discover_pages_failure(self, mock_request):
+        """
+        Tests that a probe failing with an HTTP error or a connection error leaves the count
+        unknown: the previous count is kept, not cached, and probed again on the next call.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        failing = {'shop_info': 3}
+
+        def respond(request, context):
+            page_num = int(request.qs['p'][0])
+            if 'shopping' in request.url and failing.get('shop_info') == page_num:
+                context.status_code = 503
+                return ''
+            return SAMPLE_HTML.replace('Platform', f'Board {page_num}') if page_num < 10 else '<div>empty</div>'
+
+        for category in self.crawler.url_dict:
+            mock_request.get(self.crawler.url_dict[category], text=respond)
+        mock_request.get(self.crawler.url_dict['financial_info'], exc=requests.exceptions.ConnectionError)
+
+        previous = dict(self.crawler.page_dict)
+        report = self.crawler.discover_pages(categories=['shop_info', 'financial_info', 'communal_info'])
+        self.assertEqual(report['failed'], ['shop_info', 'financial_info'])
+        self.assertEqual(report['pages']['shop_info'], previous['shop_info'])
+        self.assertEqual(self.crawler.page_dict['financial_info'], previous['financial_info'])
+        self.assertEqual(report['pages']['communal_info'], 10)
+        self.assertEqual(set(self.crawler.page_counts), {'communal_info'})
+
+        failing.clear()
+        report = self.crawler.discover_pages(categories=['shop_info'])
+        self.assertEqual(report['pages']['shop_info'], 10)
+        self.assertEqual(report['failed'], [])
+
+    @requests_mock.Mocker()
+    def test_discover_pages_blocked(self, mock_request):
+        """
+        Tests that a first page served with HTTP 200 but without any board, such as a captcha
+        page, is a failed probe rather than a category of 0 pages.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        mock_request.get(self.crawler.url_dict['communal_info'], text='<html><body>请输入验证码</body></html>')
+        previous = self.crawler.page_dict['communal_info']
+
+        report = self.crawler.discover_pages(categories=['communal_info'])
+        self.assertEqual(report['failed'], ['communal_info'])
+        self.assertEqual(report['pages']['communal_info'], previous)
+        self.assertEqual(self.crawler.page_dict['communal_info'], previous)
+        self.assertEqual(self.crawler.page_counts, {})
+
+    def test_response_cache_eviction(self):
+        """
+        Tests that ResponseCache evicts the least recently used page beyond max_entries.
+        """
+        cache = ResponseCache(os.path.join(tempfile.gettempdir(), 'missing-cache.json'), max_entries=2)
+        for page_num in range(3):
+            cache.update('shop_info', page_num, {}, f'page {page_num}')
+        self.assertEqual(list(cache.entries), ['shop_info:1', 'shop_info:2'])
+        self.assertEqual(cache.validators('shop_info', 0), {})
+
+    def test_connection_pool(self):
+        """
+        Tests that more concurrent fetches than pooled connections wait for a free connection
+        instead of opening extra ones that are discarded afterwards.
+        """
+        with MockTophubServer(latency=0.02) as server:
+            crawler = Crawl(max_per_host=2)
+            crawler.url_dict = {'mock': server.url}
+            crawler.page_dict = {'mock': 12}
+            with self.assertNoLogs('urllib3.connectionpool', level='WARNING'):
+                results = list(crawler.iter_all_info(max_in_flight=6))
+        self.assertTrue(all(result.body for result in results))
+        self.assertEqual(len(results), 12)
+
+class TestCli(unittest.TestCase):
+    """
+    TestCli is a unit test class designed to test the command-line entry point.
+
+    Methods:
+        test_lazy_imports(): Tests that importing the CLI and the core modules loads no heavy dependency.
+        test_extract_store(): Tests the extract and store subcommands end to end.
+        test_store_crawltime(): Tests that the store command archives records under the time their page was fetched.
+        test_unknown_category(): Tests that an unknown category is rejected.
+    """
+
+    def test_lazy_imports(self):
+        """
+        Tests in a fresh interpreter that importing cli, main, crawl, extract and store loads
+        neither pandas, pymysql nor bs4, and that importing main starts no thread.
+        """
+        code = ('import sys, threading, cli, main, crawl, extract, store; '
+                'print([name for name in ("pandas", "pymysql", "bs4") if name in sys.modules], threading.active_count())')
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), '[] 1')
+
+    def test_extract_store(self):
+        """
+        Tests that records extracted from the snapshot store are written to a sink by the store command.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            snapshots = SnapshotStore(os.path.join(root, 'snapshots'))
+            snapshots.put(snapshots.begin_run(), FetchResult('communal_info', 0, 200, len(SAMPLE_HTML), 0.1,
+                                                             SAMPLE_HTML, None, fetched_at=datetime(2024, 5, 16, 12)))
+            records_path = os.path.join(root, 'records.jsonl')
+            self.assertEqual(cli.main(['extract', '--snapshots', snapshots.root, '--output', records_path]), 0)
+
+            with open(records_path, encoding='utf-8') as f:
+                [(crawltime, records)] = cli.load_records(f)
+            self.assertEqual(crawltime, datetime(2024, 5, 16, 12))
+            self.assertEqual(records, Extract().extract_info(SAMPLE_HTML, now=datetime(2024, 5, 16, 12)))
+
+            index_dir = os.path.join(root, 'index')
+            self.assertEqual(cli.main(['store', records_path, '--sink', 'index', '--index', index_dir]), 0)
+            index = SearchIndex(index_dir)
+            self.assertIn(records[0].title, [result['title'] for result in index.search(records[0].title)])
+            index.close()
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_store_crawltime(self):
+        """
+        Tests that records of pages fetched at different times keep their own crawl time through
+        the extract and store commands, in the archive partition and the crawltime column.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            snapshots = SnapshotStore(os.path.join(root, 'snapshots'))
+            for fetched_at in (datetime(2024, 5, 16, 12), datetime(2024, 5, 17, 8, 30)):
+                snapshots.put(snapshots.begin_run(fetched_at), FetchResult('communal_info', 0, 200, len(SAMPLE_HTML), 0.1,
+                                                                           SAMPLE_HTML, None, fetched_at=fetched_at))
+            records_path = os.path.join(root, 'records.jsonl')
+            self.assertEqual(cli.main(['extract', '--snapshots', snapshots.root, '--output', records_path]), 0)
+
+            archive = os.path.join(root, 'archive')
+            self.assertEqual(cli.main(['store', records_path, '--sink', 'parquet', '--archive', archive]), 0)
+            self.assertEqual(sorted(os.listdir(archive)), ['date=2024-05-16', 'date=2024-05-17'])
+            count = len(Extract().extract_info(SAMPLE_HTML, now=datetime(2024, 5, 16, 12)))
+            df = Store.load_archive(archive, date='2024-05-17')
+            self.assertEqual(df['crawltime'].tolist(), [datetime(2024, 5, 17, 8, 30)] * count)
+
+    def test_unknown_category(self):
+        """
+        Tests that the crawl and daemon subcommands reject unknown categories before doing anything.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            self.assertEqual(cli.main(['crawl', 'no_such_info', '--snapshots', os.path.join(root, 'snapshots'),
+                                       '--page-counts', os.path.join(root, 'page_counts.json')]), 2)
+        self.assertEqual(cli.main(['daemon', 'no_such_info']), 2)
+
+class TestDaemon(unittest.TestCase):
+    """
+    TestDaemon is a unit test class designed to test the per-category scheduling of the Daemon class.
+
+    Methods:
+        test_intervals_without_overlap(): Tests the cadence and that runs of a category never overlap.
+        test_skip_overlapping_runs(): Tests that due runs of a busy category are dropped in skip mode.
+        test_unknown_overlap_mode(): Tests that an unknown overlap mode is rejected.
+    """
+
+    def run_daemon(self, job, intervals, overlap, duration):
+        """
+        Runs a daemon in a background thread for a while and stops it.
+
+        Returns:
+            Daemon: The stopped daemon.
+        """
+        shutdowns = []
+        daemon = Daemon(job, intervals=intervals, overlap=overlap, on_shutdown=lambda: shutdowns.append(1))
+        thread = threading.Thread(target=daemon.run, kwargs={'install_signals': False})
+        thread.start()
+        time.sleep(duration)
+        daemon.stop()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(shutdowns, [1])
+        return daemon
+
+    def test_intervals_without_overlap(self):
+        """
+        Tests that a fast category runs more often than a slow one, that a slow job is never
+        run twice at once, and that its missed runs are coalesced into one.
+        """
+        runs = {'fast': 0, 'slow': 0}
+        active = {'fast': 0, 'slow': 0}
+        overlaps = []
+        lock = threading.Lock()
+
+        def job(category):
+            with lock:
+                runs[category] += 1
+                active[category] += 1
+                overlaps.append(active[category] > 1)
+            time.sleep(0.25 if category == 'slow' else 0.01)
+            with lock:
+                active[category] -= 1
+
+        daemon = self.run_daemon(job, {'fast': 0.05, 'slow': 0.1}, 'coalesce', 0.6)
+        self.assertGreater(runs['fast'], 6)
+        self.assertFalse(any(overlaps))
+        # 每次运行期间错过的若干轮只补跑一次
+        self.assertLess(runs['slow'], 1 + daemon.skipped['slow'])
+        self.assertGreaterEqual(runs['slow'], 2)
+
+    def test_skip_overlapping_runs(self):
+        """
+        Tests that in skip mode the runs due while the job is going are dropped.
+        """
+        runs = []
+
+        def job(category):
+            runs.append(category)
+            time.sleep(0.3)
+
+        daemon = self.run_daemon(job, {'slow': 0.05}, 'skip', 0.45)
+        self.assertEqual(len(runs), 2)
+        self.assertGreater(daemon.skipped['slow'], 3)
+        self.assertEqual(daemon.pending, set())
+
+    def test_unknown_overlap_mode(self):
+        """
+        Tests that an unknown overlap mode raises a ValueError.
+        """
+        with self.assertRaises(ValueError):
+            Daemon(print, overlap='queue')
+
+class TestMetrics(unittest.TestCase):
+    """
+    TestMetrics is a unit test class designed to test the Metrics registry and the
+    instrumentation of the crawl, parse and store stages.
+
+    Methods:
+        test_counters_and_timers(): Tests the recorded series and the label filter.
+        test_since(): Tests the per-run figures computed from an earlier summary.
+        test_export(): Tests the JSON and Prometheus text files.
+        test_disabled(): Tests that a disabled registry records nothing.
+        test_pipeline_metrics(): Tests the series recorded by Crawl, Extract and Store.
+    """
+
+    def test_counters_and_timers(self):
+        """
+        Tests that counters add up, timings keep their count, total and extremes, and that
+        summary() filters on label values.
+        """
+        metrics = Metrics()
+        metrics.incr('fetch_bytes', 10, category='a')
+        metrics.incr('fetch_bytes', 5, category='a')
+        metrics.incr('fetch_bytes', 7, category='b')
+        metrics.observe('parse_seconds', 0.5, category='a')
+        metrics.observe('parse_seconds', 1.5, category='a')
+        with metrics.timer('store_write_seconds', sink='excel'):
+            pass
+
+        summary = metrics.summary(category='a')
+        self.assertEqual(summary['counters'], [{'name': 'fetch_bytes', 'labels': {'category': 'a'}, 'value': 15}])
+        self.assertEqual(summary['timers'], [{'name': 'parse_seconds', 'labels': {'category': 'a'}, 'count': 2,
+                                              'total': 2.0, 'mean': 1.0, 'min': 0.5, 'max': 1.5}])
+        self.assertEqual(len(metrics.summary()['timers']), 2)
+
+    def test_since(self):
+        """
+        Tests that since() returns only what was recorded after the earlier summary.
+        """
+        metrics = Metrics()
+        metrics.incr('fetch_bytes', 10, category='a')
+        metrics.observe('parse_seconds', 1.0, category='a')
+        before = metrics.summary(category='a')
+        metrics.incr('fetch_bytes', 4, category='a')
+        metrics.incr('fetch_bytes', 4, category='b')
+        metrics.observe('parse_seconds', 3.0, category='a')
+
+        delta = metrics.since(before, category='a')
+        self.assertEqual([series['value'] for series in delta['counters']], [4])
+        self.assertEqual(delta['timers'][0]['count'], 1)
+        self.assertEqual(delta['timers'][0]['total'], 3.0)
+
+    def test_export(self):
+        """
+        Tests the JSON file and the Prometheus text format, label escaping included.
+        """
+        metrics = Metrics()
+        metrics.incr('fetch_responses', category='a"b', status='200')
+        metrics.observe('db_batch_seconds', 0.25, table='hot_search')
+        with tempfile.TemporaryDirectory() as root:
+            metrics.export(os.path.join(root, 'metrics.prom'))
+            metrics.export(os.path.join(root, 'metrics.json'))
+            with open(os.path.join(root, 'metrics.prom'), encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            with open(os.path.join(root, 'metrics.json'), encoding='utf-8') as f:
+                self.assertEqual(json.load(f), metrics.summary())
+            self.assertEqual(sorted(os.listdir(root)), ['metrics.json', 'metrics.prom'])
+
+        self.assertIn('# TYPE hotsearch_fetch_responses counter', lines)
+        self.assertIn('hotsearch_fetch_responses{category="a\\"b",status="200"} 1', lines)
+        self.assertIn('hotsearch_db_batch_seconds_count{table="hot_search"} 1', lines)
+        self.assertIn('hotsearch_db_batch_seconds_sum{table="hot_search"} 0.25', lines)
+
+    def test_disabled(self):
+        """
+        Tests that a disabled registry records nothing.
+        """
+        metrics = Metrics(enabled=False)
+        metrics.incr('fetch_bytes', 10)
+        with metrics.timer('parse_seconds'):
+            pass
+        self.assertEqual(metrics.summary(), {'counters': [], 'timers': []})
+
+    @requests_mock.Mocker()
+    def test_pipeline_metrics(self, mock_request):
+        """
+        Tests that a crawl, parse and store run records the fetch, parse and write series.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        metrics = Metrics()
+        crawler = Crawl(metrics=metrics)
+        crawler.page_dict = {'communal_info': 2}
+        mock_request.get(crawler.url_dict['communal_info'], text=SAMPLE_HTML)
+
+        pages = crawler.iter_all_info()
+        records = [item for page in Extract(metrics=metrics).iter_info(pages) for item in page]
+        with tempfile.TemporaryDirectory() as root:
+            Store(records, metrics=metrics).mode_parquet(root)
+
+        summary = metrics.summary()
+        counters = {(series['name'], tuple(series['labels'].values())): series['value'] for series in summary['counters']}
+        timers = {series['name']: series['count'] for series in summary['timers']}
+        self.assertEqual(counters[('fetch_responses', ('communal_info', '200'))], 2)
+        self.assertEqual(counters[('rows_extracted', ('communal_info',))], len(records))
+        self.assertEqual(counters[('rows_written', ('parquet',))], len(records))
+        self.assertEqual(timers['fetch_ttfb_seconds'], 2)
+        self.assertEqual(timers['fetch_body_seconds'], 2)
+        self.assertEqual(timers['parse_seconds'], 2)
+        self.assertEqual(timers['store_write_seconds'], 1)
+
+class TestSubscribe(unittest.TestCase):
+    """
+    TestSubscribe is a unit test class designed to test the subscription filter and the
+    board map used to crawl only the pages holding subscribed boards.
+
+    Methods:
+        test_subscription_from_file(): Tests loading a Directory-format file.
+        test_extract_subscribed(): Tests that both engines keep only the subscribed boards.
+        test_board_map(): Tests learning, planning, moved boards and persistence.
+        test_crawl_planned_pages(): Tests that only the planned pages are fetched.
+    """
+
+    def test_subscription_from_file(self):
+        """
+        Tests that CRLF lines, empty list names and blank lines are read like catalog does.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'Subscription.txt')
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write('微博,热搜榜\r\n知乎,\r\n\r\n')
+            subscription = Subscription.from_file(path)
+
+        self.assertEqual(len(subscription), 2)
+        self.assertIn(('微博', '热搜榜'), subscription)
+        self.assertIn(('知乎', ''), subscription)
+        self.assertNotIn(('微博', ''), subscription)
+
+    def test_extract_subscribed(self):
+        """
+        Tests that both engines extract only the subscribed boards, with the same records
+        as an unfiltered extraction.
+        """
+        page = bench.tophub_page(0, boards=6, items=5)
+        wanted = {('微博0', '热搜榜'), ('今日头条5', '要闻')}
+        engines = ('bs4', 'lxml') if importlib.util.find_spec('lxml') else ('bs4',)
+        for engine in engines:
+            everything = Extract(engine=engine).extract_info(page, now=bench.REFERENCE_TIME)
+            subscribed = Extract(engine=engine, subscription=Subscription(wanted)).extract_info(
+                page, now=bench.REFERENCE_TIME)
+            self.assertEqual(subscribed, [item for item in everything if (item.platform, item.slist) in wanted])
+            self.assertEqual(len(subscribed), 10)
+
+    def test_board_map(self):
+        """
+        Tests that the plan covers the pages of the subscribed boards, that a board missing
+        from its page forces a full crawl, and that the map survives a restart.
+        """
+        subscription = Subscription([('微博0', '热搜榜'), ('澎湃新闻6', '热搜榜')])
+        with tempfile.TemporaryDirectory() as root:
+            board_map = BoardMap(os.path.join(root, 'board_map.json'))
+            self.assertIsNone(board_map.plan(subscription))
+
+            pages = [make_page('communal_info', page_num, bench.tophub_page(page_num, boards=3, items=1))
+                     for page_num in range(4)]
+            self.assertEqual(list(board_map.observe(pages)), pages)
+            self.assertEqual(board_map.plan(subscription), {'communal_info': [0, 2]})
+
+            board_map.save()
+            self.assertEqual(BoardMap(board_map.path).plan(subscription), {'communal_info': [0, 2]})
+            self.assertIsNone(board_map.plan(subscription, ttl=-1))
+
+        # 榜单不再出现在原来的页面时需要重新全量爬取
+        board_map.learn(make_page('communal_info', 2, bench.tophub_page(3, boards=3, items=1)))
+        self.assertIsNone(board_map.plan(subscription))
+        board_map.learn(make_page('communal_info', 1, bench.tophub_page(2, boards=3, items=1)))
+        self.assertEqual(board_map.plan(subscription), {'communal_info': [0, 1]})
+
+    @requests_mock.Mocker()
+    def test_crawl_planned_pages(self, mock_request):
+        """
+        Tests that iter_all_info fetches only the planned pages of the listed categories.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        crawler = Crawl(metrics=Metrics(enabled=False))
+        for category in crawler.url_dict:
+            mock_request.get(crawler.url_dict[category], text='mocked response')
+
+        fetched = crawler.iter_all_info(categories=['communal_info', 'shop_info'],
+                                        pages={'communal_info': [3, 7], 'shop_info': []})
+        self.assertEqual(sorted((page.category, page.page) for page in fetched),
+                         [('communal_info', 3), ('communal_info', 7)])
+        self.assertEqual(mock_request.call_count, 2)
+
+class TestCluster(unittest.TestCase):
+    """
+    TestCluster is a unit test class designed to test the MinHash/LSH story clustering.
+
+    Methods:
+        test_shingles(): Tests the title normalization and shingling.
+        test_assign(): Tests that variants of a title share a story and other titles do not.
+        test_persistence(): Tests that stories survive a restart.
+        test_mismatched_files(): Tests that saves stay consistent and a mismatched pair does not reuse ids.
+        test_prune(): Tests that old stories are dropped and the others keep their ids.
+    """
+
+    RECORDS = [
+        Record('某地发生5.0级地震', '', 1, '微博', '热搜榜', None),
+        Record('某地发生5.0级地震 震源深度10公里', '', 1, '百度', '实时热点', None),
+        Record('如何看待某地发生5.0级地震？', '', 1, '知乎', '热榜', None),
+        Record('苹果发布新款iPhone', '', 1, '今日头条', '热榜', None),
+        Record('苹果发布会：新款 iPhone 发布', '', 1, '微博', '热搜榜', None),
+        Record('今天天气很好', '', 1, '微博', '热搜榜', None),
+    ]
+
+    def test_shingles(self):
+        """
+        Tests that spaces, punctuation and case are ignored.
+        """
+        self.assertEqual(shingles('A, b！c'), {'ab', 'bc'})
+        self.assertEqual(shingles('好'), {'好'})
+
+    def test_assign(self):
+        """
+        Tests that variants of a title share a story and other titles do not, and that a
+        repeated title keeps its story.
+        """
+        index = StoryIndex(path=None)
+        self.assertEqual(index.assign(self.RECORDS), [0, 0, 0, 1, 1, 2])
+        self.assertEqual(index.assign([self.RECORDS[5], dict(self.RECORDS[1].as_dict(), platform='抖音')]), [2, 0])
+        self.assertEqual(index.trending_everywhere(min_platforms=3),
+                         [(0, '某地发生5.0级地震', ['微博', '抖音', '百度', '知乎'])])
+
+    def test_persistence(self):
+        """
+        Tests that a reloaded index gives the same story ids to old and new variants.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            index = StoryIndex(path=os.path.join(root, 'story_index'))
+            index.assign(self.RECORDS)
+            index.save()
+
+            reloaded = StoryIndex(path=os.path.join(root, 'story_index'))
+            self.assertEqual(reloaded.size, 3)
+            self.assertEqual(reloaded.assign([Record('网友热议某地发生5.0级地震', '', 1, '抖音', '', None),
+                                              Record('苹果发布新款iPhone', '', 1, '百度', '', None)]), [0, 1])
+
+    def test_mismatched_files(self):
+        """
+        Tests that concurrent saves leave a consistent pair of files, and that a pair which
+        does not belong together is discarded without reusing the ids it gave out.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'story_index')
+            index = StoryIndex(path=path)
+            index.assign(self.RECORDS)
+            threads = [threading.Thread(target=index.save) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(StoryIndex(path=path).size, 3)
+
+            # 另一个索引的.json与这个索引的.npz不匹配
+            other = StoryIndex(path=os.path.join(root, 'other'))
+            other.assign(self.RECORDS[:1])
+            other.save()
+            os.replace(os.path.join(root, 'other.json'), f"{path}.json")
+            with self.assertLogs('cluster', 'ERROR'):
+                reloaded = StoryIndex(path=path)
+            self.assertEqual(reloaded.size, 0)
+            self.assertEqual(reloaded.assign([Record('全新的标题', '', 1, '微博', '', None)]), [3])
+
+    def test_prune(self):
+        """
+        Tests that stories not seen within max_age are dropped, that the others keep their
+        ids across the prune and a restart, and that dropped ids are not reused.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            index = StoryIndex(path=os.path.join(root, 'story_index'))
+            index.assign(self.RECORDS[:3], now=1000.0)
+            index.assign(self.RECORDS[3:], now=2000.0)
+            self.assertEqual(index.prune(max_age=500, now=2100.0), 1)
+            self.assertEqual(index.size, 2)
+            self.assertEqual(index.assign(self.RECORDS[3:], now=2200.0), [1, 1, 2])
+            index.save()
+
+            reloaded = StoryIndex(path=os.path.join(root, 'story_index'))
+            self.assertEqual(reloaded.assign(self.RECORDS[3:], now=2300.0), [1, 1, 2])
+            self.assertEqual(reloaded.assign(self.RECORDS[:1], now=2300.0), [3])
+            self.assertEqual(reloaded.trending_everywhere(min_platforms=2),
+                             [(1, '苹果发布新款iPhone', ['今日头条', '微博'])])
+
+class TestTrend(unittest.TestCase):
+    """
+    TestTrend is a unit test class designed to test the incremental trend engine.
+
+    Methods:
+        test_update(): Tests rank, delta, velocity and time on board across snapshots.
+        test_eviction(): Tests that items dropping off a board are evicted and their slots reused.
+        test_top_risers(): Tests the top-K queries against a full sort.
+        test_expire(): Tests that items of boards no longer updated expire.
+    """
+
+    @staticmethod
+    def board(titles, hotcounts, platform='微博', slist='热搜榜'):
+        return [Record(title, '', hotcount, platform, slist, None) for title, hotcount in zip(titles, hotcounts)]
+
+    def test_update(self):
+        """
+        Tests the trend of an item after three hourly snapshots.
+        """
+        engine = TrendEngine(window=3)
+        self.assertEqual(engine.update(self.board(['a', 'b'], [100, 50]), now=0), {'updated': 2, 'added': 2, 'evicted': 0})
+        engine.update(self.board(['b', 'a'], [400, 120]), now=3600)
+        engine.update(self.board(['b', 'a'], [1000, 130]), now=7200)
+        engine.update(self.board(['b', 'a'], [1300, 140]), now=10800)
+
+        trend = engine.get('微博', '热搜榜', 'b')
+        self.assertEqual((trend['rank'], trend['hotcount'], trend['delta'], trend['rank_change']), (1, 1300, 300, 0))
+        # 窗口只保留最近3次：400 -> 1300 用时2小时
+        self.assertEqual(trend['velocity'], 450.0)
+        self.assertEqual(trend['time_on_board'], 10800)
+        self.assertEqual(trend['observations'], 3)
+        self.assertEqual(engine.get('微博', '热搜榜', 'a')['rank'], 2)
+        self.assertIsNone(engine.get('微博', '热搜榜', 'c'))
+
+    def test_eviction(self):
+        """
+        Tests that an item missing from more than max_missed snapshots of its board is evicted,
+        that other boards are not affected, and that the freed slot is reused.
+        """
+        engine = TrendEngine(max_missed=1)
+        engine.update(self.board(['a', 'b'], [1, 2]) + self.board(['x'], [1], platform='知乎'), now=0)
+        self.assertEqual(engine.update(self.board(['a'], [1]), now=1)['evicted'], 0)
+        self.assertEqual(engine.update(self.board(['a'], [1]), now=2)['evicted'], 1)
+        self.assertIsNone(engine.get('微博', '热搜榜', 'b'))
+        self.assertIsNotNone(engine.get('知乎', '热搜榜', 'x'))
+
+        engine.update(self.board(['a', 'c'], [1, 5]), now=3)
+        self.assertEqual(len(engine), 3)
+        self.assertEqual(engine.slots[('微博', '热搜榜', 'c')], 1)
+        self.assertEqual(sorted(trend['title'] for trend in engine.top_risers(5)), ['a', 'c', 'x'])
+
+    def test_top_risers(self):
+        """
+        Tests that the top-K risers and fallers match a full sort after many updates.
+        """
+        engine = TrendEngine(window=4)
+        titles = [f'title {i}' for i in range(300)]
+        for step in range(6):
+            hotcounts = [(i * 7919 * (step + 1)) % 10007 for i in range(300)]
+            engine.update(self.board(titles, hotcounts), now=step * 600)
+
+        velocities = sorted((engine.get('微博', '热搜榜', title)['velocity'] for title in titles), reverse=True)
+        self.assertEqual([trend['velocity'] for trend in engine.top_risers(10)], velocities[:10])
+        self.assertEqual([trend['velocity'] for trend in engine.top_fallers(10)], velocities[::-1][:10])
+        # 查询不会改变结果
+        self.assertEqual([trend['velocity'] for trend in engine.top_risers(10)], velocities[:10])
+        self.assertLessEqual(len(engine.rising), 2 * len(engine) + 1024)
+
+    def test_expire(self):
+        """
+        Tests that expire() evicts the items not seen for max_age seconds.
+        """
+        engine = TrendEngine(max_age=100)
+        engine.update(self.board(['a'], [1]), now=0)
+        engine.update(self.board(['x'], [1], platform='知乎'), now=150)
+        self.assertEqual(engine.expire(now=160), 1)
+        self.assertEqual(len(engine), 1)
+        self.assertEqual(engine.top_risers(5)[0]['title'], 'x')
+
+class TestSearch(unittest.TestCase):
+    """
+    TestSearch is a unit test class designed to test the title search index.
+
+    Methods:
+        test_varints(): Tests the varint encoding round trip.
+        test_search(): Tests keyword lookups in Chinese and their filters.
+        test_merge(): Tests the size-tiered merging and that merged segments keep every doc.
+        test_merge_blocked(): Tests that a merge whose old segments cannot be moved is undone.
+        test_store_sink(): Tests that Store.mode_index feeds the index.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root_dir = os.path.join(self.temp_dir.name, 'index')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_varints(self):
+        """
+        Tests that encoded values of 1 to 10 bytes decode to themselves.
+        """
+        values = [0, 1, 127, 128, 300, 2 ** 35, 2 ** 64 - 1]
+        encoded, sizes = encode_varints(values)
+        self.assertEqual(sizes.tolist(), [1, 1, 1, 2, 2, 6, 10])
+        self.assertEqual(decode_varints(encoded.tobytes()).tolist(), values)
+
+    def test_search(self):
+        """
+        Tests lookups across segments, the platform/slist/time filters and that a title
+        holding every character pair of a keyword but not the keyword itself does not match.
+        """
+        index = SearchIndex(self.root_dir)
+        monday = datetime(2024, 5, 6, 12)
+        index.add([Record('华为 Mate 70 发布', 'l1', 1, '微博', '热搜榜', None),
+                   Record('今日天气', 'l2', 2, '微博', '热搜榜', None)], crawltime=monday)
+        index.add([Record('华为Mate70开售', 'l3', 3, '知乎', '热榜', None),
+                   Record('为华而来', 'l4', 4, '知乎', '热榜', None)], crawltime=monday + timedelta(days=3))
+
+        results = index.search('华为mate')
+        self.assertEqual([result['link'] for result in results], ['l3', 'l1'])
+        self.assertEqual(results[0]['time'], monday + timedelta(days=3))
+        self.assertEqual([result['link'] for result in index.search('华为', platform='微博')], ['l1'])
+        self.assertEqual(index.search('华为', slist='热榜', start=monday + timedelta(days=4)), [])
+        self.assertEqual([result['link'] for result in index.search('华', end=monday)], ['l1'])
+        self.assertEqual([result['link'] for result in index.search('华而')], ['l4'])
+        self.assertEqual(index.search('为华为'), [])
+        self.assertEqual(index.search('不存在'), [])
+
+        boards = index.boards('华为', start=monday)
+        self.assertEqual(sorted(boards), [('微博', '热搜榜'), ('知乎', '热榜')])
+        self.assertEqual(boards[('知乎', '热榜')], {'count': 1, 'last_seen': monday + timedelta(days=3)})
+        index.close()
+
+    def test_merge(self):
+        """
+        Tests that add() only merges segments of the same size tier, leaving a large segment
+        alone, and that merged segments keep every doc, its board and its time.
+        """
+        index = SearchIndex(self.root_dir, merge_factor=2)
+        start = datetime(2024, 5, 6)
+        index.add([Record(f'旧闻 {i}', f'o{i}', i, '知乎', '热榜', None) for i in range(200)], crawltime=start)
+        large = os.listdir(self.root_dir)
+        for hour in range(1, 7):
+            platform = '微博' if hour % 2 else 'B站'
+            index.add([Record(f'新闻{hour}号 {i}', f'l{hour}-{i}', i, platform, '热搜榜', None) for i in range(20)],
+                      crawltime=start + timedelta(hours=hour))
+
+        # 20条的分段两两合并为40、80条，200条的分段不参与合并
+        sizes = []
+        for name in os.listdir(self.root_dir):
+            with open(os.path.join(self.root_dir, name, 'terms.json'), encoding='utf-8') as f:
+                sizes.append(json.load(f)['size'])
+        self.assertEqual(sorted(sizes), [40, 80, 200])
+        self.assertIn(large[0], os.listdir(self.root_dir))
+        self.assertEqual(len(index.search('新闻', limit=None)), 120)
+        self.assertEqual(len(index.search('新闻3号', limit=None)), 20)
+        self.assertEqual({result['platform'] for result in index.search('新闻4号', limit=None)}, {'B站'})
+        self.assertEqual(index.search('新闻5号 7')[0]['link'], 'l5-7')
+
+        # 重放的较早批次与已合并分段的时间范围重叠，全部合并后仍按时间排列
+        index.add([Record('迟到的新闻', 'late', 1, '微博', '热搜榜', None)], crawltime=start + timedelta(hours=2.5))
+        index.merge()
+        self.assertEqual(len(os.listdir(self.root_dir)), 1)
+        segment = Segment(os.path.join(self.root_dir, os.listdir(self.root_dir)[0]))
+        self.assertEqual(segment.times.tolist(), sorted(segment.times.tolist()))
+        segment.close()
+        self.assertEqual([(result['link'], result['time']) for result in index.search('迟到')],
+                         [('late', start + timedelta(hours=2.5))])
+        results = index.search('闻', limit=5)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0]['time'], start + timedelta(hours=6))
+        self.assertEqual(index.search('旧闻 199')[0], {'title': '旧闻 199', 'link': 'o199', 'platform': '知乎',
+                                                      'slist': '热榜', 'time': start})
+        self.assertEqual(sorted((platform, board['count']) for (platform, _), board in index.boards('闻').items()),
+                         [('B站', 60), ('微博', 61), ('知乎', 200)])
+        index.close()
+
+    def test_merge_blocked(self):
+        """
+        Tests that a merged segment which cannot be moved away (a file still mapped by another
+        process on Windows) undoes the merge: add() returns, and no doc is found twice.
+        """
+        def locked(source, target):
+            raise PermissionError(13, 'The process cannot access the file', source)
+
+        index = SearchIndex(self.root_dir, merge_factor=2)
+        start = datetime(2024, 5, 6)
+        with mock.patch('search.os.rename', side_effect=locked), self.assertLogs('search', 'ERROR'):
+            for hour in range(3):
+                index.add([Record(f'新闻{hour}号', '', 1, '微博', '热搜榜', None)], crawltime=start + timedelta(hours=hour))
+        self.assertEqual(len(os.listdir(self.root_dir)), 3)
+        self.assertEqual(len(index.search('新闻', limit=None)), 3)
+
+        index.add([Record('新闻3号', '', 1, '微博', '热搜榜', None)], crawltime=start + timedelta(hours=3))
+        self.assertEqual(len(os.listdir(self.root_dir)), 1)
+        self.assertEqual(len(index.search('新闻', limit=None)), 4)
+        index.close()
+
+    def test_store_sink(self):
+        """
+        Tests that Store.mode_index adds the stored rows to the index.
+        """
+        Store([Record('华为发布会', 'l1', 1, '微博', '热搜榜', None)], metrics=Metrics()).mode_index(self.root_dir)
+        index = SearchIndex(self.root_dir)
+        self.assertEqual([result['title'] for result in index.search('发布会')], ['华为发布会'])
+        index.close()
+
+class TestBench(unittest.TestCase):
+    """
+    TestBench is a unit test class designed to check that the benchmark harness and its
+    tophub-shaped pages work.
+
+    Methods:
+        test_tophub_page(): Tests that the generated pages parse into the expected records.
+        test_run_benchmarks(): Tests that a quick run records its results under a label.
+    """
+
+    def test_tophub_page(self):
+        """
+        Tests that every board and item of a generated page is extracted.
+        """
+        records = Extract().extract_info(bench.tophub_page(1, boards=3, items=4), now=bench.REFERENCE_TIME)
+        self.assertEqual(len(records), 12)
+        self.assertEqual(records[0].platform, '抖音3')
+        self.assertEqual(records[0].slist, '热门视频')
+        self.assertEqual(records[0].hotcount, 40000)
+        self.assertEqual(records[0].rectime, bench.REFERENCE_TIME - timedelta(days=2))
+
+    def test_run_benchmarks(self):
+        """
+        Tests that a quick run measures every mode and keeps the results of earlier labels.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'bench_results.json')
+            bench.run_benchmarks('v1', path, quick=True)
+            results = bench.run_benchmarks('v2', path, quick=True)
+            with open(path, encoding='utf-8') as f:
+                history = json.load(f)
+
+        self.assertEqual(list(history), ['v1', 'v2'])
+        self.assertEqual(set(results['crawl_pages_per_sec']), {'sync', 'threaded', 'streaming', 'aio'})
+        self.assertEqual(set(results['extract_items_per_sec']), set(Extract.ENGINES))
+        self.assertEqual(set(results['store_rows_per_sec']),
+                         {'mysql_insert', 'mysql_upsert', 'mysql_upsert_unchanged', 'parquet', 'excel'})
+        self.assertIn('import_eager', results['startup_seconds'])
+        self.assertTrue(all(value > 0 for group in ('crawl_pages_per_sec', 'extract_items_per_sec', 'store_rows_per_sec',
+                                                    'startup_seconds')
+                            for value in results[group].values()))
+
+class TestSnapshotStore(unittest.TestCase):
+    """
+    TestSnapshotStore is a unit test class designed to test the raw HTML snapshot store.
+
+    Methods:
+        test_crawl_and_reprocess(): Tests keeping a crawl and re-processing it offline.
+        test_runs_range(): Tests the selection of runs by time range.
+    """
+
+    @requests_mock.Mocker()
+    def test_crawl_and_reprocess(self, mock_request):
+        """
+        Tests that a crawl keeps every page body once per distinct content, and that the
+        stored run re-extracts to the same records with the original reference times.
+
+        Args:
+            mock_request (requests_mock.Mocker): The mocker object to mock HTTP requests.
+        """
+        def respond(request, context):
+            return SAMPLE_HTML if request.qs['p'][0] in ('0', '1') else FALLBACK_HTML
+
+        with tempfile.TemporaryDirectory() as root:
+            store = SnapshotStore(root, compression='gzip')
+            crawler = Crawl(snapshots=store)
+            crawler.page_dict = {'shop_info': 3}
+            mock_request.get(crawler.url_dict['shop_info'], text=respond)
+
+            extractor = Extract()
+            crawled = sorted(crawler.iter_all_info())
+            expected = [extractor.extract_info(page.body, now=page.fetched_at.replace(microsecond=0))
+                        for page in crawled]
+
+            objects = [name for _, _, names in os.walk(os.path.join(root, 'objects')) for name in names]
+            self.assertEqual(len(objects), 2)
+
+            stored = sorted(store.iter_pages())
+            self.assertEqual([(page.category, page.page, page.body) for page in stored],
+                             [(page.category, page.page, page.body) for page in crawled])
+            self.assertEqual(list(extractor.iter_info(stored)), expected)
+
+    def test_runs_range(self):
+        """
+        Tests that runs and iter_pages only cover the runs started within the range.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            store = SnapshotStore(root, compression='gzip')
+            for hour in (9, 10, 11):
+                run_id = store.begin_run(datetime(2024, 5, 16, hour))
+                store.put(run_id, make_page('shop_info', 0, f'<p>{hour}</p>'))
+
+            self.assertEqual(store.runs(datetime(2024, 5, 16, 10), datetime(2024, 5, 16, 11)),
+                             ['20240516T100000', '20240516T110000'])
+            bodies = [page.body for page in store.iter_pages(start=datetime(2024, 5, 16, 10, 30))]
+            self.assertEqual(bodies, ['<p>11</p>'])
+
+class TestRateLimit(unittest.TestCase):
+    """
+    TestRateLimit is a unit test class designed to test the rate limiter, the adaptive
+    concurrency limiter and the retry policy, alone and within Crawl against a local mock server.
+
+    Methods:
+        test_fetch_with_retries(): Tests retries and backoff of Crawl against injected errors.
+        test_aimd_limiter(): Tests the additive increase and multiplicative decrease.
+        test_token_bucket(): Tests that the token bucket enforces its rate.
+        test_retry_policy(): Tests the retry decisions and the jittered delays.
+    """
+
+    def test_fetch_with_retries(self):
+        """
+        Tests that failed pages are retried until they succeed or run out of retries, and that
+        the errors shrink the concurrency limit.
+        """
+        with MockTophubServer(latency=0.01, failures={0: 1, 1: 1, 2: 5}) as server:
+            limiter = AimdLimiter(initial=4)
+            crawler = Crawl(rate_limiter=TokenBucket(rate=500, burst=10), limiter=limiter,
+                            retry=RetryPolicy(retries=2, base_delay=0.01))
+            crawler.url_dict = {'mock': server.url}
+            crawler.page_dict = {'mock': 4}
+
+            results = {page.page: page for page in crawler.iter_all_info()}
+
+        self.assertEqual([results[page_num].attempts for page_num in range(4)], [2, 2, 3, 1])
+        self.assertEqual(results[2].error, 'HTTP 503')
+        self.assertIsNone(results[2].body)
+        self.assertTrue(all(results[page_num].body for page_num in (0, 1, 3)))
+        self.assertEqual(server.httpd.requests, 8)
+        self.assertLess(limiter.limit, 4)
+        self.assertEqual(limiter.active, 0)
+
+    def test_aimd_limiter(self):
+        """
+        Tests that the limit grows by about one per round of fast responses and halves on
+        throttling, server errors and slow responses, within its bounds.
+        """
+        limiter = AimdLimiter(initial=2, minimum=1, maximum=3, latency_target=1.0)
+        for _ in range(2):
+            limiter.acquire()
+            limiter.release(200, 0.1)
+        self.assertAlmostEqual(limiter.limit, 2.5 + 1 / 2.5)
+
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(200, 0.1)
+        self.assertEqual(limiter.limit, 3)
+
+        limiter.acquire()
+        limiter.release(429, 0.1)
+        self.assertEqual(limiter.limit, 1.5)
+        limiter.acquire()
+        limiter.release(200, 5.0)
+        self.assertEqual(limiter.limit, 1)
+
+    def test_token_bucket(self):
+        """
+        Tests that the token bucket lets a burst through and then holds the rate.
+        """
+        bucket = TokenBucket(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_retry_policy(self):
+        """
+        Tests which failures are retried and that the delays stay within the backoff.
+        """
+        retry = RetryPolicy(retries=2, base_delay=0.1, max_delay=0.3)
+        self.assertTrue(retry.should_retry(503, 1))
+        self.assertTrue(retry.should_retry(None, 2))
+        self.assertFalse(retry.should_retry(404, 1))
+        self.assertFalse(retry.should_retry(503, 3))
+        self.assertTrue(all(0 <= retry.delay(attempt) <= 0.3 for attempt in range(1, 10)))
+
+class TestExtract(unittest.TestCase):
+    """
+    TestExtract is a unit test class designed to test the functionality of the Extract class.
+
+    Methods:
+        setUp(): Sets up the test environment by initializing the Extract instance.
+        test_extract_info(): Tests the extract_info method.
+        test_iter_info(): Tests the iter_info method.
+        test_fallback_fields(): Tests the tt/ss fallbacks and missing fields.
+        test_engines_identical(): Tests that the lxml engine matches the bs4 engine.
+        test_unknown_engine(): Tests that an unknown engine is rejected.
+        test_extract_parallel(): Tests the extract_parallel method.
+        test_parse_hotcount(): Tests the parse_hotcount function.
+        test_record(): Tests the Record item type.
+        test_reference_time(): Tests that relative times count back from the page reference time.
+    """
+
+    def setUp(self):
+        """
+        Sets up the test environment by initializing the Extract instance.
+        """
+        self.extractor = Extract()
+
+    def test_extract_info(self):
+        """
+        Tests the extract_info method to ensure it extracts every item of a block.
+        """
+        result = self.extractor.extract_info(SAMPLE_HTML)
+        self.assertEqual([item['title'] for item in result], ['Title 1', 'Title 2'])
+        self.assertEqual(result[0]['link'], 'https://tophub.today/link1')
+        self.assertEqual(result[1]['hotcount'], 200)
+        self.assertEqual(result[0]['platform'], 'Platform')
+        self.assertEqual(result[0]['slist'], 'List')
+
+    def test_iter_info(self):
+        """
+        Tests the iter_info method to ensure each page is parsed on its own.
+        """
+        pages = [make_page('comprehensive_info', 0, SAMPLE_HTML), make_page('comprehensive_info', 1, ''),
+                 make_page('shop_info', 0, SAMPLE_HTML)]
+        result = list(self.extractor.iter_info(pages))
+        self.assertEqual([len(records) for records in result], [2, 0, 2])
+
+    def test_fallback_fields(self):
+        """
+        Tests the extract_info method on items that only carry the tt/ss fields or no link.
+        """
+        result = self.extractor.extract_info(FALLBACK_HTML)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[0]['title'], 'Fallback title')
+        self.assertEqual(result[0]['hotcount'], 35000)
+        self.assertEqual(result[0]['rectime'], datetime(2024, 5, 16))
+        self.assertIsNone(result[1]['hotcount'])
+        self.assertIsNone(result[2]['rectime'])
+        self.assertEqual(result[1]['link'], '')
+        self.assertEqual(result[2]['slist'], '')
+
+    @unittest.skipUnless(importlib.util.find_spec('lxml'), 'lxml is not installed')
+    def test_engines_identical(self):
+        """
+        Tests that the lxml engine produces the same records as the bs4 reference engine.
+        """
+        fast = Extract(engine='lxml')
+        for text in (SAMPLE_HTML, FALLBACK_HTML, '', '<p>no blocks</p>'):
+            self.assertEqual(fast.extract_info(text), self.extractor.extract_info(text))
+
+    def test_unknown_engine(self):
+        """
+        Tests that an unknown parser engine raises a ValueError.
+        """
+        with self.assertRaises(ValueError):
+            Extract(engine='regex')
+
+    def test_extract_parallel(self):
+        """
+        Tests that the extract_parallel method returns the same records as a sequential
+        parse, ordered by (category, page).
+        """
+        dated_html = SAMPLE_HTML.replace('5分钟前', '2024-05-16')
+        pages = [make_page('shop_info', 1, FALLBACK_HTML), make_page('comprehensive_info', 0, dated_html),
+                 make_page('shop_info', 0, dated_html), make_page('comprehensive_info', 1, FALLBACK_HTML)]
+        expected = []
+        for page in sorted(pages):
+            expected.extend(self.extractor.extract_info(page.body))
+
+        result = self.extractor.extract_parallel(pages, processes=2, chunksize=1)
+        self.assertEqual(result, expected)
+        self.assertEqual(self.extractor.extract_parallel([]), [])
+
+    def test_parse_hotcount(self):
+        """
+        Tests that parse_hotcount applies the unit multipliers and ignores surrounding text.
+        """
+        self.assertEqual(parse_hotcount('123万'), 1230000)
+        self.assertEqual(parse_hotcount('4.5k热度'), 4500)
+        self.assertEqual(parse_hotcount('1.2亿'), 120000000)
+        self.assertEqual(parse_hotcount('1,024'), 1024)
+        self.assertIsNone(parse_hotcount(''))
+
+    def test_record(self):
+        """
+        Tests that extracted Record items share their board strings and keep a dict view.
+        """
+        first, second = self.extractor.extract_info(SAMPLE_HTML)
+        self.assertIsInstance(first, Record)
+        self.assertIs(first.platform, second.platform)
+        self.assertEqual(first['title'], first.title)
+        self.assertEqual(first[0], 'Title 1')
+        self.assertEqual(list(first.as_dict()),
+                         ['title', 'link', 'hotcount', 'platform', 'slist', 'rectime', 'story_id'])
+        self.assertIsNone(first['story_id'])
+        for name in ('missing', 'count', 'index', '_fields', 'as_dict'):
+            with self.assertRaises(KeyError):
+                first[name]
+            self.assertIsNone(first.get(name))
+        self.assertEqual(first._replace(story_id=3).get('story_id'), 3)
+        self.assertFalse(hasattr(first, '__dict__'))
+
+    def test_reference_time(self):
+        """
+        Tests that every block of a page counts its relative time back from the same
+        reference time, and that both engines agree on it.
+        """
+        now = datetime(2024, 5, 16, 12, 0, 0, 123456)
+        text = SAMPLE_HTML + SAMPLE_HTML.replace('5分钟前', '2小时前')
+        result = self.extractor.extract_info(text, now=now)
+        self.assertEqual(result[0].rectime, datetime(2024, 5, 16, 11, 55))
+        self.assertEqual(result[2].rectime, now.replace(microsecond=0) - timedelta(hours=2))
+        if importlib.util.find_spec('lxml'):
+            self.assertEqual(Extract(engine='lxml').extract_info(text, now=now), result)
+
+class TestStore(unittest.TestCase):
+    """
+    TestStore is a unit test class designed to test the functionality of the Store class
+    against an SQLite-backed stand-in for MySQL.
+
+    Methods:
+        setUp(): Sets up a fresh stand-in connection.
+        tearDown(): Closes the connections kept by Store.
+        test_mode_mysql_batches(): Tests that rows are written in batches.
+        test_mode_mysql_reuses_connection(): Tests that later jobs reuse the connection and skip the DDL.
+        test_mode_mysql_upsert(): Tests that upsert mode only writes new or changed items.
+        test_mode_mysql_migrates_table(): Tests that tables of earlier versions are migrated for upsert mode.
+        test_snapshot_index(): Tests the change detection of SnapshotIndex.
+        test_mode_parquet(): Tests the Parquet archive and its filtered loading.
+        test_mode_mysql_records(): Tests that Record items are stored like dict items, with their story ids.
+        test_mode_mysql_upsert_queued(): Tests that queued runs of one category are upserted in order.
+        test_mode_mysql_result(): Tests that mode_mysql reports whether the rows were written.
+    """
+
+    def setUp(self):
+        """
+        Sets up a fresh stand-in connection shared by every Store of the test.
+        """
+        self.connections = []
+
+        def connect(**config):
+            connection = SqliteConnection(**config)
+            self.connections.append(connection)
+            return connection
+
+        self.connect = connect
+        self.records = [{'title': f'Title {i}', 'hotcount': i, 'link': f'https://tophub.today/l/{i}',
+                         'platform': 'Platform', 'slist': 'List', 'rectime': '2024-05-16 10:00:00'}
+                        for i in range(2500)]
+
+    def tearDown(self):
+        """
+        Closes the connections kept by Store between tests.
+        """
+        Store.close_connections()
+
+    def count_rows(self):
+        """
+        Returns the number of rows stored in the stand-in table.
+        """
+        return self.connections[0].db.execute('SELECT COUNT(*) FROM hot_search').fetchone()[0]
+
+    def test_mode_mysql_batches(self):
+        """
+        Tests that mode_mysql writes every record with one statement per batch.
+        """
+        Store(self.records, batch_size=1000, connect=self.connect).mode_mysql('HotSearch', 'hot_search')
+        self.assertEqual(self.count_rows(), 2500)
+        # CREATE DATABASE、USE、CREATE TABLE、两次表结构查询以及3个批次
+        self.assertEqual(self.connections[0].statements, 8)
+
+    def test_mode_mysql_reuses_connection(self):
+        """
+        Tests that a second job reuses the open connection and does not repeat the DDL.
+        """
+        Store(self.records, connect=self.connect).mode_mysql('HotSearch', 'hot_search')
+        statements = self.connections[0].statements
+        Store(self.records[:10], connect=self.connect).mode_mysql('HotSearch', 'hot_search')
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].statements, statements + 1)
+        self.assertEqual(self.count_rows(), 2510)
+
+    def test_mode_mysql_upsert(self):
+        """
+        Tests that upsert mode skips unchanged items and updates the hotcount of changed ones.
+        """
+        Store(self.records, connect=self.connect).mode_mysql('HotSearch', 'hot_search', upsert=True)
+        statements = self.connections[0].statements
+
+        # 第二次只有一条热度变化，另加一条新数据
+        next_records = [dict(post) for post in self.records]
+        next_records[0]['hotcount'] = 999
+        next_records.append(dict(self.records[1], title='New title'))
+        Store(next_records, connect=self.connect).mode_mysql('HotSearch', 'hot_search', upsert=True)
+
+        self.assertEqual(self.connections[0].statements, statements + 1)
+        self.assertEqual(self.count_rows(), 2501)
+        hotcount = self.connections[0].db.execute(
+            "SELECT hotcount FROM hot_search WHERE title = 'Title 0'").fetchone()[0]
+        self.assertEqual(hotcount, 999)
+
+    def test_mode_mysql_upsert_scope(self):
+        """
+        Tests that categories stored separately keep separate snapshots, so storing one
+        category does not make the next run of another one rewrite all its items.
+        """
+        first, second = self.records[:100], self.records[100:200]
+        Store(first, connect=self.connect).mode_mysql('HotSearch', 'hot_search', upsert=True, scope='a')
+        Store(second, connect=self.connect).mode_mysql('HotSearch', 'hot_search', upsert=True, scope='b')
+        statements = self.connections[0].statements
+
+        Store(first, connect=self.connect).mode_mysql('HotSearch', 'hot_search', upsert=True, scope='a')
+        self.assertEqual(self.connections[0].statements, statements)
+        self.assertEqual(self.count_rows(), 200)
+
+    def test_mode_mysql_migrates_table(self):
+        """
+        Tests that a table created by an earlier version gets the item_key column and the
+        indexes upsert mode needs, and keeps its rows.
+        """
+        connection = SqliteConnection()
+        connection.db.execute('CREATE TABLE hot_search (ID INTEGER PRIMARY KEY, title Text, hotcount Text, '
+                              'link Text, platform VARCHAR(50), slist VARCHAR(50), rectime DATETIME)')
+        connection.db.execute("INSERT INTO hot_search (title, hotcount) VALUES ('Old title', '1.5万')")
+
+        def connect(**config):
+            self.connections.append(connection)
+            return connection
+
+        with self.assertLogs('store', 'WARNING'):
+            self.assertTrue(Store(self.records[:5], connect=connect).mode_mysql('HotSearch', 'hot_search',
+                                                                                upsert=True))
+        columns = [row[1] for row in connection.db.execute('PRAGMA table_info(hot_search)')]
+        indexes = {row[1] for row in connection.db.execute('PRAGMA index_list(hot_search)')}
+        self.assertIn('item_key', columns)
+        self.assertIn('story_id', columns)
+        self.assertEqual(indexes, {'hot_search_uk_item_key', 'hot_search_idx_board', 'hot_search_idx_rectime',
+                                   'hot_search_idx_story'})
+
+        records = [dict(post) for post in self.records[:5]]
+        records[0]['hotcount'] = 999
+        self.assertTrue(Store(records, connect=connect).mode_mysql('HotSearch', 'hot_search', upsert=True))
+        self.assertEqual(self.count_rows(), 6)
+        # 旧表的hotcount列仍为文本
+        hotcount = connection.db.execute("SELECT hotcount FROM hot_search WHERE title = 'Title 0'").fetchone()[0]
+        self.assertEqual(hotcount, '999')
+
+    def test_snapshot_index(self):
+        """
+        Tests that SnapshotIndex reports new and changed items only, and only remembers a
+        snapshot once it is replaced.
+        """
+        index = SnapshotIndex()
+        changed, snapshot = index.diff(self.records[:3])
+        self.assertEqual(len(changed), 3)
+        self.assertEqual(len(index.diff(self.records[:3])[0]), 3)
+
+        index.replace(snapshot)
+        updated = dict(self.records[2], hotcount=1000)
+        changed, _ = index.diff(self.records[:2] + [updated])
+        self.assertEqual([post for _, post in changed], [updated])
+
+        # 同一条目出现两次时以后一次为准
+        changed, snapshot = index.diff([updated, self.records[2]])
+        self.assertEqual(changed, [])
+        self.assertEqual(snapshot, {index.item_key(updated): index.fingerprint(self.records[2])})
+
+    def test_mode_mysql_records(self):
+        """
+        Tests that mode_mysql stores Record items field by field in the table columns.
+        """
+        records = [record._replace(story_id=i) for i, record in enumerate(Extract().extract_info(FALLBACK_HTML))]
+        Store(records, connect=self.connect).mode_mysql('HotSearch', 'hot_search')
+        rows = self.connections[0].db.execute(
+            'SELECT title, hotcount, link, platform, slist, story_id FROM hot_search ORDER BY ID').fetchall()
+        self.assertEqual(rows, [(r.title, r.hotcount, r.link, r.platform, r.slist, r.story_id) for r in records])
+
+    def test_mode_mysql_upsert_queued(self):
+        """
+        Tests that two runs of one category queued behind a write-behind sink are upserted
+        in order, so the table ends with the newer hotcount.
+        """
+        def write(records, scope, crawltime):
+            return Store(records, connect=self.connect).mode_mysql('HotSearch', 'hot_search', upsert=True,
+                                                                   scope=scope)
+
+        with tempfile.TemporaryDirectory() as journal_dir:
+            writer = WriteBehind('mysql', write, journal_dir=journal_dir, max_delay=10, metrics=Metrics())
+            writer.put([dict(self.records[0], hotcount=100)], scope='a')
+            writer.put([dict(self.records[0], hotcount=200)], scope='a')
+            writer.close()
+
+        rows = self.connections[0].db.execute('SELECT title, hotcount FROM hot_search').fetchall()
+        self.assertEqual(rows, [('Title 0', 200)])
+
+    def test_mode_mysql_result(self):
+        """
+        Tests that mode_mysql returns True once the rows are committed and False when the
+        database cannot be reached.
+        """
+        def unreachable(**config):
+            raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+
+        self.assertTrue(Store(self.records[:5], connect=self.connect).mode_mysql('HotSearch', 'hot_search'))
+        self.assertFalse(Store(self.records[:5], connect=unreachable).mode_mysql('HotSearch', 'hot_search'))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+    def test_mode_parquet(self):
+        """
+        Tests that mode_parquet appends typed runs, partitioned by crawl time, and that
+        load_archive filters by date and platform.
+        """
+        records = self.records[:3] + [dict(self.records[3], platform='Other', hotcount='1.5万', rectime='')]
+        with tempfile.TemporaryDirectory() as root_dir:
+            Store(records).mode_parquet(root_dir)
+            Store(records).mode_parquet(root_dir)
+
+            partitions = os.listdir(root_dir)
+            self.assertEqual(len(partitions), 1)
+            self.assertEqual(len(os.listdir(os.path.join(root_dir, partitions[0]))), 2)
+
+            df = Store.load_archive(root_dir, date=partitions[0][len('date='):], platform='Other')
+            self.assertEqual(len(df), 2)
+            self.assertEqual(df['hotcount'].tolist(), [15000, 15000])
+            self.assertTrue(df['rectime'].isna().all())
+            self.assertEqual(len(Store.load_archive(root_dir, date='1970-01-01')), 0)
+            self.assertTrue(str(Store.load_archive(root_dir)['rectime'].dtype).startswith('datetime64'))
+
+            # 排队后才写入的数据仍按爬取时间分区
+            Store(records, crawltime=datetime(2024, 5, 6, 23, 59, 30)).mode_parquet(root_dir)
+            df = Store.load_archive(root_dir, date='2024-05-06')
+            self.assertEqual(df['crawltime'].tolist(), [datetime(2024, 5, 6, 23, 59, 30)] * len(records))
+
+class TestWriteBehind(unittest.TestCase):
+    """
+    TestWriteBehind is a unit test class designed to test the write-behind queue of the sinks.
+
+    Methods:
+        test_batching(): Tests that batches are written by size and by age, one per put().
+        test_spill_and_replay(): Tests that batches failing to write are journaled and replayed in order.
+        test_replay_on_start(): Tests that a journal left by a previous run is replayed with its crawl times and story ids.
+        test_backpressure(): Tests that put() blocks on a full buffer and spills after put_timeout.
+        test_dead_letter(): Tests that a batch failing on every attempt is dead-lettered and the replay goes on.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.retry = RetryPolicy(base_delay=0.05, max_delay=0.05)
+        self.up = True
+        self.written = []
+        self.crawltimes = []
+        self.story_ids = []
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, records, scope, crawltime):
+        if not self.up:
+            return False
+        self.written.append((scope, [record['title'] for record in records]))
+        self.crawltimes.append(crawltime)
+        self.story_ids.extend(record['story_id'] for record in records)
+        return True
+
+    @staticmethod
+    def records(*titles):
+        return [Record(title, '', 1, '微博', '热搜榜', datetime(2024, 5, 6, 12)) for title in titles]
+
+    def writer(self, **kwargs):
+        kwargs.setdefault('retry', self.retry)
+        return WriteBehind('test', self.write, journal_dir=self.temp_dir.name, metrics=Metrics(), **kwargs)
+
+    def test_batching(self):
+        """
+        Tests that a full buffer is written at once, a partial one after max_delay, and that
+        every put() is written on its own, in order, even within a scope.
+        """
+        writer = self.writer(batch_rows=4, max_delay=0.3)
+        writer.put(self.records('a', 'b'), scope='x')
+        writer.put(self.records('c'), scope='y')
+        writer.put(self.records('d'), scope='x')
+        time.sleep(0.1)
+        self.assertEqual(self.written, [('x', ['a', 'b']), ('y', ['c']), ('x', ['d'])])
+
+        writer.put(self.records('e'), scope='x')
+        time.sleep(0.1)
+        self.assertEqual(len(self.written), 3)
+        time.sleep(0.4)
+        self.assertEqual(self.written[3], ('x', ['e']))
+        writer.close()
+
+    def test_spill_and_replay(self):
+        """
+        Tests that a batch the sink rejects is journaled together with the batches after it,
+        and that all of them are written in order once the sink recovers.
+        """
+        writer = self.writer(batch_rows=100, max_delay=10)
+        self.up = False
+        writer.put(self.records('a'), scope='x')
+        self.assertTrue(writer.flush(2))
+        self.assertEqual(writer.pending(), {'buffered': 0, 'spilled': 1})
+
+        self.up = True
+        writer.put(self.records('b'), scope='x')
+        writer.flush(2)
+        time.sleep(0.3)
+        self.assertEqual(self.written, [('x', ['a']), ('x', ['b'])])
+        self.assertEqual(writer.pending(), {'buffered': 0, 'spilled': 0})
+        writer.close()
+
+    def test_replay_on_start(self):
+        """
+        Tests that records still buffered or journaled at close are written by the next writer,
+        with the crawl time they were put with.
+        """
+        self.up = False
+        writer = self.writer(max_delay=10)
+        records = self.records('a', 'b')
+        records[0] = records[0]._replace(story_id=7)
+        writer.put(records, scope='x', crawltime=datetime(2024, 5, 6, 23, 59, 30, 500))
+        writer.close()
+        self.assertEqual(self.written, [])
+
+        self.up = True
+        writer = self.writer()
+        time.sleep(0.2)
+        self.assertEqual(self.written, [('x', ['a', 'b'])])
+        self.assertEqual(self.crawltimes, [datetime(2024, 5, 6, 23, 59, 30)])
+        self.assertEqual(self.story_ids, [7, None])
+        self.assertEqual(writer.pending()['spilled'], 0)
+        writer.close()
+
+    def test_backpressure(self):
+        """
+        Tests that put() waits while the buffer is full and spills the records to the journal
+        once put_timeout passes without room.
+        """
+        release = threading.Event()
+
+        def slow_write(records, scope, crawltime):
+            release.wait(2)
+            return self.write(records, scope, crawltime)
+
+        writer = WriteBehind('slow', slow_write, journal_dir=self.temp_dir.name, max_rows=2, batch_rows=1,
+                             put_timeout=0.2, retry=self.retry, metrics=Metrics())
+        writer.put(self.records('a'))
+        time.sleep(0.1)
+        writer.put(self.records('b', 'c'))
+
+        start = time.monotonic()
+        self.assertFalse(writer.put(self.records('d')))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        # 缓冲区中更早的数据一并溢出，保持顺序
+        self.assertEqual(writer.pending(), {'buffered': 0, 'spilled': 2})
+
+        release.set()
+        writer.close(5)
+        self.assertEqual([titles for _, titles in self.written], [['a'], ['b', 'c'], ['d']])
+
+    def test_dead_letter(self):
+        """
+        Tests that a batch the sink keeps rejecting is moved to the dead-letter file after the
+        retry policy's last attempt, with an error metric, and that the batches behind it are
+        then written.
+        """
+        def write(records, scope, crawltime):
+            return scope != 'bad' and self.write(records, scope, crawltime)
+
+        metrics = Metrics()
+        writer = WriteBehind('test', write, journal_dir=self.temp_dir.name, batch_rows=1, metrics=metrics,
+                             retry=RetryPolicy(retries=2, base_delay=0.05, max_delay=0.05))
+        writer.put(self.records('a', 'b'), scope='bad')
+        writer.put(self.records('c'), scope='x')
+        time.sleep(0.5)
+        self.assertEqual(self.written, [('x', ['c'])])
+        self.assertEqual(writer.pending(), {'buffered': 0, 'spilled': 0})
+
+        with open(os.path.join(self.temp_dir.name, 'test.dead.jsonl'), encoding='utf-8') as f:
+            [batch] = [json.loads(line) for line in f]
+        self.assertEqual((batch['scope'], batch['attempts'], len(batch['rows'])), ('bad', 3, 2))
+        self.assertIn({'name': 'writebehind_dead', 'labels': {'sink': 'test'}, 'value': 2},
+                      metrics.summary()['counters'])
+        writer.close()
+
+class TestCatalog(unittest.TestCase):
+    """
+    TestCatalog is a unit test class designed to test the catalog functions.
+
+    Methods:
+        test_update_catalog(): Tests that new boards and statistics are merged incrementally.
+    """
+
+    def test_update_catalog(self):
+        """
+        Tests that update_catalog keeps the listed boards, adds new ones in sorted order and
+        accumulates the per-board statistics across runs.
+        """
+        first_run = [{'platform': '微博', 'slist': '热搜榜', 'rectime': '2024-05-16 10:00:00'},
+                     {'platform': '微博', 'slist': '热搜榜', 'rectime': '2024-05-16 09:00:00'},
+                     {'platform': 'Bing', 'slist': None, 'rectime': ''}]
+        second_run = [{'platform': '微博', 'slist': '热搜榜', 'rectime': '2024-05-16 11:00:00'}]
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            directory = os.path.join(work_dir, 'Directory.txt')
+            stats_file = os.path.join(work_dir, 'Directory_stats.csv')
+            with open(directory, 'w', encoding='utf-8') as f:
+                f.write('知乎,热榜\n')
+
+            catalog.update_catalog(catalog.iter_record_chunks(first_run), directory, stats_file)
+            stats = catalog.update_catalog(catalog.iter_record_chunks(second_run), directory, stats_file)
+
+            with open(directory, encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines(), ['Bing,', '微博,热搜榜', '知乎,热榜'])
+            weibo = stats.set_index(['platform', 'slist']).loc[('微博', '热搜榜')]
+            self.assertEqual(weibo['count'], 3)
+            self.assertEqual(str(weibo['first_seen']), '2024-05-16 09:00:00')
+            self.assertEqual(str(weibo['last_seen']), '2024-05-16 11:00:00')
+
 if __name__ == '__main__':
     unittest.main()
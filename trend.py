@@ -0,0 +1,320 @@
+import heapq
+import threading
+import time
+import numpy as np
+
+class TrendEngine(object):
+    """
+    TrendEngine follows every item on the boards across successive snapshots, in process,
+    so rising and falling items can be found without scanning the hot_search table.
+
+    Every (platform, slist, title) gets a slot in numpy arrays holding a ring of its last
+    window observations (hotcount, rank, time). Each snapshot updates the rank, hotcount
+    delta, time on board and velocity (hotcount change per hour over the window) of the
+    items it contains. Items missing from more than max_missed snapshots of their board, or
+    not seen for max_age seconds, are evicted and their slots reused.
+
+    Velocities are kept in two heaps with lazy invalidation, so the top K risers or fallers
+    are found in O(K log N) instead of sorting every item.
+
+    Methods:
+        update(records, now): Adds a snapshot of one or more boards.
+        get(platform, slist, title): Returns the trend of an item.
+        top_risers(k): Returns the K items rising fastest.
+        top_fallers(k): Returns the K items falling fastest.
+        expire(now): Evicts the items not seen for max_age seconds.
+    """
+
+    def __init__(self, window=12, max_missed=1, max_age=86400):
+        """
+        Initializes an empty engine.
+
+        Args:
+            window (int): Number of observations kept per item.
+            max_missed (int): Number of consecutive snapshots of its board an item may miss
+                              before it is evicted.
+            max_age (float): Seconds without observation after which expire() evicts an item.
+        """
+        self.window = window
+        self.max_missed = max_missed
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+        self.slots = {}
+        self.keys = []
+        self.free = []
+        self.board_slots = {}
+        self.rising = []
+        self.falling = []
+        self.capacity = 0
+        self.__grow(1024)
+
+    def __grow(self, capacity):
+        """
+        Resizes the slot arrays, keeping the existing slots.
+
+        Args:
+            capacity (int): The new number of slots.
+        """
+        def resized(array, shape, dtype):
+            grown = np.zeros(shape, dtype=dtype)
+            if self.capacity:
+                grown[:self.capacity] = array
+            return grown
+
+        self.hotcounts = resized(getattr(self, 'hotcounts', None), (capacity, self.window), np.int64)
+        self.ranks = resized(getattr(self, 'ranks', None), (capacity, self.window), np.int32)
+        self.times = resized(getattr(self, 'times', None), (capacity, self.window), np.float64)
+        self.heads = resized(getattr(self, 'heads', None), capacity, np.int32)
+        self.counts = resized(getattr(self, 'counts', None), capacity, np.int32)
+        self.missed = resized(getattr(self, 'missed', None), capacity, np.int32)
+        self.first_seen = resized(getattr(self, 'first_seen', None), capacity, np.float64)
+        self.velocities = resized(getattr(self, 'velocities', None), capacity, np.float64)
+        self.versions = resized(getattr(self, 'versions', None), capacity, np.int64)
+        self.keys.extend([None] * (capacity - self.capacity))
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.slots)
+
+    def update(self, records, now=None):
+        """
+        Adds a snapshot. Records are grouped by board and ranked in their order within it,
+        as extracted from the page.
+
+        Args:
+            records (iterable): Record items (or dicts) of one or more complete boards.
+            now (float): Timestamp of the snapshot. Defaults to the current time.
+
+        Returns:
+            dict: {'updated': items observed, 'added': new items, 'evicted': dropped items}.
+        """
+        now = time.time() if now is None else now
+        boards = {}
+        for record in records:
+            boards.setdefault((record['platform'], record['slist']), []).append(record)
+
+        stats = {'updated': 0, 'added': 0, 'evicted': 0}
+        with self.lock:
+            for board, items in boards.items():
+                seen = set()
+                for rank, record in enumerate(items, 1):
+                    key = board + (record['title'],)
+                    slot = self.slots.get(key)
+                    if slot is None:
+                        slot = self.__allocate(key, now)
+                        stats['added'] += 1
+                    elif slot in seen:
+                        continue
+                    seen.add(slot)
+                    self.__observe(slot, rank, record['hotcount'] or 0, now)
+                    stats['updated'] += 1
+
+                # 本次快照中没有出现的条目
+                kept = set(seen)
+                for slot in self.board_slots.get(board, set()) - seen:
+                    self.missed[slot] += 1
+                    if self.missed[slot] > self.max_missed:
+                        self.__evict(slot)
+                        stats['evicted'] += 1
+                    else:
+                        kept.add(slot)
+                self.board_slots[board] = kept
+            self.__compact()
+        return stats
+
+    def __allocate(self, key, now):
+        """
+        Gives a new item a free slot.
+
+        Args:
+            key (tuple): (platform, slist, title) of the item.
+            now (float): Timestamp of its first observation.
+
+        Returns:
+            int: The slot.
+        """
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.slots)
+            if slot >= self.capacity:
+                self.__grow(2 * self.capacity)
+        self.slots[key] = slot
+        self.keys[slot] = key
+        self.heads[slot] = 0
+        self.counts[slot] = 0
+        self.missed[slot] = 0
+        self.first_seen[slot] = now
+        return slot
+
+    def __observe(self, slot, rank, hotcount, now):
+        """
+        Writes an observation into the ring of a slot and updates its velocity.
+
+        Args:
+            slot (int): The slot.
+            rank (int): Rank of the item on its board, from 1.
+            hotcount (int): Its hotcount.
+            now (float): Timestamp of the snapshot.
+        """
+        head = self.heads[slot]
+        self.hotcounts[slot, head] = hotcount
+        self.ranks[slot, head] = rank
+        self.times[slot, head] = now
+        self.heads[slot] = (head + 1) % self.window
+        self.counts[slot] = min(self.counts[slot] + 1, self.window)
+        self.missed[slot] = 0
+
+        # 窗口内最早一次到最近一次的每小时热度变化
+        oldest = (self.heads[slot] - self.counts[slot]) % self.window
+        elapsed = now - self.times[slot, oldest]
+        velocity = float(hotcount - self.hotcounts[slot, oldest]) * 3600 / elapsed if elapsed > 0 else 0.0
+        self.velocities[slot] = velocity
+        self.versions[slot] += 1
+
+        version = int(self.versions[slot])
+        heapq.heappush(self.rising, (-velocity, slot, version))
+        heapq.heappush(self.falling, (velocity, slot, version))
+
+    def __evict(self, slot):
+        """
+        Frees the slot of an item; its heap entries become stale.
+
+        Args:
+            slot (int): The slot.
+        """
+        del self.slots[self.keys[slot]]
+        self.keys[slot] = None
+        self.versions[slot] += 1
+        self.free.append(slot)
+
+    def __compact(self):
+        """
+        Rebuilds the heaps from the live slots once stale entries outnumber live ones,
+        which keeps the heaps O(N) in size at an amortized O(1) cost per update.
+        """
+        if len(self.rising) <= 2 * len(self.slots) + 1024:
+            return
+        live = list(self.slots.values())
+        self.rising = [(-float(self.velocities[slot]), slot, int(self.versions[slot])) for slot in live]
+        self.falling = [(float(self.velocities[slot]), slot, int(self.versions[slot])) for slot in live]
+        heapq.heapify(self.rising)
+        heapq.heapify(self.falling)
+
+    def expire(self, now=None):
+        """
+        Evicts the items not seen for max_age seconds, e.g. of boards no longer crawled.
+
+        Args:
+            now (float): The current timestamp. Defaults to the current time.
+
+        Returns:
+            int: Number of evicted items.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            live = np.fromiter(self.slots.values(), dtype=np.int64, count=len(self.slots))
+            if not len(live):
+                return 0
+            newest = self.times[live, (self.heads[live] - 1) % self.window]
+            stale = live[newest < now - self.max_age]
+            for slot in stale:
+                key = self.keys[slot]
+                self.board_slots.get(key[:2], set()).discard(int(slot))
+                self.__evict(int(slot))
+            self.__compact()
+        return len(stale)
+
+    def __trend(self, slot):
+        """
+        Describes the current trend of a slot.
+
+        Args:
+            slot (int): The slot.
+
+        Returns:
+            dict: platform, slist, title, rank, hotcount, delta and rank_change since the
+                  previous observation, velocity per hour, time_on_board in seconds, observations.
+        """
+        newest = (self.heads[slot] - 1) % self.window
+        count = int(self.counts[slot])
+        previous = (newest - 1) % self.window if count > 1 else newest
+        platform, slist, title = self.keys[slot]
+        return {
+            'platform': platform,
+            'slist': slist,
+            'title': title,
+            'rank': int(self.ranks[slot, newest]),
+            'hotcount': int(self.hotcounts[slot, newest]),
+            'delta': int(self.hotcounts[slot, newest] - self.hotcounts[slot, previous]),
+            'rank_change': int(self.ranks[slot, previous] - self.ranks[slot, newest]),
+            'velocity': float(self.velocities[slot]),
+            'time_on_board': float(self.times[slot, newest] - self.first_seen[slot]),
+            'observations': count,
+        }
+
+    def get(self, platform, slist, title):
+        """
+        Returns the trend of an item.
+
+        Args:
+            platform (str): The platform.
+            slist (str): The board name.
+            title (str): The title.
+
+        Returns:
+            dict: The trend (see top_risers), or None if the item is not followed.
+        """
+        with self.lock:
+            slot = self.slots.get((platform, slist, title))
+            return None if slot is None else self.__trend(slot)
+
+    def __top(self, heap, k):
+        """
+        Pops the K best live entries of a heap, drops the stale ones met on the way and
+        pushes the live ones back.
+
+        Args:
+            heap (list): The rising or falling heap.
+            k (int): Number of items.
+
+        Returns:
+            list: The trends of the K items.
+        """
+        popped = []
+        while heap and len(popped) < k:
+            entry = heapq.heappop(heap)
+            if self.keys[entry[1]] is not None and self.versions[entry[1]] == entry[2]:
+                popped.append(entry)
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return [self.__trend(entry[1]) for entry in popped]
+
+    def top_risers(self, k=10):
+        """
+        Returns the K items whose hotcount rises fastest over their window.
+
+        Args:
+            k (int): Number of items.
+
+        Returns:
+            list: dicts with platform, slist, title, rank, hotcount, delta, rank_change,
+                  velocity (hotcount per hour), time_on_board (seconds) and observations,
+                  fastest first.
+        """
+        with self.lock:
+            return self.__top(self.rising, k)
+
+    def top_fallers(self, k=10):
+        """
+        Returns the K items whose hotcount falls fastest over their window.
+
+        Args:
+            k (int): Number of items.
+
+        Returns:
+            list: Trend dicts as returned by top_risers(), fastest fall first.
+        """
+        with self.lock:
+            return self.__top(self.falling, k)
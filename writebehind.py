@@ -0,0 +1,390 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from extract import Record
+from metrics import REGISTRY
+from ratelimit import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+class WriteBehind(object):
+    """
+    WriteBehind decouples a storage sink from the crawl: jobs put their records into a
+    bounded buffer and return, while a background thread writes them to the sink in
+    batches, once batch_rows rows are buffered or the oldest row waited max_delay seconds.
+
+    When the buffer holds max_rows rows, put() blocks the producer until the writer catches
+    up, for at most put_timeout seconds, then moves the buffer and its records to the journal
+    described below. A batch the sink fails to write (the write function
+    returns False or raises) is appended to a local spill journal, <journal_dir>/<name>.jsonl,
+    as are the batches that follow it, so rows keep their order. The journal is replayed
+    with exponential backoff until the sink recovers, and on start-up, so no data is lost.
+    The journal counts the failed writes of each batch; a batch still failing after the
+    retry policy's last attempt is moved to a dead-letter file, <journal_dir>/<name>.dead.jsonl,
+    so the batches behind it are replayed, and can be written back by hand from there.
+
+    Every put() is kept as its own batch, with its scope (e.g. the crawled category) and the
+    time it was put, and written with one write(records, scope, crawltime) call, in the order
+    of the puts, so a sink that updates rows in place never sees an older run after a newer
+    one of the same item. The crawl time is journaled with the batch, so a replayed batch is
+    still filed under the time it was crawled, not the time it was finally written.
+
+    Methods:
+        put(records, scope, crawltime): Queues records for writing.
+        flush(timeout): Waits until the buffered records are written or spilled.
+        close(timeout): Writes what is buffered and stops the writer thread.
+        pending(): Returns the number of buffered rows and spilled batches.
+    """
+
+    def __init__(self, name, write, journal_dir='spill', max_rows=100000, batch_rows=5000, max_delay=30.0,
+                 put_timeout=60.0, retry=None, metrics=None):
+        """
+        Initializes the queue and starts its writer thread.
+
+        Args:
+            name (str): Name of the sink, used for the journal file, the metric labels and the thread.
+            write (callable): Function writing the records of one put(), called as
+                              write(records, scope, crawltime); returns True on success.
+            journal_dir (str): Directory of the spill journal.
+            max_rows (int): Number of buffered rows from which put() blocks.
+            batch_rows (int): Number of buffered rows from which a batch is written at once.
+            max_delay (float): Seconds a row may wait in the buffer before its batch is written.
+            put_timeout (float): Seconds put() waits for room before spilling the records
+                                 straight to the journal, or None to wait for ever.
+            retry (RetryPolicy): Backoff between replays of the journal, and the number of retries
+                                 of a batch before it is dead-lettered. Defaults to 10 retries
+                                 backing off from 5s up to 5 minutes.
+            metrics (Metrics): Registry receiving the batch timings and row counts. Defaults to metrics.REGISTRY.
+        """
+        self.name = name
+        self.write = write
+        self.journal_path = os.path.join(journal_dir, f"{name}.jsonl")
+        self.dead_path = os.path.join(journal_dir, f"{name}.dead.jsonl")
+        self.max_rows = max_rows
+        self.batch_rows = batch_rows
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self.retry = retry or RetryPolicy(retries=10, base_delay=5.0, max_delay=300.0)
+        self.metrics = metrics or REGISTRY
+        os.makedirs(journal_dir, exist_ok=True)
+
+        # 每次put()为一个批次(scope, crawltime, records)，按放入顺序排列；oldest为缓冲区中最早一条数据的放入时间
+        self.buffer = []
+        self.buffered = 0
+        self.oldest = None
+        self.writing = False
+        self.closing = False
+        self.condition = threading.Condition()
+
+        # 日志中的批次数、连续失败次数及下一次重放的时间
+        self.spilled = self.__count_journal()
+        self.failures = 0
+        self.retry_at = time.monotonic()
+
+        self.thread = threading.Thread(target=self.__run, name=f"writebehind-{name}", daemon=True)
+        self.thread.start()
+
+    def put(self, records, scope=None, crawltime=None):
+        """
+        Queues records for writing, blocking while the buffer is full.
+
+        Args:
+            records (iterable): Record items (or dicts with the same fields).
+            scope (str): Scope of the records, passed on to the write function.
+            crawltime (datetime): When the records were crawled, passed on to the write function.
+                                  Defaults to now.
+
+        Returns:
+            bool: True if the records were buffered, False if the buffer stayed full for
+                  put_timeout seconds and they were spilled to the journal with the buffer.
+        """
+        records = list(records)
+        if not records:
+            return True
+        crawltime = (crawltime or datetime.now()).replace(microsecond=0)
+
+        start = time.monotonic()
+        with self.condition:
+            deadline = None if self.put_timeout is None else start + self.put_timeout
+            while self.buffered >= self.max_rows and not self.closing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            self.metrics.observe('writebehind_wait_seconds', time.monotonic() - start, sink=self.name)
+
+            if self.buffered >= self.max_rows or self.closing:
+                # 缓冲区中的数据比这批更早，一并写入溢出日志以保持顺序
+                logger.warning("%s的写入队列已满，%d条数据写入溢出日志", self.name, self.buffered + len(records))
+                for batch in self.__take():
+                    self.__spill(*batch)
+                self.__spill(scope, crawltime, records)
+                self.condition.notify_all()
+                return False
+
+            self.buffer.append((scope, crawltime, records))
+            self.buffered += len(records)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.condition.notify_all()
+        return True
+
+    def pending(self):
+        """
+        Returns how much is not written yet.
+
+        Returns:
+            dict: {'buffered': rows in the buffer, 'spilled': batches in the journal}.
+        """
+        with self.condition:
+            return {'buffered': self.buffered, 'spilled': self.spilled}
+
+    def flush(self, timeout=None):
+        """
+        Writes the buffered records now and waits until they are written or spilled.
+
+        Args:
+            timeout (float): Seconds to wait at most, or None to wait until done.
+
+        Returns:
+            bool: True if the buffer was emptied in time.
+        """
+        with self.condition:
+            self.oldest = -float('inf') if self.buffered else self.oldest
+            self.condition.notify_all()
+            return self.condition.wait_for(lambda: not self.buffered and not self.writing, timeout)
+
+    def close(self, timeout=None):
+        """
+        Writes what is buffered, tries to replay the journal once more and stops the writer
+        thread. Records that could not be written stay in the journal for the next start.
+
+        Args:
+            timeout (float): Seconds to wait for the writer thread, or None to wait until done.
+        """
+        with self.condition:
+            self.closing = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def __take(self):
+        """
+        Empties the buffer. Called with the condition held.
+
+        Returns:
+            list: (scope, crawltime, records) of every buffered put(), oldest first.
+        """
+        batches = self.buffer
+        self.buffer = []
+        self.buffered = 0
+        self.oldest = None
+        return batches
+
+    def __due(self):
+        """
+        Tells whether the buffer should be written now. Called with the condition held.
+        """
+        if not self.buffered:
+            return False
+        return self.closing or self.buffered >= self.batch_rows or \
+            time.monotonic() - self.oldest >= self.max_delay
+
+    def __run(self):
+        """
+        Writer thread: waits for a batch to be due, writes it and replays the journal.
+        """
+        while True:
+            with self.condition:
+                while not self.closing and not self.__due() and \
+                        not (self.spilled and time.monotonic() >= self.retry_at):
+                    waits = []
+                    if self.buffered:
+                        waits.append(self.oldest + self.max_delay - time.monotonic())
+                    if self.spilled:
+                        waits.append(self.retry_at - time.monotonic())
+                    self.condition.wait(max(0.0, min(waits)) if waits else None)
+
+                batches = self.__take() if self.__due() else []
+                # 溢出日志中的数据总是早于缓冲区中的数据；日志非空时新批次排在日志之后
+                if self.spilled:
+                    for batch in batches:
+                        self.__spill(*batch)
+                    batches = []
+                self.writing = True
+                closing = self.closing
+                self.condition.notify_all()
+
+            if self.spilled and (closing or time.monotonic() >= self.retry_at):
+                self.__replay()
+
+            # 写入失败的批次及其后的批次插到日志最前面，早于写入期间put()溢出的数据；只有写入失败的批次记一次尝试
+            failed = 0
+            for batch in batches:
+                if failed:
+                    self.__spill(*batch, position=failed)
+                    failed += 1
+                elif not self.__write(*batch):
+                    self.__spill(*batch, position=failed, attempts=1)
+                    failed += 1
+
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+                if closing and not self.buffered:
+                    break
+        logger.info("%s的写入线程已停止，溢出日志中还有%d批数据", self.name, self.spilled)
+
+    def __write(self, scope, crawltime, records):
+        """
+        Writes one batch to the sink.
+
+        Args:
+            scope (str): Scope of the records.
+            crawltime (datetime): When the records were crawled.
+            records (list): The records.
+
+        Returns:
+            bool: True if the sink accepted the batch.
+        """
+        start = time.perf_counter()
+        try:
+            written = bool(self.write(records, scope, crawltime))
+        except Exception as e:
+            logger.error("%s写入数据时出现错误：%s", self.name, e)
+            written = False
+        self.metrics.observe('writebehind_batch_seconds', time.perf_counter() - start, sink=self.name)
+        if written:
+            self.metrics.incr('writebehind_rows', len(records), sink=self.name)
+            return True
+
+        self.failures += 1
+        self.retry_at = time.monotonic() + self.retry.delay(self.failures)
+        return False
+
+    def __spill(self, scope, crawltime, records, position=None, attempts=0):
+        """
+        Adds a batch to the spill journal as one JSON line.
+
+        Args:
+            scope (str): Scope of the records.
+            crawltime (datetime): When the records were crawled.
+            records (list): The records.
+            position (int): Line the batch is inserted at, or None to append it.
+            attempts (int): Number of times the sink already failed to write the batch.
+        """
+        rows = [[record['title'], record['link'], record['hotcount'], record['platform'], record['slist'],
+                 record['rectime'].isoformat() if isinstance(record['rectime'], datetime) else record['rectime'],
+                 record.get('story_id')]
+                for record in records]
+        line = json.dumps({'scope': scope, 'crawltime': crawltime.isoformat(), 'rows': rows, 'attempts': attempts},
+                          ensure_ascii=False)
+        with self.condition:
+            if position is None:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            else:
+                lines = self.__read_journal()
+                lines.insert(position, line + '\n')
+                self.__write_journal(lines)
+            self.spilled += 1
+        self.metrics.incr('writebehind_spilled', len(records), sink=self.name)
+
+    def __read_journal(self):
+        """
+        Reads the lines of the journal.
+
+        Returns:
+            list: The non-empty lines.
+        """
+        if not os.path.exists(self.journal_path):
+            return []
+        with open(self.journal_path, encoding='utf-8') as f:
+            return [line for line in f if line.strip()]
+
+    def __write_journal(self, lines):
+        """
+        Replaces the journal atomically.
+
+        Args:
+            lines (list): The lines to keep.
+        """
+        temp_path = f"{self.journal_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(temp_path, self.journal_path)
+
+    def __count_journal(self):
+        """
+        Counts the batches left in the journal by a previous run.
+
+        Returns:
+            int: Number of batches.
+        """
+        spilled = len(self.__read_journal())
+        if spilled:
+            logger.info("%s的溢出日志中有%d批数据待重放", self.name, spilled)
+        return spilled
+
+    def __replay(self):
+        """
+        Writes the journal to the sink, oldest batch first. Stops at the first failure and
+        keeps the batches not written yet, unless the failing batch has used up its attempts:
+        it is then moved to the dead-letter file and the replay goes on.
+        """
+        with self.condition:
+            lines = self.__read_journal()
+
+        # done为日志开头已处理(写入或转入死信文件)的行数
+        replayed = done = 0
+        for line in lines:
+            try:
+                batch = json.loads(line)
+            except ValueError:
+                logger.warning("%s的溢出日志中有无法解析的一行，已移入%s", self.name, self.dead_path)
+                self.__dead_letter(line)
+                done += 1
+                continue
+            # 旧版本写入的行没有story_id
+            records = [Record(title, link, hotcount, platform, slist,
+                              datetime.fromisoformat(rectime) if rectime else None, *story_id)
+                       for title, link, hotcount, platform, slist, rectime, *story_id in batch['rows']]
+            # 旧版本写入的日志行没有爬取时间，按重放时间处理
+            crawltime = datetime.fromisoformat(batch['crawltime']) if batch.get('crawltime') else datetime.now()
+            if self.__write(batch['scope'], crawltime.replace(microsecond=0), records):
+                replayed += 1
+                done += 1
+                continue
+
+            batch['attempts'] = batch.get('attempts', 0) + 1
+            line = json.dumps(batch, ensure_ascii=False) + '\n'
+            if batch['attempts'] <= self.retry.retries:
+                lines[done] = line
+                break
+            logger.error("%s的一批数据(%s，%d条)写入%d次均失败，已移入%s",
+                         self.name, batch['scope'], len(records), batch['attempts'], self.dead_path)
+            self.__dead_letter(line)
+            self.metrics.incr('writebehind_dead', len(records), sink=self.name)
+            done += 1
+
+        with self.condition:
+            # 重放期间put()溢出的批次追加在文件末尾，一并保留
+            appended = self.__read_journal()[len(lines):]
+            self.__write_journal(lines[done:] + appended)
+            self.spilled = len(lines) - done + len(appended)
+        if replayed:
+            self.failures = 0
+            self.metrics.incr('writebehind_replayed', replayed, sink=self.name)
+            logger.info("%s重放了%d批溢出数据，还剩%d批", self.name, replayed, self.spilled)
+
+    def __dead_letter(self, line):
+        """
+        Appends a journal line to the dead-letter file.
+
+        Args:
+            line (str): The line.
+        """
+        with open(self.dead_path, 'a', encoding='utf-8') as f:
+            f.write(line.rstrip('\n') + '\n')